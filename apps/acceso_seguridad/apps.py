@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AccesoSeguridadConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.acceso_seguridad'
+
+    def ready(self):
+        """
+        Registra los signals (sellos de versión de avisos).
+        """
+        import apps.acceso_seguridad.signals
@@ -0,0 +1,119 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+# Una fila se fecha al guardarse pero confirma un poco después (y HTTP-date
+# solo tiene segundos): Last-Modified se envía solo si el último cambio es
+# más antiguo que este margen. Mientras tanto el ETag es el validador.
+MARGEN_LAST_MODIFIED = timedelta(seconds=30)
+
+
+def _clave_version(tabla):
+    return f"tabla:version:{tabla}"
+
+
+def version_tabla(tabla):
+    """
+    Sello de versión de una tabla (ej. 'avisos'). Cambia con cada escritura;
+    es un timestamp y no un contador para que un reinicio de la caché no
+    repita sellos ya entregados como ETag.
+    (Con varios procesos gunicorn usar REDIS_URL para compartir los sellos.)
+    """
+    clave = _clave_version(tabla)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, str(time.time_ns()), None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_tabla(tabla):
+    cache.set(_clave_version(tabla), str(time.time_ns()), None)
+
+
+def invalidar_tabla_al_confirmar(tabla):
+    """Cambia el sello cuando la transacción actual confirma."""
+    transaction.on_commit(lambda: invalidar_tabla(tabla))
+
+
+class RespuestaCondicionalMixin:
+    """
+    GET condicional (ETag / Last-Modified) para list/retrieve de un ViewSet.
+
+    El ETag se calcula ANTES de la consulta principal a partir de:
+      - los sellos de versión de 'tablas_condicionales' (o lo que devuelva
+        versiones_condicionales()),
+      - la ruta completa (filtros, página) y el usuario.
+    Si el cliente ya tiene esa versión (If-None-Match / If-Modified-Since)
+    se responde 304 sin ejecutar la consulta principal ni serializar.
+
+    Con 'campo_modificacion' además se envía Last-Modified (una consulta
+    MAX() sobre ese campo, que debe estar indexado).
+
+    Los sellos se cambian desde signals (o explícitamente tras escrituras en
+    bloque, que no disparan signals) con invalidar_tabla_al_confirmar().
+    """
+    tablas_condicionales = ()
+    campo_modificacion = None
+
+    def list(self, request, *args, **kwargs):
+        return self._condicional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._condicional(super().retrieve, request, *args, **kwargs)
+
+    def versiones_condicionales(self):
+        return [version_tabla(tabla) for tabla in self.tablas_condicionales]
+
+    def ultima_modificacion(self):
+        if not self.campo_modificacion:
+            return None
+        # Sin filtros de búsqueda: MAX() sobre la tabla usa solo el índice
+        # (conservador: nunca es más antiguo que el de las filas filtradas)
+        queryset = self.get_queryset().order_by()
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        if lookup in self.kwargs:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+        return queryset.aggregate(ultima=Max(self.campo_modificacion))['ultima']
+
+    def _condicional(self, vista, request, *args, **kwargs):
+        partes = [str(v) for v in self.versiones_condicionales()]
+        partes += [str(request.user.pk), request.get_full_path()]
+        etag = quote_etag(hashlib.md5(':'.join(partes).encode('utf-8')).hexdigest())
+
+        ultima = self.ultima_modificacion()
+        last_modified = None
+        if ultima and timezone.now() - ultima > MARGEN_LAST_MODIFIED:
+            last_modified = int(ultima.timestamp())
+
+        if self._sin_cambios(request, etag, last_modified):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+
+        response = vista(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _sin_cambios(self, request, etag, last_modified):
+        # If-None-Match tiene prioridad sobre If-Modified-Since (RFC 9110)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+
+        desde = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return bool(last_modified and desde and last_modified <= desde)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:40
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acceso_seguridad', '0005_alter_aviso_estado'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nombre'), name='gin_trgm_ops'), name='usuario_nombre_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('apellido'), name='gin_trgm_ops'), name='usuario_apellido_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('correo'), name='gin_trgm_ops'), name='usuario_correo_trgm'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 from django.conf import settings
@@ -64,6 +66,14 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         ordering = ['correo']
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
+        # Índices trigram sobre UPPER(campo): la misma expresión que genera
+        # '__icontains' en PostgreSQL, así la búsqueda de clientes/ventas por
+        # nombre, apellido o correo usa el índice en vez de recorrer la tabla.
+        indexes = [
+            GinIndex(OpClass(Upper('nombre'), name='gin_trgm_ops'), name='usuario_nombre_trgm'),
+            GinIndex(OpClass(Upper('apellido'), name='gin_trgm_ops'), name='usuario_apellido_trgm'),
+            GinIndex(OpClass(Upper('correo'), name='gin_trgm_ops'), name='usuario_correo_trgm'),
+        ]
 
     def esta_bloqueado(self):
         """Verifica si el usuario está bloqueado por intentos fallidos"""
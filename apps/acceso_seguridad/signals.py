@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Aviso
+from .condicional import invalidar_tabla_al_confirmar
+
+
+@receiver(post_save, sender=Aviso)
+@receiver(post_delete, sender=Aviso)
+def invalidar_tabla_avisos(sender, instance, **kwargs):
+    """Sello 'avisos' para el GET condicional de AvisoViewSet."""
+    invalidar_tabla_al_confirmar('avisos')
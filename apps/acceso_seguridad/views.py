@@ -19,6 +19,7 @@ from rest_framework.decorators import api_view,permission_classes
 
 
 from .models import Usuario, Bitacora, Aviso
+from .condicional import RespuestaCondicionalMixin
 from .serializers import (
     UsuarioReadSerializer,
     UsuarioWriteSerializer,
@@ -360,7 +361,9 @@ def registrar_bitacora(usuario, accion, descripcion="", request=None):
         usuario=usuario, accion=accion, descripcion=descripcion, ip=ip
     )
 
-class AvisoViewSet(viewsets.ModelViewSet):
+class AvisoViewSet(RespuestaCondicionalMixin, viewsets.ModelViewSet):
+    # list/retrieve responden 304 mientras no cambie ningún aviso
+    tablas_condicionales = ('avisos',)
     queryset = Aviso.objects.all().order_by('-fecha_push')
     serializer_class = AvisoSerializer
     
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AnalisisInteligenciaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.analisis_inteligencia'
+
+    def ready(self):
+        """
+        Registra los signals (sellos de versión de predicciones).
+        """
+        import apps.analisis_inteligencia.signals
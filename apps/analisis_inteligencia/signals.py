@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.acceso_seguridad.condicional import invalidar_tabla_al_confirmar
+from .models import PrediccionVentas
+
+
+@receiver(post_save, sender=PrediccionVentas)
+@receiver(post_delete, sender=PrediccionVentas)
+def invalidar_tabla_predicciones(sender, instance, **kwargs):
+    """
+    Sello 'predicciones' para el GET condicional de PrediccionVentasViewSet.
+    (save_predictions_to_db usa bulk_create y lo cambia explícitamente.)
+    """
+    invalidar_tabla_al_confirmar('predicciones')
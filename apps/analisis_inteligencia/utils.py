@@ -10,6 +10,7 @@ from sklearn.metrics import r2_score
 
 from apps.venta_transacciones.models import Venta, DetalleVenta
 from apps.catalogo.models import Categoria
+from apps.acceso_seguridad.condicional import invalidar_tabla_al_confirmar
 from .models import PrediccionVentas
 
 # --- 1. OBTENER DATOS HISTÓRICOS ---
@@ -160,4 +161,6 @@ def save_predictions_to_db(categoria_id, df_predictions):
     
     # Guardamos todo en la BD
     PrediccionVentas.objects.bulk_create(nuevas_predicciones)
+    # bulk_create no dispara signals
+    invalidar_tabla_al_confirmar('predicciones')
     print(f"Predicciones guardadas en la BD para: {categoria.nombre}")
\ No newline at end of file
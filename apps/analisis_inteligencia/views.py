@@ -2,11 +2,14 @@ from rest_framework import viewsets, permissions
 from .models import PrediccionVentas
 from .serializers import PrediccionVentasSerializer
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.acceso_seguridad.condicional import RespuestaCondicionalMixin
 
-class PrediccionVentasViewSet(viewsets.ReadOnlyModelViewSet):
+class PrediccionVentasViewSet(RespuestaCondicionalMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint que permite ver las predicciones de ventas (CU-16).
+    Responde 304 mientras no se regeneren las predicciones ni cambien las categorías.
     """
+    tablas_condicionales = ('predicciones', 'categorias')
     queryset = PrediccionVentas.objects.all().order_by('-periodo_inicio')
     serializer_class = PrediccionVentasSerializer
     permission_classes = [permissions.IsAuthenticated] # O IsAdminRole
@@ -0,0 +1,125 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from rest_framework.response import Response
+
+from apps.acceso_seguridad.condicional import RespuestaCondicionalMixin
+from .models import EliminacionCatalogo
+
+CLAVE_VERSION = 'catalogo:version'
+CLAVE_HITS = 'catalogo:hits'
+CLAVE_MISSES = 'catalogo:misses'
+
+
+def version_catalogo():
+    """
+    Número de versión del catálogo (productos + categorías + stock).
+    Toda respuesta cacheada lleva la versión en su clave: al subirla, las
+    páginas anteriores dejan de usarse sin tener que borrarlas una por una.
+    (Con varios procesos gunicorn usar REDIS_URL para compartir la versión.)
+    Arranca en un timestamp (no en 1) para que tras reiniciar la caché no se
+    repitan versiones ya entregadas en un ETag.
+    """
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION, 1)
+    return version
+
+
+def invalidar_catalogo():
+    """Sube la versión del catálogo (atómico con incr)."""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar_catalogo_al_confirmar():
+    """Sube la versión cuando la transacción actual confirma."""
+    transaction.on_commit(invalidar_catalogo)
+
+
+def _contar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, None)
+        cache.incr(clave)
+
+
+def estadisticas_cache():
+    hits = cache.get(CLAVE_HITS, 0)
+    misses = cache.get(CLAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'version': version_catalogo(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def clave_catalogo(request, prefijo='catalogo'):
+    """Clave de caché: versión del catálogo + ruta completa (pk, página, búsqueda)."""
+    huella = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f"{prefijo}:{version_catalogo()}:{huella}"
+
+
+class CatalogoCacheMixin:
+    """
+    Read-through cache para list/retrieve de ViewSets del catálogo.
+    Los permisos se validan antes (initial()), así que la caché no los salta.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._desde_cache(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._desde_cache(super().retrieve, request, *args, **kwargs)
+
+    def _desde_cache(self, vista, request, *args, **kwargs):
+        clave = clave_catalogo(request)
+        data = cache.get(clave)
+        if data is not None:
+            _contar(CLAVE_HITS)
+            return Response(data)
+
+        _contar(CLAVE_MISSES)
+        response = vista(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(clave, response.data, getattr(settings, 'CATALOGO_CACHE_TTL', 3600))
+        return response
+
+
+class CatalogoCondicionalMixin(RespuestaCondicionalMixin):
+    """
+    GET condicional para el catálogo: el ETag usa la versión del catálogo
+    (sube también con los UPDATE de stock) y Last-Modified la última
+    fecha_actualizacion o eliminación (lápida) del tipo 'tipo_eliminacion'
+    y de los 'modelos_relacionados' cuyos datos van en la respuesta
+    (ej. categoria_nombre en cada producto).
+    """
+    campo_modificacion = 'fecha_actualizacion'
+    tipo_eliminacion = None
+    modelos_relacionados = ()
+
+    def versiones_condicionales(self):
+        return [version_catalogo()]
+
+    def ultima_modificacion(self):
+        fechas = [
+            super().ultima_modificacion(),
+            EliminacionCatalogo.objects.filter(tipo=self.tipo_eliminacion)
+            .aggregate(ultima=Max('fecha_eliminacion'))['ultima'],
+        ]
+        fechas += [
+            modelo.objects.aggregate(ultima=Max('fecha_actualizacion'))['ultima']
+            for modelo in self.modelos_relacionados
+        ]
+        fechas = [fecha for fecha in fechas if fecha]
+        return max(fechas) if fechas else None
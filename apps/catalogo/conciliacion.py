@@ -0,0 +1,137 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q, Sum, Subquery, OuterRef, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.venta_transacciones.models import DetalleVenta
+from .models import Producto, InventarioProducto, ConciliacionStock
+from .utils import case_por_producto, estado_segun_stock, notificar_cruces_umbral
+from .cache import invalidar_catalogo_al_confirmar
+
+# Los movimientos se fechan al crearse pero confirman un poco después:
+# la siguiente ejecución vuelve a revisar este margen hacia atrás.
+MARGEN_MARCA_AGUA = timedelta(minutes=5)
+
+
+def _total_por_producto(modelo):
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(producto=OuterRef('pk'))
+            .values('producto')
+            .annotate(total=Sum('cantidad'))
+            .values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def productos_a_revisar(desde=None):
+    """
+    Productos a conciliar. Con 'desde' (marca de agua) solo los que tuvieron
+    ingresos o ventas desde esa fecha.
+    """
+    productos = Producto.objects.all()
+    if desde is not None:
+        productos = productos.filter(
+            Q(id__in=InventarioProducto.objects.filter(fecha_ingreso__gte=desde).values('producto_id'))
+            | Q(id__in=DetalleVenta.objects.filter(fecha_creacion__gte=desde).values('producto_id'))
+        )
+    return productos
+
+
+def _diferencias(productos):
+    return list(
+        productos.annotate(
+            ingresado=_total_por_producto(InventarioProducto),
+            vendido=_total_por_producto(DetalleVenta),
+        )
+        .annotate(esperado=F('ingresado') - F('vendido'))
+        .exclude(stock_actual=F('esperado'))
+        .order_by('id')
+        .values('id', 'codigo_producto', 'nombre', 'stock_actual', 'ingresado', 'vendido', 'esperado')
+    )
+
+
+def calcular_diferencias(desde=None):
+    """
+    Stock esperado = ingresos (InventarioProducto) - salidas (DetalleVenta),
+    calculado en UNA consulta para todos los productos a revisar.
+    Devuelve (revisados, [diferencias]).
+    """
+    productos = productos_a_revisar(desde)
+    diferencias = _diferencias(productos)
+    for fila in diferencias:
+        fila['diferencia'] = fila['stock_actual'] - fila['esperado']
+    return productos.count(), diferencias
+
+
+def reparar_diferencias(diferencias):
+    """
+    Ajusta stock_actual al valor esperado con un único UPDATE (bloqueando en
+    orden de id). Los esperados negativos no se aplican: indican ventas sin
+    ingreso registrado y se dejan para revisión manual.
+    """
+    ids = [fila['id'] for fila in diferencias]
+    if not ids:
+        return 0
+    antes = {
+        producto_id: (stock_actual, stock_minimo)
+        for producto_id, stock_actual, stock_minimo in Producto.objects.select_for_update()
+        .filter(id__in=ids).order_by('id').values_list('id', 'stock_actual', 'stock_minimo')
+    }
+
+    # Recalcular con las filas ya bloqueadas (una venta pudo entrar entre medio)
+    ajustes = {
+        fila['id']: fila['esperado']
+        for fila in _diferencias(Producto.objects.filter(id__in=ids))
+        if fila['esperado'] >= 0
+    }
+    if not ajustes:
+        return 0
+    nuevo_stock = case_por_producto(ajustes)
+    actualizados = Producto.objects.filter(id__in=ajustes.keys()).update(
+        stock_actual=nuevo_stock,
+        estado=estado_segun_stock(nuevo_stock),
+        fecha_actualizacion=timezone.now()
+    )
+    notificar_cruces_umbral({
+        producto_id: (antes[producto_id][0], esperado, antes[producto_id][1])
+        for producto_id, esperado in ajustes.items()
+    })
+    invalidar_catalogo_al_confirmar()
+    return actualizados
+
+
+def conciliar_stock(reparar=False, completa=False):
+    """
+    Ejecuta una conciliación (incremental desde la última marca de agua, o
+    completa) y la registra en ConciliacionStock.
+    """
+    inicio = timezone.now()
+    ultima = ConciliacionStock.objects.order_by('-fecha_ejecucion').first()
+    desde = None if (completa or ultima is None) else ultima.marca_agua
+
+    with transaction.atomic():
+        revisados, diferencias = calcular_diferencias(desde)
+        reparados = reparar_diferencias(diferencias) if reparar else 0
+        registro = ConciliacionStock.objects.create(
+            fecha_ejecucion=inicio,
+            marca_agua=inicio - MARGEN_MARCA_AGUA,
+            completa=desde is None,
+            reparado=reparar,
+            productos_revisados=revisados,
+            productos_con_diferencia=len(diferencias),
+        )
+
+    return {
+        'conciliacion_id': registro.id,
+        'desde': desde,
+        'completa': registro.completa,
+        'productos_revisados': revisados,
+        'productos_con_diferencia': len(diferencias),
+        'productos_reparados': reparados,
+        'diferencias': diferencias,
+    }
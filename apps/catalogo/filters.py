@@ -0,0 +1,45 @@
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Q, Case, When, Value, FloatField
+from django.db.models.functions import Greatest
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Categoria
+
+
+class BusquedaProductoFilter(BaseFilterBackend):
+    """
+    Búsqueda de productos con ?search= ordenada por relevancia.
+
+    Coincide si el término:
+    - se parece a una palabra del nombre o la marca (trigram, tolera errores de tipeo),
+    - aparece como fragmento en el nombre, la marca o el código,
+    - se parece al nombre de la categoría.
+    Todas las condiciones usan índices GIN trigram (ver Producto.Meta.indexes),
+    así que el costo no crece con el tamaño del catálogo.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        termino = request.query_params.get(self.search_param, '').strip()
+        if not termino:
+            return queryset
+
+        categorias = Categoria.objects.filter(nombre__trigram_word_similar=termino).values('id')
+
+        queryset = queryset.filter(
+            Q(nombre__trigram_word_similar=termino)
+            | Q(marca__trigram_word_similar=termino)
+            | Q(nombre__icontains=termino)
+            | Q(marca__icontains=termino)
+            | Q(codigo_producto__icontains=termino)
+            | Q(categoria__in=categorias)
+        )
+
+        relevancia = Greatest(
+            # Un código exacto siempre va primero
+            Case(When(codigo_producto__iexact=termino, then=Value(2.0)), default=Value(0.0), output_field=FloatField()),
+            TrigramWordSimilarity(termino, 'nombre'),
+            TrigramWordSimilarity(termino, 'marca'),
+            TrigramWordSimilarity(termino, 'categoria__nombre') * Value(0.5),
+        )
+        return queryset.annotate(relevancia=relevancia).order_by('-relevancia', 'id')
@@ -0,0 +1,189 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import URLValidator
+from django.db.models.functions import Upper
+
+from apps.acceso_seguridad.condicional import invalidar_tabla_al_confirmar
+from .models import Producto, Categoria
+from .cache import invalidar_catalogo_al_confirmar
+
+# Filas por consulta de validación y por INSERT ... ON CONFLICT
+TAMANO_LOTE = 1000
+
+# Columnas que se pueden importar. stock_actual NO: el stock cambia con
+# ingresos, ventas y ajustes registrados en el log (ver conciliacion.py).
+CAMPOS_TEXTO = {'nombre': 150, 'descripcion': None, 'marca': 100, 'imagen_url': 500}
+CAMPOS_DECIMALES = ('precio_venta', 'precio_compra')
+CAMPOS_ENTEROS = ('ano_garantia', 'stock_minimo')
+CAMPOS_ACTUALIZABLES = [
+    'nombre', 'descripcion', 'precio_venta', 'precio_compra', 'imagen_url', 'estado',
+    'ano_garantia', 'stock_minimo', 'categoria', 'marca', 'fecha_actualizacion',
+]
+
+_validar_url = URLValidator()
+
+
+def _vacio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def _mapa_categorias(filas):
+    """{NOMBRE EN MAYÚSCULAS: categoria_id} con UNA consulta para todo el archivo."""
+    nombres = {
+        str(fila['categoria']).strip().upper()
+        for fila in filas
+        if isinstance(fila, dict) and not _vacio(fila.get('categoria'))
+    }
+    return {
+        nombre_upper: categoria_id
+        for categoria_id, nombre_upper in Categoria.objects.annotate(nombre_upper=Upper('nombre'))
+        .filter(nombre_upper__in=nombres).values_list('id', 'nombre_upper')
+    }
+
+
+def _validar_fila(fila, existente, categorias):
+    """
+    Combina la fila con los valores actuales del producto (si existe) y la
+    valida. Las celdas vacías no cambian el valor actual.
+    Devuelve (valores, errores).
+    """
+    valores = dict(existente) if existente else {}
+    errores = []
+
+    for campo, largo in CAMPOS_TEXTO.items():
+        if not _vacio(fila.get(campo)):
+            valor = str(fila[campo]).strip()
+            if largo and len(valor) > largo:
+                errores.append(f"'{campo}' supera los {largo} caracteres.")
+            valores[campo] = valor
+    if valores.get('imagen_url'):
+        try:
+            _validar_url(valores['imagen_url'])
+        except DjangoValidationError:
+            errores.append("'imagen_url' no es una URL válida.")
+
+    for campo in CAMPOS_DECIMALES:
+        if not _vacio(fila.get(campo)):
+            try:
+                valor = Decimal(str(fila[campo]).strip().replace(',', '.'))
+                if not valor.is_finite() or valor < 0 or valor >= Decimal('1e8'):
+                    raise InvalidOperation
+                valores[campo] = valor.quantize(Decimal('0.01'))
+            except InvalidOperation:
+                errores.append(f"'{campo}' debe ser un número entre 0 y 99999999.99.")
+
+    for campo in CAMPOS_ENTEROS:
+        if not _vacio(fila.get(campo)):
+            try:
+                valor = int(str(fila[campo]).strip())
+                if valor < 0:
+                    raise ValueError
+                valores[campo] = valor
+            except ValueError:
+                errores.append(f"'{campo}' debe ser un entero mayor o igual a 0.")
+
+    if not _vacio(fila.get('estado')):
+        estados = {estado.upper(): estado for estado in Producto.EstadoProducto.values}
+        estado = estados.get(str(fila['estado']).strip().upper())
+        if estado is None:
+            errores.append(f"Estado '{fila['estado']}' inválido. Use: {', '.join(Producto.EstadoProducto.values)}.")
+        valores['estado'] = estado
+
+    if not _vacio(fila.get('categoria')):
+        categoria_id = categorias.get(str(fila['categoria']).strip().upper())
+        if categoria_id is None:
+            errores.append(f"Categoría '{fila['categoria']}' no existe.")
+        else:
+            valores['categoria_id'] = categoria_id
+    elif existente is None:
+        errores.append("'categoria' es obligatoria para un producto nuevo.")
+
+    if existente is None and not valores.get('nombre'):
+        errores.append("'nombre' es obligatorio para un producto nuevo.")
+
+    return valores, errores
+
+
+def validar_filas_productos(filas):
+    """
+    Valida un archivo de productos ANTES de escribir nada, por lotes de
+    TAMANO_LOTE filas (una consulta de productos existentes por lote y una
+    sola de categorías para todo el archivo).
+
+    Devuelve (productos, resultados, errores):
+      productos  = [Producto] listos para el upsert,
+      resultados = [{'fila', 'codigo_producto', 'resultado': 'creado'|'actualizado'}],
+      errores    = [{'fila', 'codigo_producto', 'errores': [...]}] (fila empieza en 1).
+    """
+    categorias = _mapa_categorias(filas)
+    campos_existentes = [
+        'id', 'codigo_producto', 'nombre', 'descripcion', 'precio_venta', 'precio_compra', 'imagen_url',
+        'estado', 'ano_garantia', 'stock_minimo', 'categoria_id', 'marca',
+    ]
+
+    productos, resultados, errores = [], [], []
+    vistos = set()
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        lote = list(enumerate(filas[inicio:inicio + TAMANO_LOTE], start=inicio + 1))
+        codigos = {
+            str(fila['codigo_producto']).strip()
+            for _, fila in lote
+            if isinstance(fila, dict) and not _vacio(fila.get('codigo_producto'))
+        }
+        existentes = {
+            valores['codigo_producto']: valores
+            for valores in Producto.objects.filter(codigo_producto__in=codigos).values(*campos_existentes)
+        }
+
+        for numero, fila in lote:
+            if not isinstance(fila, dict):
+                errores.append({'fila': numero, 'codigo_producto': None, 'errores': ['Formato de fila inválido.']})
+                continue
+
+            codigo = None if _vacio(fila.get('codigo_producto')) else str(fila['codigo_producto']).strip()
+            if codigo is None or len(codigo) > 50:
+                errores.append({'fila': numero, 'codigo_producto': codigo,
+                                'errores': ["'codigo_producto' es obligatorio (máx. 50 caracteres)."]})
+                continue
+            if codigo in vistos:
+                errores.append({'fila': numero, 'codigo_producto': codigo,
+                                'errores': ['Código repetido en el archivo.']})
+                continue
+            vistos.add(codigo)
+
+            existente = existentes.get(codigo)
+            valores, mensajes = _validar_fila(fila, existente, categorias)
+            if mensajes:
+                errores.append({'fila': numero, 'codigo_producto': codigo, 'errores': mensajes})
+                continue
+
+            valores.pop('id', None)
+            valores['codigo_producto'] = codigo
+            productos.append(Producto(**valores))
+            resultados.append({
+                'fila': numero,
+                'codigo_producto': codigo,
+                'resultado': 'actualizado' if existente else 'creado',
+            })
+
+    return productos, resultados, errores
+
+
+def upsert_productos(productos):
+    """
+    Inserta o actualiza los productos validados con INSERT ... ON CONFLICT
+    (codigo_producto) DO UPDATE, por lotes (debe llamarse dentro de una
+    transacción). No toca stock_actual ni fecha_creacion de los existentes.
+    """
+    Producto.objects.bulk_create(
+        productos,
+        batch_size=TAMANO_LOTE,
+        update_conflicts=True,
+        unique_fields=['codigo_producto'],
+        update_fields=CAMPOS_ACTUALIZABLES,
+    )
+    # bulk_create no dispara signals
+    invalidar_catalogo_al_confirmar()
+    invalidar_tabla_al_confirmar('productos')
+    return len(productos)
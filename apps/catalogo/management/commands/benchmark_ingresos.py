@@ -0,0 +1,59 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.catalogo.models import Categoria, Producto, Inventario, InventarioProducto
+from apps.catalogo.utils import validar_filas_ingreso, registrar_ingresos_lote
+
+
+class Command(BaseCommand):
+    help = 'Mide filas/segundo al registrar ingresos: uno por uno (flujo anterior) vs endpoint por lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=500, help='Ingresos a registrar')
+        parser.add_argument('--productos', type=int, default=100, help='Productos distintos en la entrega')
+
+    def handle(self, *args, **options):
+        marca = int(time.time())
+        categoria = Categoria.objects.create(nombre=f'__benchmark_{marca}__')
+        inventario = Inventario.objects.create(codigo=f'BENCH-{marca}')
+        productos = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'BENCH-{marca}-{i}', nombre=f'Producto benchmark {i}', categoria=categoria)
+            for i in range(options['productos'])
+        ])
+        filas = [
+            {'inventario': inventario.id, 'producto': random.choice(productos).id, 'cantidad': random.randint(1, 20)}
+            for _ in range(options['filas'])
+        ]
+
+        try:
+            # 1. Flujo anterior: una transacción + SELECT FOR UPDATE + save por fila
+            inicio = time.perf_counter()
+            for fila in filas:
+                with transaction.atomic():
+                    InventarioProducto.objects.create(
+                        inventario_id=fila['inventario'], producto_id=fila['producto'], cantidad=fila['cantidad']
+                    )
+                    producto = Producto.objects.select_for_update().get(pk=fila['producto'])
+                    producto.stock_actual += fila['cantidad']
+                    producto.save()
+            self._reportar('uno por uno', len(filas), time.perf_counter() - inicio)
+
+            # 2. Lote: validación en bloque + bulk_create + un UPDATE agregado
+            inicio = time.perf_counter()
+            validas, errores = validar_filas_ingreso(filas)
+            with transaction.atomic():
+                registrar_ingresos_lote(validas)
+            self._reportar('lote', len(validas), time.perf_counter() - inicio)
+        finally:
+            InventarioProducto.objects.filter(inventario=inventario).delete()
+            Producto.objects.filter(id__in=[p.id for p in productos]).delete()
+            inventario.delete()
+            categoria.delete()
+
+    def _reportar(self, nombre, filas, duracion):
+        self.stdout.write(self.style.SUCCESS(
+            f"[{nombre}] {filas} ingresos en {duracion:.2f}s -> {filas / duracion:.1f} filas/s"
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.catalogo.conciliacion import conciliar_stock
+
+
+class Command(BaseCommand):
+    help = 'Concilia Producto.stock_actual contra ingresos (InventarioProducto) y ventas (DetalleVenta)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparar', action='store_true', help='Ajusta el stock al valor esperado')
+        parser.add_argument('--completa', action='store_true', help='Revisa todos los productos (ignora la marca de agua)')
+
+    def handle(self, *args, **options):
+        resultado = conciliar_stock(reparar=options['reparar'], completa=options['completa'])
+
+        desde = resultado['desde'] or 'inicio'
+        self.stdout.write(self.style.NOTICE(
+            f"Revisados {resultado['productos_revisados']} productos (movimientos desde {desde})."
+        ))
+        for fila in resultado['diferencias']:
+            self.stdout.write(self.style.WARNING(
+                f"  {fila['codigo_producto']} - {fila['nombre']}: stock {fila['stock_actual']}, "
+                f"esperado {fila['esperado']} (diferencia {fila['diferencia']:+d})"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['productos_con_diferencia']} con diferencia, {resultado['productos_reparados']} reparados."
+        ))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0011_busqueda_trigram'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventarioproducto',
+            name='fecha_ingreso',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='ConciliacionStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_ejecucion', models.DateTimeField(default=django.utils.timezone.now)),
+                ('marca_agua', models.DateTimeField()),
+                ('completa', models.BooleanField(default=False)),
+                ('reparado', models.BooleanField(default=False)),
+                ('productos_revisados', models.PositiveIntegerField(default=0)),
+                ('productos_con_diferencia', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Conciliación de Stock',
+                'verbose_name_plural': 'Conciliaciones de Stock',
+                'ordering': ['-fecha_ejecucion'],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0013_sincronizacion_catalogo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock_minimo',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('stock_actual__lte', models.F('stock_minimo'))), fields=['stock_actual'], name='producto_stock_bajo'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:01
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0014_producto_stock_minimo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('marca'), name='gin_trgm_ops'), name='producto_marca_upper_trgm'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0015_producto_marca_upper_trgm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventarioproducto',
+            name='cantidad',
+            field=models.IntegerField(default=0),
+        ),
+    ]
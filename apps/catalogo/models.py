@@ -1,5 +1,7 @@
 from apps.acceso_seguridad.models import Usuario
 from django.db import models
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from decimal import Decimal
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -25,11 +27,16 @@ class Categoria(models.Model):
     
     # CAMPO AÑADIDO: Requerido por el script SQL
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Cursor de la sincronización incremental (ver sincronizacion.py)
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['id']
         verbose_name = 'Categoría'
         verbose_name_plural = 'Categorías'
+        indexes = [
+            GinIndex(fields=['nombre'], opclasses=['gin_trgm_ops'], name='categoria_nombre_trgm'),
+        ]
         
     def __str__(self):
         return self.nombre
@@ -67,6 +74,8 @@ class Producto(models.Model):
     )
     
     stock_actual = models.PositiveIntegerField(default=0)
+    # Umbral de reposición: con stock_actual <= stock_minimo el producto entra en la lista de stock bajo
+    stock_minimo = models.PositiveIntegerField(default=0)
     ano_garantia = models.PositiveIntegerField(default=0) # Mantenemos tu campo
     
     # CORRECCIÓN: El script SQL usa RESTRICT para evitar borrar categorías con productos 
@@ -75,11 +84,29 @@ class Producto(models.Model):
     # CAMPOS AÑADIDOS: Requeridos por el script SQL
     marca = models.CharField(max_length=100, blank=True, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Los UPDATE en bloque (stock) la actualizan explícitamente: auto_now solo aplica en save()
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['id']
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
+        # Índices para la búsqueda de productos (ver filters.BusquedaProductoFilter):
+        # - trigram sobre la columna: similitud por palabra (tolera errores de tipeo)
+        # - trigram sobre UPPER(columna): búsquedas '__icontains' por fragmento
+        indexes = [
+            GinIndex(fields=['nombre'], opclasses=['gin_trgm_ops'], name='producto_nombre_trgm'),
+            GinIndex(fields=['marca'], opclasses=['gin_trgm_ops'], name='producto_marca_trgm'),
+            GinIndex(OpClass(Upper('nombre'), name='gin_trgm_ops'), name='producto_nombre_upper_trgm'),
+            GinIndex(OpClass(Upper('codigo_producto'), name='gin_trgm_ops'), name='producto_codigo_upper_trgm'),
+            GinIndex(OpClass(Upper('marca'), name='gin_trgm_ops'), name='producto_marca_upper_trgm'),
+            # Índice parcial: solo contiene los productos con stock bajo (lista de reposición)
+            models.Index(
+                fields=['stock_actual'],
+                condition=models.Q(stock_actual__lte=models.F('stock_minimo')),
+                name='producto_stock_bajo'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.nombre} - {self.codigo_producto}"
@@ -110,8 +137,9 @@ class Inventario(models.Model):
 class InventarioProducto(models.Model):
     inventario = models.ForeignKey(Inventario, on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
-    cantidad = models.PositiveIntegerField(default=0) # [cite: 957]
-    fecha_ingreso = models.DateTimeField(default=timezone.now) # [cite: 958]
+    # Negativa solo en los ajustes manuales de stock (almacén AJUSTE-STOCK)
+    cantidad = models.IntegerField(default=0) # [cite: 957]
+    fecha_ingreso = models.DateTimeField(default=timezone.now, db_index=True) # [cite: 958]
 
     class Meta:
         # CORRECCIÓN: Se eliminó 'unique_together'
@@ -122,3 +150,50 @@ class InventarioProducto(models.Model):
     def __str__(self):
         return f"Ingreso: {self.producto.nombre} (+{self.cantidad}) en {self.inventario.codigo} el {self.fecha_ingreso.strftime('%Y-%m-%d')}"
 
+
+
+# --- Conciliación de stock ---
+class ConciliacionStock(models.Model):
+    """
+    Registro de cada conciliación de stock (stock_actual vs ingresos - ventas).
+    'marca_agua' indica desde cuándo revisar movimientos en la siguiente
+    ejecución incremental.
+    """
+    fecha_ejecucion = models.DateTimeField(default=timezone.now)
+    marca_agua = models.DateTimeField()
+    completa = models.BooleanField(default=False)
+    reparado = models.BooleanField(default=False)
+
+    productos_revisados = models.PositiveIntegerField(default=0)
+    productos_con_diferencia = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-fecha_ejecucion']
+        verbose_name = 'Conciliación de Stock'
+        verbose_name_plural = 'Conciliaciones de Stock'
+
+    def __str__(self):
+        return f"Conciliación {self.fecha_ejecucion:%Y-%m-%d %H:%M} ({self.productos_con_diferencia} diferencias)"
+
+
+# --- Sincronización del catálogo ---
+class EliminacionCatalogo(models.Model):
+    """
+    Lápida de un producto o categoría borrado: permite a los clientes que
+    sincronizan por cursor enterarse de las eliminaciones.
+    """
+    class TipoObjeto(models.TextChoices):
+        PRODUCTO = 'producto', 'Producto'
+        CATEGORIA = 'categoria', 'Categoría'
+
+    tipo = models.CharField(max_length=20, choices=TipoObjeto.choices)
+    objeto_id = models.BigIntegerField()
+    fecha_eliminacion = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['fecha_eliminacion']
+        verbose_name = 'Eliminación del Catálogo'
+        verbose_name_plural = 'Eliminaciones del Catálogo'
+
+    def __str__(self):
+        return f"{self.tipo} #{self.objeto_id} eliminado el {self.fecha_eliminacion:%Y-%m-%d %H:%M}"
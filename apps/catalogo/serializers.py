@@ -116,15 +116,17 @@ class CategoriaSerializer(serializers.ModelSerializer):
         model = Categoria
         fields = [
             "id", "nombre", "estado", 
-            "fecha_creacion"
+            "fecha_creacion", "fecha_actualizacion"
         ]
-        read_only_fields = ["fecha_creacion"]
+        read_only_fields = ["fecha_creacion", "fecha_actualizacion"]
         
 class ProductoSerializer(serializers.ModelSerializer):
     """
     Serializador para el modelo Producto (CU-08).
     Añadidos campos faltantes del modelo y 'fecha_creacion' como solo lectura.
     Corregido 'año_garantia' a 'ano_garantia'.
+    Un stock_actual fijado a mano queda registrado como ajuste en el log de
+    ingresos (ver ProductoViewSet), así la conciliación no lo revierte.
     """
     categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
     
@@ -132,11 +134,12 @@ class ProductoSerializer(serializers.ModelSerializer):
         model = Producto
         fields = [
             "id", "codigo_producto", "nombre", "descripcion", "precio_venta",
-            "precio_compra", "imagen_url", "estado", "stock_actual", 
+            "precio_compra", "imagen_url", "estado", "stock_actual", "stock_minimo",
             "ano_garantia",
-            "categoria", "categoria_nombre", "marca", "fecha_creacion"
+            "categoria", "categoria_nombre", "marca", "fecha_creacion",
+            "fecha_actualizacion"
         ]
-        read_only_fields = ["fecha_creacion", "categoria_nombre"]
+        read_only_fields = ["fecha_creacion", "fecha_actualizacion", "categoria_nombre"]
 
 class InventarioProductoSerializer(serializers.ModelSerializer):
     """
@@ -150,6 +153,8 @@ class InventarioProductoSerializer(serializers.ModelSerializer):
     )
     
     inventario_codigo = serializers.CharField(source='inventario.codigo', read_only=True)
+    # El modelo admite negativos (ajustes de stock); un ingreso no
+    cantidad = serializers.IntegerField(min_value=0, required=False)
 
     class Meta:
         model = InventarioProducto
@@ -182,5 +187,29 @@ class InventarioSerializer(serializers.ModelSerializer):
     def get_productos(self, obj) -> list:
         # Devuelve el LOG de entradas de inventario para este almacén,
         # lo cual es correcto según el nuevo modelo 'InventarioProducto'.
-        inventario_productos = InventarioProducto.objects.filter(inventario=obj)
-        return InventarioProductoSerializer(inventario_productos, many=True).data
\ No newline at end of file
+        # Usa el prefetch 'ingresos' del ViewSet (una sola consulta para todos).
+        inventario_productos = getattr(obj, 'ingresos', None)
+        if inventario_productos is None:
+            inventario_productos = InventarioProducto.objects.filter(inventario=obj).select_related('producto__categoria')
+        return InventarioProductoSerializer(inventario_productos, many=True).data
+
+class InventarioResumenSerializer(serializers.ModelSerializer):
+    """
+    Vista compacta de un almacén (?vista=resumen): por cada producto, el total
+    ingresado y la fecha del último ingreso, calculados en la base de datos.
+    """
+    productos = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Inventario
+        fields = [
+            "id",
+            "codigo",
+            "estado",
+            "fecha_creacion",
+            "productos"
+        ]
+        read_only_fields = fields
+
+    def get_productos(self, obj) -> list:
+        return getattr(obj, 'resumen_productos', [])
@@ -1,7 +1,19 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+import logging
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
 from apps.acceso_seguridad.models import Usuario
-from .models import Cliente
+from .models import Cliente, Producto, Categoria, EliminacionCatalogo
+from apps.acceso_seguridad.condicional import invalidar_tabla_al_confirmar
+from .cache import invalidar_catalogo_al_confirmar
+
+# Se emite (al confirmar la transacción) cuando una venta o un ingreso hace
+# que productos crucen su stock_minimo. Argumentos:
+#   bajo_minimo: [producto_id] que pasaron a stock_actual <= stock_minimo
+#   repuestos:   [producto_id] que volvieron a quedar por encima del mínimo
+stock_umbral_cruzado = Signal()
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Usuario)
@@ -19,3 +31,45 @@ def crear_perfil_cliente(sender, instance, created, **kwargs):
         if not hasattr(instance, 'cliente'):
             Cliente.objects.create(usuario=instance)
             print(f"✓ Perfil de Cliente creado automáticamente para: {instance.correo}")
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_cache_catalogo(sender, instance, **kwargs):
+    """
+    Cualquier escritura en Producto o Categoria sube la versión del catálogo.
+    (Los UPDATE en bloque de stock llaman a invalidar_catalogo_al_confirmar directamente.)
+    """
+    invalidar_catalogo_al_confirmar()
+
+
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=Categoria)
+def registrar_eliminacion_catalogo(sender, instance, **kwargs):
+    """Deja una lápida para que la sincronización incremental informe el borrado."""
+    tipo = EliminacionCatalogo.TipoObjeto.PRODUCTO if sender is Producto else EliminacionCatalogo.TipoObjeto.CATEGORIA
+    EliminacionCatalogo.objects.create(tipo=tipo, objeto_id=instance.pk)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_tabla_catalogo(sender, instance, **kwargs):
+    """
+    Sello 'productos' / 'categorias' para los GET condicionales de otras apps
+    (ventas muestran nombres de producto, predicciones de categoría). A
+    diferencia de la versión del catálogo, no cambia con los UPDATE de stock.
+    """
+    invalidar_tabla_al_confirmar('productos' if sender is Producto else 'categorias')
+
+
+@receiver(stock_umbral_cruzado)
+def avisar_stock_bajo(sender, bajo_minimo, repuestos, **kwargs):
+    """Registro en el log; otros módulos pueden conectarse a la misma señal."""
+    if bajo_minimo:
+        logger.warning("Productos bajo su stock mínimo: %s", bajo_minimo)
+    if repuestos:
+        logger.info("Productos repuestos sobre su stock mínimo: %s", repuestos)
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Producto, Categoria, EliminacionCatalogo
+
+# Una fila se fecha al guardarse pero puede confirmar un poco después: el
+# siguiente cursor retrocede este margen para no perderla (el cliente
+# puede recibir alguna fila repetida; aplicar los cambios es idempotente).
+MARGEN_CURSOR = timedelta(seconds=30)
+
+
+def cambios_catalogo(desde=None):
+    """
+    Cambios del catálogo posteriores al cursor 'desde' (datetime):
+    productos y categorías creados o modificados (incluye desactivados:
+    Producto.estado=Descontinuado / Categoria.estado=False) y lápidas de
+    los eliminados. Sin cursor devuelve el catálogo completo.
+
+    Devuelve (productos_qs, categorias_qs, eliminados, siguiente_cursor).
+    """
+    inicio = timezone.now()
+    productos = Producto.objects.select_related('categoria').order_by('fecha_actualizacion', 'id')
+    categorias = Categoria.objects.order_by('fecha_actualizacion', 'id')
+    eliminados = {'productos': [], 'categorias': []}
+
+    if desde is not None:
+        productos = productos.filter(fecha_actualizacion__gt=desde)
+        categorias = categorias.filter(fecha_actualizacion__gt=desde)
+        for tipo, objeto_id in EliminacionCatalogo.objects.filter(
+            fecha_eliminacion__gt=desde
+        ).values_list('tipo', 'objeto_id'):
+            clave = 'productos' if tipo == EliminacionCatalogo.TipoObjeto.PRODUCTO else 'categorias'
+            eliminados[clave].append(objeto_id)
+
+    siguiente = inicio - MARGEN_CURSOR
+    if desde is not None and desde > siguiente:
+        siguiente = desde
+    return productos, categorias, eliminados, siguiente
@@ -1,3 +1,503 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.acceso_seguridad.models import Usuario
+from .conciliacion import conciliar_stock
+from .models import Categoria, Producto, Inventario, InventarioProducto, ConciliacionStock
+from .signals import stock_umbral_cruzado
+from .serializers import ProductoSerializer
+from .utils import reservar_stock, incrementar_stock, INVENTARIO_AJUSTES
+from .views import ProductoViewSet
+
+
+class CatalogoCondicionalTests(TestCase):
+    """GET condicional de productos: 304 mientras nada cambie, 200 si cambia."""
+    url = '/api/productos/'
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nombre='Audio')
+        self.producto = Producto.objects.create(
+            codigo_producto='A-1', nombre='Parlante', precio_venta=50, stock_actual=10, categoria=self.categoria
+        )
+        # Cambios antiguos (fuera de MARGEN_LAST_MODIFIED): se envía Last-Modified
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        Categoria.objects.update(fecha_actualizacion=hace_una_hora)
+        Producto.objects.update(fecha_actualizacion=hace_una_hora)
+
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='lector@test.com', password='x', rol='CLIENTE'))
+
+    def test_etag_304_y_200_tras_un_cambio(self):
+        primera = self.api.get(self.url)
+        self.assertEqual(primera.status_code, 200)
+        etag = primera['ETag']
+
+        self.assertEqual(self.api.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.precio_venta = 60
+            self.producto.save()
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['precio_venta'], '60.00')
+
+    def test_last_modified_incluye_la_categoria(self):
+        primera = self.api.get(self.url)
+        last_modified = primera['Last-Modified']
+        self.assertEqual(self.api.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # Renombrar la categoría cambia 'categoria_nombre' de cada producto
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.nombre = 'Sonido'
+            self.categoria.save()
+        response = self.api.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['categoria_nombre'], 'Sonido')
+
+
+class CatalogoCacheTests(TestCase):
+    """Read-through cache del catálogo: acierta mientras nada cambie."""
+    url = '/api/productos/'
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nombre='Video')
+        self.producto = Producto.objects.create(
+            codigo_producto='V-1', nombre='Proyector', precio_venta=300, stock_actual=4, categoria=self.categoria
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='catalogo@test.com', password='x', rol='ADMIN'))
+
+    def _contadores(self):
+        response = self.api.get(f'{self.url}cache-stats/')
+        return response.data['hits'], response.data['misses']
+
+    def test_acierto_y_fallo(self):
+        self.assertEqual(self.api.get(self.url).status_code, 200)
+        self.assertEqual(self._contadores(), (0, 1))
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.api.get(self.url)
+        self.assertEqual(response.data[0]['nombre'], 'Proyector')
+        # Solo las consultas del GET condicional (MAX de fechas), no el listado
+        self.assertFalse([q for q in consultas.captured_queries if '"catalogo_producto"."nombre"' in q['sql']])
+        self.assertEqual(self._contadores(), (1, 1))
+
+    def test_escribir_producto_o_categoria_invalida(self):
+        self.api.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.patch(f'{self.url}{self.producto.id}/', {'nombre': 'Proyector HD'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.api.get(self.url).data[0]['nombre'], 'Proyector HD')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.nombre = 'Imagen'
+            self.categoria.save()
+        self.assertEqual(self.api.get(self.url).data[0]['categoria_nombre'], 'Imagen')
+        self.assertEqual(self._contadores(), (0, 3))
+
+
+class BusquedaProductoTests(TestCase):
+    """?search= ordena por relevancia y tolera errores de tipeo (requiere pg_trgm)."""
+    url = '/api/productos/'
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('La extensión pg_trgm no está instalada')
+        cache.clear()
+        audio = Categoria.objects.create(nombre='Audífonos')
+        hogar = Categoria.objects.create(nombre='Hogar')
+        Producto.objects.bulk_create([
+            Producto(codigo_producto='AUR-1', nombre='Auricular inalámbrico', marca='Sonora', precio_venta=10, categoria=audio),
+            Producto(codigo_producto='PAR-1', nombre='Parlante portátil', marca='Sonora', precio_venta=10, categoria=audio),
+            Producto(codigo_producto='LIC-1', nombre='Licuadora', marca='Casamix', precio_venta=10, categoria=hogar),
+            Producto(codigo_producto='SONORA', nombre='Lámpara', marca='Lumen', precio_venta=10, categoria=hogar),
+        ])
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='busca@test.com', password='x', rol='CLIENTE'))
+
+    def _buscar(self, termino):
+        response = self.api.get(self.url, {'search': termino})
+        self.assertEqual(response.status_code, 200)
+        return [producto['codigo_producto'] for producto in response.data]
+
+    def test_tolera_errores_de_tipeo(self):
+        self.assertEqual(self._buscar('licuadra'), ['LIC-1'])
+        self.assertEqual(self._buscar('auriclar')[0], 'AUR-1')
+
+    def test_codigo_exacto_va_primero(self):
+        # 'SONORA' es el código de la lámpara y la marca de otros dos productos
+        self.assertEqual(self._buscar('sonora'), ['SONORA', 'AUR-1', 'PAR-1'])
+
+    def test_fragmento_de_marca(self):
+        self.assertEqual(self._buscar('amix'), ['LIC-1'])
+
+
+class StockUmbralTests(TestCase):
+    """Ventas e ingresos avisan (al confirmar) solo cuando se cruza stock_minimo."""
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Umbral')
+        self.producto = Producto.objects.create(
+            codigo_producto='U-1', nombre='Lámpara', precio_venta=10, stock_actual=5, stock_minimo=2, categoria=categoria
+        )
+        self.avisos = []
+        stock_umbral_cruzado.connect(self._recibir)
+        self.addCleanup(stock_umbral_cruzado.disconnect, self._recibir)
+
+    def _recibir(self, sender, bajo_minimo, repuestos, **kwargs):
+        self.avisos.append((bajo_minimo, repuestos))
+
+    def test_sin_cruce_no_avisa(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_stock([(self.producto.id, 2)])
+        self.assertEqual(self.avisos, [])
+
+    def test_cruce_hacia_abajo_y_reposicion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_stock([(self.producto.id, 5)])
+        self.assertEqual(self.avisos, [([self.producto.id], [])])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.estado, Producto.EstadoProducto.AGOTADO)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            incrementar_stock({self.producto.id: 4})
+        self.assertEqual(self.avisos[-1], ([], [self.producto.id]))
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock_actual, self.producto.estado), (4, Producto.EstadoProducto.DISPONIBLE))
+
+    def test_sin_confirmar_no_avisa(self):
+        # Si la venta no confirma (rollback) nadie recibe el aviso
+        with self.captureOnCommitCallbacks(execute=False):
+            reservar_stock([(self.producto.id, 4)])
+        self.assertEqual(self.avisos, [])
+
+
+class ConciliacionStockTests(TestCase):
+    """Detectar informa sin tocar el stock; reparar lo lleva a ingresos - ventas."""
+
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='Conciliación')
+        self.producto = Producto.objects.create(
+            codigo_producto='C-1', nombre='Taladro', precio_venta=80, categoria=categoria
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='admin@test.com', password='x', rol='ADMIN'))
+        inventario = Inventario.objects.create(codigo='ING-1')
+        response = self.api.post('/api/inventario-productos/', {
+            'inventario': inventario.id, 'producto_id': self.producto.id, 'cantidad': 10
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def _stock(self):
+        self.producto.refresh_from_db()
+        return self.producto.stock_actual
+
+    def test_detectar_no_modifica_el_stock(self):
+        Producto.objects.filter(id=self.producto.id).update(stock_actual=7)
+        response = self.api.get('/api/productos/conciliacion/?completa=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['productos_con_diferencia'], 1)
+        self.assertEqual(response.data['diferencias'][0]['diferencia'], -3)
+        self.assertEqual(self._stock(), 7)
+
+    def test_reparar_aplica_el_stock_esperado(self):
+        Producto.objects.filter(id=self.producto.id).update(stock_actual=7)
+        resultado = conciliar_stock(reparar=True, completa=True)
+        self.assertEqual(resultado['productos_reparados'], 1)
+        self.assertEqual(self._stock(), 10)
+        self.assertTrue(ConciliacionStock.objects.get(id=resultado['conciliacion_id']).reparado)
+
+    def test_post_con_reparar_false_no_repara(self):
+        Producto.objects.filter(id=self.producto.id).update(stock_actual=7)
+        for valor in ('false', '0', False):
+            response = self.api.post('/api/productos/conciliacion/', {'reparar': valor, 'completa': 'true'}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(response.data['productos_reparados'], 0)
+        self.assertEqual(self._stock(), 7)
+
+        response = self.api.post('/api/productos/conciliacion/', {'reparar': 'quizas'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.api.post('/api/productos/conciliacion/', {'reparar': 'true', 'completa': '1'}, format='json')
+        self.assertEqual(response.data['productos_reparados'], 1)
+        self.assertEqual(self._stock(), 10)
+
+    def _ajustes(self):
+        return list(InventarioProducto.objects.filter(inventario__codigo=INVENTARIO_AJUSTES)
+                    .order_by('id').values_list('producto_id', 'cantidad'))
+
+    def test_editar_el_stock_registra_un_ajuste(self):
+        # Un ajuste a mano queda en el log: la conciliación no lo revierte
+        for stock, ajuste in ((99, 89), (4, -95)):
+            response = self.api.patch(f'/api/productos/{self.producto.id}/', {'stock_actual': stock}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(response.data['stock_actual'], stock)
+            self.assertEqual(self._ajustes()[-1], (self.producto.id, ajuste))
+        self.assertEqual(conciliar_stock(reparar=True, completa=True)['productos_con_diferencia'], 0)
+        self.assertEqual(self._stock(), 4)
+
+    def test_editar_otros_campos_conserva_el_stock_vigente(self):
+        producto = Producto.objects.get(id=self.producto.id)
+        # Una venta descuenta stock después de que la vista leyó el producto
+        Producto.objects.filter(id=producto.id).update(stock_actual=F('stock_actual') - 3)
+        serializer = ProductoSerializer(producto, data={'nombre': 'Taladro 2'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        ProductoViewSet().perform_update(serializer)
+        self.assertEqual(self._stock(), 7)
+        self.assertEqual(self._ajustes(), [])
+
+    def test_crear_producto_registra_el_saldo_inicial(self):
+        response = self.api.post('/api/productos/', {
+            'codigo_producto': 'C-2', 'nombre': 'Lijadora', 'precio_venta': '40.00',
+            'categoria': self.producto.categoria_id, 'stock_actual': 6,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self._ajustes(), [(response.data['id'], 6)])
+        self.assertEqual(conciliar_stock(completa=True)['productos_con_diferencia'], 0)
+
+
+class InventarioResumenTests(TestCase):
+    """?vista=resumen agrega los ingresos por producto en la base de datos."""
+    url = '/api/inventarios/'
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Resumen')
+        self.a, self.b = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'R-{i}', nombre=f'Repuesto {i}', precio_venta=5, categoria=categoria)
+            for i in range(2)
+        ])
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='bodega@test.com', password='x', rol='ADMIN'))
+
+    def _ingresar(self, inventario, producto, cantidad, hace_dias):
+        return InventarioProducto.objects.create(
+            inventario=inventario, producto=producto, cantidad=cantidad,
+            fecha_ingreso=timezone.now() - timedelta(days=hace_dias)
+        )
+
+    def _resumen(self):
+        response = self.api.get(self.url, {'vista': 'resumen'})
+        self.assertEqual(response.status_code, 200)
+        return {inventario['codigo']: inventario['productos'] for inventario in response.data}
+
+    def test_totales_y_ultimo_ingreso_por_producto(self):
+        norte = Inventario.objects.create(codigo='NORTE')
+        sur = Inventario.objects.create(codigo='SUR')
+        self._ingresar(norte, self.a, 4, hace_dias=3)
+        ultimo = self._ingresar(norte, self.a, 6, hace_dias=1)
+        self._ingresar(norte, self.b, 2, hace_dias=2)
+        self._ingresar(sur, self.a, 1, hace_dias=5)
+
+        resumen = self._resumen()
+        self.assertEqual(
+            [(p['codigo_producto'], p['total_ingresado']) for p in resumen['NORTE']],
+            [('R-0', 10), ('R-1', 2)]
+        )
+        self.assertEqual(resumen['NORTE'][0]['ultimo_ingreso'], ultimo.fecha_ingreso)
+        self.assertEqual([(p['codigo_producto'], p['total_ingresado']) for p in resumen['SUR']], [('R-0', 1)])
+
+    def test_consultas_no_crecen_con_los_almacenes(self):
+        for i in range(5):
+            inventario = Inventario.objects.create(codigo=f'ALM-{i}')
+            self._ingresar(inventario, self.a, 1, hace_dias=i)
+        # Listado de almacenes + una sola consulta agrupada para todos
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self._resumen()), 5)
+
+
+class SincronizacionCatalogoTests(TestCase):
+    """productos/sync/: catálogo completo sin cursor, solo los cambios con ?desde=."""
+    url = '/api/productos/sync/'
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre='Sync')
+        self.quedan, self.cambia, self.borrado = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'S-{i}', nombre=f'Sincronizado {i}', precio_venta=5, categoria=self.categoria)
+            for i in range(3)
+        ])
+        # Todo lo existente es anterior al cursor que se entregará
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        Producto.objects.update(fecha_actualizacion=hace_una_hora)
+        Categoria.objects.update(fecha_actualizacion=hace_una_hora)
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='offline@test.com', password='x', rol='CLIENTE'))
+
+    def test_completo_y_luego_incremental(self):
+        completo = self.api.get(self.url).json()
+        self.assertTrue(completo['completo'])
+        self.assertEqual(len(completo['productos']), 3)
+
+        self.cambia.nombre = 'Sincronizado renombrado'
+        self.cambia.save()
+        borrado_id = self.borrado.id
+        self.borrado.delete()
+
+        response = self.api.get(self.url, {'desde': completo['cursor']})
+        self.assertEqual(response.status_code, 200)
+        cambios = response.json()
+        self.assertFalse(cambios['completo'])
+        self.assertEqual([p['nombre'] for p in cambios['productos']], ['Sincronizado renombrado'])
+        self.assertEqual(cambios['categorias'], [])
+        self.assertEqual(cambios['eliminados'], {'productos': [borrado_id], 'categorias': []})
+
+        # El cursor nuevo no retrocede más allá del anterior
+        self.assertGreaterEqual(cambios['cursor'], completo['cursor'])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.api.get(self.url, {'desde': 'ayer'}).status_code, 400)
+
+
+class ResumenCategoriasTests(TestCase):
+    """categorias/resumen/: una sola consulta agregada, luego desde la caché."""
+    url = '/api/categorias/resumen/'
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='gerente@test.com', password='x', rol='ADMIN'))
+
+    def test_una_consulta_sin_importar_las_categorias(self):
+        estado = Producto.EstadoProducto
+        for i in range(4):
+            categoria = Categoria.objects.create(nombre=f'Resumen {i}')
+            Producto.objects.bulk_create([
+                Producto(codigo_producto=f'RC-{i}-1', nombre='Disponible', precio_venta=10, precio_compra=4,
+                         stock_actual=3, categoria=categoria),
+                Producto(codigo_producto=f'RC-{i}-2', nombre='Agotado', precio_venta=10, precio_compra=4,
+                         stock_actual=0, estado=estado.AGOTADO, categoria=categoria),
+            ])
+        Categoria.objects.create(nombre='Vacía')
+
+        with self.assertNumQueries(1):
+            response = self.api.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        primera, vacia = response.data[0], response.data[-1]
+        self.assertEqual(
+            (primera['total_productos'], primera['disponibles'], primera['agotados'], primera['stock_total']),
+            (2, 1, 1, 3)
+        )
+        self.assertEqual(primera['valorizacion'], 12)
+        self.assertEqual((vacia['total_productos'], vacia['stock_total'], vacia['valorizacion']), (0, 0, 0))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get(self.url).data, response.data)
+
+
+class ImportarProductosTests(TestCase):
+    """productos/importar/: upsert por codigo_producto, todo o nada."""
+    url = '/api/productos/importar/'
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nombre='Ferretería')
+        self.existente = Producto.objects.create(
+            codigo_producto='F-1', nombre='Martillo', marca='Forja', precio_venta=15, stock_actual=8,
+            categoria=self.categoria
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='compras@test.com', password='x', rol='ADMIN'))
+
+    def test_actualiza_existentes_y_crea_nuevos(self):
+        response = self.api.post(self.url, [
+            {'codigo_producto': 'F-1', 'precio_venta': '17,50', 'marca': ''},
+            {'codigo_producto': 'F-2', 'nombre': 'Serrucho', 'precio_venta': '22', 'categoria': 'ferretería'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['creados'], response.data['actualizados']), (1, 1))
+        self.assertEqual([fila['resultado'] for fila in response.data['filas']], ['actualizado', 'creado'])
+
+        self.existente.refresh_from_db()
+        # La celda vacía conserva la marca; el stock no se importa
+        self.assertEqual((self.existente.precio_venta, self.existente.marca, self.existente.stock_actual),
+                         (Decimal('17.50'), 'Forja', 8))
+        nuevo = Producto.objects.get(codigo_producto='F-2')
+        self.assertEqual((nuevo.nombre, nuevo.categoria_id, nuevo.stock_actual), ('Serrucho', self.categoria.id, 0))
+
+    def test_una_fila_invalida_no_importa_nada(self):
+        response = self.api.post(self.url, [
+            {'codigo_producto': 'F-1', 'precio_venta': '99'},
+            {'codigo_producto': 'F-3', 'nombre': 'Tenaza', 'precio_venta': '12', 'categoria': 'No existe'},
+            {'codigo_producto': 'F-4', 'precio_venta': '-1', 'categoria': 'Ferretería'},
+            {'codigo_producto': 'F-1', 'precio_venta': '5'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error['fila'], error['codigo_producto']) for error in response.data['errores']],
+            [(2, 'F-3'), (3, 'F-4'), (4, 'F-1')]
+        )
+        self.assertIn("Categoría 'No existe' no existe.", response.data['errores'][0]['errores'])
+        self.assertEqual(len(response.data['errores'][1]['errores']), 2)  # precio y nombre
+        self.assertEqual(Producto.objects.count(), 1)
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.precio_venta, 15)
+
+
+class StockAgrupadoTests(TestCase):
+    """Ventas e ingresos agrupan las líneas repetidas de un producto en un solo UPDATE."""
+
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='Agrupado')
+        self.a, self.b = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'G-{i}', nombre=f'Producto {i}', precio_venta=10, stock_actual=5, categoria=categoria)
+            for i in range(2)
+        ])
+
+    def _stock(self):
+        return dict(Producto.objects.values_list('codigo_producto', 'stock_actual'))
+
+    def test_reserva_suma_lineas_repetidas(self):
+        reservar_stock([(self.a.id, 2), (self.b.id, 1), (self.a.id, 3)])
+        self.assertEqual(self._stock(), {'G-0': 0, 'G-1': 4})
+
+    def test_suma_que_supera_el_stock_falla_sin_descontar(self):
+        # 3 + 3 > 5 aunque cada línea por separado alcanza
+        with self.assertRaises(ValidationError):
+            reservar_stock([(self.a.id, 3), (self.a.id, 3), (self.b.id, 1)])
+        self.assertEqual(self._stock(), {'G-0': 5, 'G-1': 5})
+
+    def test_linea_invalida_no_se_compensa_al_agrupar(self):
+        with self.assertRaises(ValidationError):
+            reservar_stock([(self.a.id, -1), (self.a.id, 3)])
+        self.assertEqual(self._stock(), {'G-0': 5, 'G-1': 5})
+
+    def test_ingreso_por_lote_agrupa_por_producto(self):
+        api = APIClient()
+        api.force_authenticate(Usuario.objects.create_user(correo='almacen@test.com', password='x', rol='ADMIN'))
+        Inventario.objects.create(codigo='ING-LOTE')
+        response = api.post('/api/inventario-productos/lote/', [
+            {'inventario': 'ING-LOTE', 'producto': self.a.id, 'cantidad': 2},
+            {'inventario': 'ING-LOTE', 'codigo_producto': 'G-0', 'cantidad': 3},
+            {'inventario': 'ING-LOTE', 'producto': self.b.id, 'cantidad': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['creados'], response.data['productos_actualizados']), (3, 2))
+        self.assertEqual(InventarioProducto.objects.count(), 3)
+        self.assertEqual(self._stock(), {'G-0': 10, 'G-1': 6})
 
-# Create your tests here.
+    def test_ingreso_por_lote_rechaza_cantidades_no_enteras(self):
+        api = APIClient()
+        api.force_authenticate(Usuario.objects.create_user(correo='almacen2@test.com', password='x', rol='ADMIN'))
+        Inventario.objects.create(codigo='ING-LOTE')
+        response = api.post('/api/inventario-productos/lote/', [
+            {'inventario': 'ING-LOTE', 'producto': self.a.id, 'cantidad': 2.9},
+            {'inventario': 'ING-LOTE', 'producto': self.b.id, 'cantidad': True},
+            {'inventario': 'ING-LOTE', 'producto': self.b.id, 'cantidad': '3'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['fila'] for error in response.data['errores']], [1, 2])
+        self.assertFalse(InventarioProducto.objects.exists())
+        self.assertEqual(self._stock(), {'G-0': 5, 'G-1': 5})
@@ -0,0 +1,384 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, When, Value, F, Q, IntegerField, CharField, DecimalField, Sum, Max, Count
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Producto, Categoria, Inventario, InventarioProducto
+from .cache import invalidar_catalogo_al_confirmar, version_catalogo
+from .signals import stock_umbral_cruzado
+
+
+def _entero(valor):
+    # Solo enteros o textos con dígitos: 3.7, True o '3.5' no son cantidades válidas
+    if isinstance(valor, bool):
+        raise ValueError
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, str) and valor.strip().lstrip('-').isdigit():
+        return int(valor)
+    raise ValueError
+
+
+def validar_pedidos(pedidos):
+    """
+    Valida línea por línea una lista de (producto_id, cantidad) ANTES de
+    agruparla: si no, (A, -1) y (A, 3) sumarían 2 y pasarían.
+    Devuelve la lista normalizada [(producto_id, cantidad)] con enteros.
+    Lanza ValidationError con todas las líneas inválidas (numeradas desde 1).
+    """
+    normalizados, errores = [], []
+    for numero, (producto_id, cantidad) in enumerate(pedidos, start=1):
+        try:
+            producto_id = _entero(producto_id)
+        except ValueError:
+            errores.append(f"Línea {numero}: 'producto_id' es obligatorio y debe ser un entero.")
+            continue
+        try:
+            cantidad = _entero(cantidad)
+            if cantidad <= 0:
+                raise ValueError
+        except ValueError:
+            errores.append(f"Línea {numero}: la cantidad debe ser un entero mayor a 0.")
+            continue
+        normalizados.append((producto_id, cantidad))
+    if errores:
+        raise ValidationError(errores)
+    return normalizados
+
+
+def agrupar_cantidades(pedidos):
+    """
+    Agrupa una lista de (producto_id, cantidad) sumando las cantidades
+    de un mismo producto (cada línea se valida antes con validar_pedidos).
+    Devuelve un dict {producto_id: cantidad}.
+    """
+    cantidades = {}
+    for producto_id, cantidad in validar_pedidos(pedidos):
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+
+def case_por_producto(cantidades):
+    # CASE id WHEN 1 THEN 3 WHEN 7 THEN 1 ... END
+    return Case(
+        *[When(id=producto_id, then=Value(cantidad)) for producto_id, cantidad in cantidades.items()],
+        output_field=IntegerField()
+    )
+
+
+def estado_segun_stock(nuevo_stock):
+    """
+    CASE para el mismo UPDATE que cambia el stock: pasa a Agotado si el stock
+    resultante es 0 y vuelve a Disponible si estaba Agotado y ahora hay stock.
+    Descontinuado no se toca. (En el SET, las columnas valen lo de ANTES.)
+    """
+    estados = Producto.EstadoProducto
+    return Case(
+        When(estado=estados.DESCONTINUADO, then=F('estado')),
+        When(LessThanOrEqual(nuevo_stock, 0), then=Value(estados.AGOTADO)),
+        When(estado=estados.AGOTADO, then=Value(estados.DISPONIBLE)),
+        default=F('estado'),
+        output_field=CharField()
+    )
+
+
+def notificar_cruces_umbral(cambios):
+    """
+    cambios = {producto_id: (stock_antes, stock_despues, stock_minimo)}.
+    Emite stock_umbral_cruzado cuando la transacción confirma, solo si algún
+    producto cruzó su stock_minimo (en cualquier sentido).
+    """
+    bajo_minimo = sorted(pid for pid, (antes, despues, minimo) in cambios.items() if antes > minimo >= despues)
+    repuestos = sorted(pid for pid, (antes, despues, minimo) in cambios.items() if antes <= minimo < despues)
+    if bajo_minimo or repuestos:
+        transaction.on_commit(lambda: stock_umbral_cruzado.send(
+            sender=Producto, bajo_minimo=bajo_minimo, repuestos=repuestos
+        ))
+
+
+def reservar_stock(pedidos):
+    """
+    Descuenta el stock de varios productos en bloque (debe llamarse dentro
+    de una transacción).
+
+    1. Bloquea TODOS los productos pedidos con un solo SELECT ... FOR UPDATE
+       ordenado por id (orden determinista => sin deadlocks entre ventas).
+    2. Valida todas las líneas y reporta TODAS las que no tienen stock
+       (las cantidades ya se validaron línea por línea al agrupar).
+    3. Descuenta el stock con un único UPDATE condicional (que también pasa
+       a Agotado los productos que quedan en 0).
+
+    Devuelve un dict {producto_id: Producto} con el stock ya actualizado.
+    Lanza Producto.DoesNotExist si algún producto no existe y
+    ValidationError (lista de mensajes) si hay cantidades inválidas o
+    stock insuficiente.
+    """
+    cantidades = agrupar_cantidades(pedidos)
+    if not cantidades:
+        return {}
+
+    productos = {
+        p.id: p
+        for p in Producto.objects.select_for_update().filter(id__in=cantidades.keys()).order_by('id')
+    }
+
+    faltantes = sorted(set(cantidades) - set(productos))
+    if faltantes:
+        raise Producto.DoesNotExist(f"Productos inexistentes: {faltantes}")
+
+    errores = []
+    for producto_id, cantidad in cantidades.items():
+        producto = productos[producto_id]
+        if producto.stock_actual < cantidad:
+            errores.append(
+                f"Stock insuficiente para '{producto.nombre}'. Disponible: {producto.stock_actual}, Pedido: {cantidad}"
+            )
+    if errores:
+        raise ValidationError(errores)
+
+    descuento = case_por_producto(cantidades)
+    actualizados = Producto.objects.filter(
+        id__in=cantidades.keys(),
+        stock_actual__gte=descuento
+    ).update(
+        stock_actual=F('stock_actual') - descuento,
+        estado=estado_segun_stock(F('stock_actual') - descuento),
+        fecha_actualizacion=timezone.now()
+    )
+
+    # Con las filas bloqueadas no debería ocurrir, pero el UPDATE es la
+    # garantía final de que el stock nunca queda negativo.
+    if actualizados != len(cantidades):
+        raise ValidationError(["El stock cambió durante la venta. Intente nuevamente."])
+
+    cambios = {}
+    for producto_id, cantidad in cantidades.items():
+        producto = productos[producto_id]
+        cambios[producto_id] = (producto.stock_actual, producto.stock_actual - cantidad, producto.stock_minimo)
+        producto.stock_actual -= cantidad
+        if producto.stock_actual == 0 and producto.estado != Producto.EstadoProducto.DESCONTINUADO:
+            producto.estado = Producto.EstadoProducto.AGOTADO
+    notificar_cruces_umbral(cambios)
+
+    # El UPDATE en bloque no dispara signals: invalidamos la caché del catálogo
+    invalidar_catalogo_al_confirmar()
+
+    return productos
+
+
+def adjuntar_resumen_ingresos(inventarios):
+    """
+    Calcula con UNA consulta agrupada (inventario, producto) el total ingresado
+    y el último ingreso de cada producto en los almacenes dados, y lo deja en
+    'inventario.resumen_productos'.
+    """
+    por_inventario = {inventario.id: inventario for inventario in inventarios}
+    for inventario in inventarios:
+        inventario.resumen_productos = []
+
+    filas = InventarioProducto.objects.filter(inventario_id__in=por_inventario.keys()) \
+        .values('inventario_id', 'producto_id', 'producto__codigo_producto', 'producto__nombre') \
+        .annotate(total_ingresado=Sum('cantidad'), ultimo_ingreso=Max('fecha_ingreso')) \
+        .order_by('inventario_id', 'producto_id')
+
+    for fila in filas:
+        por_inventario[fila['inventario_id']].resumen_productos.append({
+            'producto_id': fila['producto_id'],
+            'codigo_producto': fila['producto__codigo_producto'],
+            'producto_nombre': fila['producto__nombre'],
+            'total_ingresado': fila['total_ingresado'],
+            'ultimo_ingreso': fila['ultimo_ingreso'],
+        })
+    return inventarios
+
+
+def incrementar_stock(cantidades):
+    """
+    Suma stock a varios productos (dict {producto_id: cantidad}) dentro de
+    una transacción: bloquea en orden de id (igual que reservar_stock, así
+    ingresos y ventas no se bloquean mutuamente en deadlock) y aplica un
+    único UPDATE con el incremento agregado por producto (los Agotados
+    vuelven a Disponible en el mismo UPDATE).
+    """
+    if not cantidades:
+        return 0
+    # El mismo SELECT del bloqueo trae stock y mínimo para detectar cruces de umbral
+    antes = {
+        producto_id: (stock_actual, stock_minimo)
+        for producto_id, stock_actual, stock_minimo in Producto.objects.select_for_update()
+        .filter(id__in=cantidades.keys()).order_by('id').values_list('id', 'stock_actual', 'stock_minimo')
+    }
+    incremento = case_por_producto(cantidades)
+    actualizados = Producto.objects.filter(id__in=cantidades.keys()).update(
+        stock_actual=F('stock_actual') + incremento,
+        estado=estado_segun_stock(F('stock_actual') + incremento),
+        fecha_actualizacion=timezone.now()
+    )
+    notificar_cruces_umbral({
+        producto_id: (stock, stock + cantidades[producto_id], minimo)
+        for producto_id, (stock, minimo) in antes.items()
+    })
+    invalidar_catalogo_al_confirmar()
+    return actualizados
+
+
+# Almacén donde quedan los cambios de stock_actual hechos a mano
+INVENTARIO_AJUSTES = 'AJUSTE-STOCK'
+
+
+def registrar_ajuste_stock(ajustes):
+    """
+    Registra en el log de ingresos (almacén AJUSTE-STOCK) los cambios de
+    stock_actual hechos a mano, dict {producto_id: diferencia} con signo (el
+    saldo inicial de un producto nuevo es su stock). Así ingresos - ventas
+    sigue igual al stock y la conciliación no revierte el ajuste.
+    No modifica stock_actual: el llamador ya lo fijó.
+    """
+    ajustes = {producto_id: diferencia for producto_id, diferencia in ajustes.items() if diferencia}
+    if not ajustes:
+        return 0
+    inventario, _ = Inventario.objects.get_or_create(codigo=INVENTARIO_AJUSTES)
+    ahora = timezone.now()
+    InventarioProducto.objects.bulk_create([
+        InventarioProducto(inventario=inventario, producto_id=producto_id, cantidad=diferencia, fecha_ingreso=ahora)
+        for producto_id, diferencia in ajustes.items()
+    ])
+    return len(ajustes)
+
+
+def validar_filas_ingreso(filas):
+    """
+    Valida un lote de ingresos ANTES de escribir nada. Cada fila es un dict con
+    'inventario' (id o código), 'producto' / 'producto_id' (id) o
+    'codigo_producto', y 'cantidad'. Resuelve inventarios y productos con una
+    consulta cada uno.
+
+    Devuelve (validas, errores): validas = [(inventario_id, producto_id, cantidad)],
+    errores = [{'fila': n, 'errores': [...]}] (n empieza en 1).
+    """
+    inventarios_ref, productos_ids, codigos = set(), set(), set()
+    for fila in filas:
+        if not isinstance(fila, dict):
+            continue
+        if fila.get('inventario') not in (None, ''):
+            inventarios_ref.add(str(fila['inventario']).strip())
+        producto = fila.get('producto_id', fila.get('producto'))
+        if producto not in (None, '') and str(producto).strip().isdigit():
+            productos_ids.add(int(producto))
+        if fila.get('codigo_producto'):
+            codigos.add(str(fila['codigo_producto']).strip())
+
+    ids_inventario = {int(ref) for ref in inventarios_ref if ref.isdigit()}
+    inventarios = {}
+    for inventario_id, codigo in Inventario.objects.filter(
+        Q(id__in=ids_inventario) | Q(codigo__in=inventarios_ref)
+    ).values_list('id', 'codigo'):
+        inventarios[str(inventario_id)] = inventario_id
+        if codigo:
+            inventarios.setdefault(codigo, inventario_id)
+
+    por_id, por_codigo = set(), {}
+    for producto_id, codigo in Producto.objects.filter(
+        Q(id__in=productos_ids) | Q(codigo_producto__in=codigos)
+    ).values_list('id', 'codigo_producto'):
+        por_id.add(producto_id)
+        por_codigo[codigo] = producto_id
+
+    validas, errores = [], []
+    for numero, fila in enumerate(filas, start=1):
+        if not isinstance(fila, dict):
+            errores.append({'fila': numero, 'errores': ['Formato de fila inválido.']})
+            continue
+        mensajes = []
+
+        inventario_id = inventarios.get(str(fila.get('inventario', '')).strip())
+        if inventario_id is None:
+            mensajes.append(f"Inventario '{fila.get('inventario')}' no existe.")
+
+        producto = fila.get('producto_id', fila.get('producto'))
+        if producto not in (None, ''):
+            producto_id = int(producto) if str(producto).strip().isdigit() else None
+            if producto_id not in por_id:
+                mensajes.append(f"Producto '{producto}' no existe.")
+        elif fila.get('codigo_producto'):
+            producto_id = por_codigo.get(str(fila['codigo_producto']).strip())
+            if producto_id is None:
+                mensajes.append(f"Código de producto '{fila['codigo_producto']}' no existe.")
+        else:
+            producto_id = None
+            mensajes.append("Debe indicar 'producto' o 'codigo_producto'.")
+
+        try:
+            cantidad = _entero(fila.get('cantidad'))
+            if cantidad <= 0:
+                mensajes.append('La cantidad debe ser mayor a 0.')
+        except ValueError:
+            mensajes.append('La cantidad debe ser un número entero.')
+
+        if mensajes:
+            errores.append({'fila': numero, 'errores': mensajes})
+        else:
+            validas.append((inventario_id, producto_id, cantidad))
+
+    return validas, errores
+
+
+def registrar_ingresos_lote(validas, tamano_lote=1000):
+    """
+    Registra un lote de ingresos ya validados (debe llamarse dentro de una
+    transacción): bulk_create del log y un único incremento de stock por producto.
+    """
+    ahora = timezone.now()
+    InventarioProducto.objects.bulk_create([
+        InventarioProducto(inventario_id=inventario_id, producto_id=producto_id, cantidad=cantidad, fecha_ingreso=ahora)
+        for inventario_id, producto_id, cantidad in validas
+    ], batch_size=tamano_lote)
+
+    cantidades = agrupar_cantidades((producto_id, cantidad) for _, producto_id, cantidad in validas)
+    incrementar_stock(cantidades)
+    return len(validas), len(cantidades)
+
+
+def resumen_categorias():
+    """
+    Resumen por categoría (cantidad de productos, disponibles, agotados,
+    stock total y valorización = precio_compra * stock) calculado con UNA
+    consulta agregada (LEFT JOIN + GROUP BY) y cacheado por versión del
+    catálogo: cualquier cambio de producto, categoría o stock lo recalcula.
+    """
+    clave = f"catalogo:{version_catalogo()}:resumen_categorias"
+    resumen = cache.get(clave)
+    if resumen is not None:
+        return resumen
+
+    estado = Producto.EstadoProducto
+    resumen = list(
+        Categoria.objects.annotate(
+            total_productos=Count('productos'),
+            disponibles=Count('productos', filter=Q(productos__estado=estado.DISPONIBLE)),
+            agotados=Count('productos', filter=Q(productos__estado=estado.AGOTADO)),
+            descontinuados=Count('productos', filter=Q(productos__estado=estado.DESCONTINUADO)),
+            stock_total=Coalesce(Sum('productos__stock_actual'), 0),
+            valorizacion=Coalesce(
+                Sum(
+                    F('productos__precio_compra') * F('productos__stock_actual'),
+                    output_field=DecimalField(max_digits=14, decimal_places=2)
+                ),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            ),
+        )
+        .order_by('id')
+        .values(
+            'id', 'nombre', 'estado', 'total_productos', 'disponibles', 'agotados',
+            'descontinuados', 'stock_total', 'valorizacion'
+        )
+    )
+    cache.set(clave, resumen, getattr(settings, 'CATALOGO_CACHE_TTL', 3600))
+    return resumen
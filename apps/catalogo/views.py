@@ -1,18 +1,51 @@
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import viewsets, permissions, status, filters, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from django.db import transaction  # <--- IMPORTACIÓN AÑADIDA
+from django.db.models import Prefetch, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from apps.acceso_seguridad.models import Usuario
 from apps.acceso_seguridad.permissions import IsAdminRole, IsAdminOrReadOnly
 from .models import *
+from .cache import CatalogoCacheMixin, CatalogoCondicionalMixin, estadisticas_cache
+from .filters import BusquedaProductoFilter
+from .conciliacion import calcular_diferencias, conciliar_stock
+from .sincronizacion import cambios_catalogo
+from .importacion import validar_filas_productos, upsert_productos
 from .serializers import (
     ClienteReadSerializer, 
     ClienteWriteSerializer, 
     CategoriaSerializer, 
     ProductoSerializer, 
     InventarioSerializer,
+    InventarioResumenSerializer,
     InventarioProductoSerializer
 )
+from .utils import (
+    adjuntar_resumen_ingresos, validar_filas_ingreso, registrar_ingresos_lote, resumen_categorias,
+    incrementar_stock, registrar_ajuste_stock
+)
+import csv
+import io
+import time
+
+
+def _leer_filas(request, clave):
+    """
+    Filas de una carga masiva: archivo CSV (UTF-8) en 'archivo', un array
+    JSON o {clave: [...]}.
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo:
+        try:
+            return list(csv.DictReader(io.StringIO(archivo.read().decode('utf-8-sig'))))
+        except UnicodeDecodeError:
+            raise ParseError("El archivo debe estar en UTF-8.")
+    if isinstance(request.data, list):
+        return request.data
+    return request.data.get(clave)
 
 # === VIEWSET DE CLIENTE) ===
 class ClienteViewSet(viewsets.ModelViewSet):
@@ -73,25 +106,175 @@ class ClienteViewSet(viewsets.ModelViewSet):
             )
 
 # --- Categoria (CU-07) ---
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(CatalogoCondicionalMixin, viewsets.ModelViewSet):
+    """list/retrieve responden 304 si el cliente ya tiene la versión actual."""
+    tipo_eliminacion = EliminacionCatalogo.TipoObjeto.CATEGORIA
     queryset = Categoria.objects.all().order_by('id')
     serializer_class = CategoriaSerializer
     permission_classes = [IsAdminOrReadOnly]  # ✅ CLIENTES pueden ver, ADMIN pueden editar
     filter_backends = [filters.SearchFilter]
     search_fields = ['nombre']
 
+    @action(detail=False, methods=['get'], url_path='resumen', permission_classes=[IsAdminRole])
+    def resumen(self, request):
+        """
+        Vista general para la pantalla de categorías del admin: por categoría,
+        cantidad de productos (disponibles/agotados/descontinuados), stock
+        total y valorización. Una sola consulta, cacheada por versión del catálogo.
+        """
+        return Response(resumen_categorias(), status=status.HTTP_200_OK)
+
 # --- Producto (CU-08) ---
-class ProductoViewSet(viewsets.ModelViewSet):
+class ProductoViewSet(CatalogoCondicionalMixin, CatalogoCacheMixin, viewsets.ModelViewSet):
+    """
+    list/retrieve (incluida la búsqueda) se sirven desde caché hasta que
+    cambia la versión del catálogo, y responden 304 (ETag / Last-Modified)
+    si el cliente ya tiene esa versión.
+    ?search= busca por nombre, código, marca y categoría, ordenado por relevancia.
+    """
+    tipo_eliminacion = EliminacionCatalogo.TipoObjeto.PRODUCTO
+    # Cada producto incluye datos de su categoría: renombrarla también lo modifica
+    modelos_relacionados = (Categoria,)
     queryset = Producto.objects.select_related('categoria').all().order_by('id') # Optimizado con select_related
     serializer_class = ProductoSerializer
     permission_classes = [IsAdminOrReadOnly]  # ✅ CLIENTES pueden ver, ADMIN pueden editar
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['nombre', 'codigo_producto', 'categoria__nombre', 'marca'] # Añadido 'marca'
+    filter_backends = [BusquedaProductoFilter]
+
+    def perform_create(self, serializer):
+        # El stock con el que se crea el producto es su saldo inicial
+        with transaction.atomic():
+            producto = serializer.save()
+            registrar_ajuste_stock({producto.id: producto.stock_actual})
+
+    def perform_update(self, serializer):
+        """
+        Bloquea la fila para leer el stock vigente (una venta pudo descontarlo
+        después de get_object) y registra como ajuste la diferencia con el
+        stock_actual enviado.
+        """
+        with transaction.atomic():
+            producto = serializer.instance
+            anterior = Producto.objects.select_for_update().values_list('stock_actual', flat=True).get(pk=producto.pk)
+            if 'stock_actual' not in serializer.validated_data:
+                producto.stock_actual = anterior
+            producto = serializer.save()
+            registrar_ajuste_stock({producto.id: producto.stock_actual - anterior})
+
+    @action(detail=False, methods=['get', 'post'], url_path='conciliacion', permission_classes=[IsAdminRole])
+    def conciliacion(self, request):
+        """
+        Conciliación de stock (stock_actual vs ingresos - ventas).
+        GET: solo informa (desde la última marca de agua, o todo con ?completa=true).
+        POST {"reparar": true, "completa": false}: ejecuta, registra y avanza la marca de agua.
+        """
+        if request.method == 'GET':
+            completa = request.query_params.get('completa', '').lower() in ('1', 'true', 'si')
+            ultima = ConciliacionStock.objects.order_by('-fecha_ejecucion').first()
+            desde = None if (completa or ultima is None) else ultima.marca_agua
+            revisados, diferencias = calcular_diferencias(desde)
+            return Response({
+                'desde': desde,
+                'productos_revisados': revisados,
+                'productos_con_diferencia': len(diferencias),
+                'diferencias': diferencias,
+            }, status=status.HTTP_200_OK)
+
+        # "false" / "0" (form-data o JSON como texto) no deben contar como True
+        booleano = serializers.BooleanField()
+        resultado = conciliar_stock(
+            reparar=booleano.to_internal_value(request.data.get('reparar', False)),
+            completa=booleano.to_internal_value(request.data.get('completa', False))
+        )
+        return Response(resultado, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='importar', permission_classes=[IsAdminRole])
+    def importar(self, request):
+        """
+        Alta/actualización masiva de productos por codigo_producto (listas de
+        precios, catálogo del proveedor).
+        Acepta un array JSON (o {"productos": [...]}) o un archivo CSV en
+        'archivo' con columnas: codigo_producto, nombre, descripcion, precio_venta,
+        precio_compra, imagen_url, estado, ano_garantia, stock_minimo,
+        categoria (nombre), marca. Las celdas vacías no cambian el valor actual.
+        Valida todo primero; si alguna fila falla no se escribe nada.
+        """
+        inicio = time.perf_counter()
+
+        filas = _leer_filas(request, 'productos')
+        if not isinstance(filas, list) or not filas:
+            return Response({"detail": "Envíe una lista de productos o un archivo CSV."}, status=status.HTTP_400_BAD_REQUEST)
+
+        productos, resultados, errores = validar_filas_productos(filas)
+        if errores:
+            return Response({"detail": "El archivo tiene errores. No se importó ningún producto.", "errores": errores},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            upsert_productos(productos)
+
+        duracion = time.perf_counter() - inicio
+        return Response({
+            "creados": sum(1 for fila in resultados if fila['resultado'] == 'creado'),
+            "actualizados": sum(1 for fila in resultados if fila['resultado'] == 'actualizado'),
+            "duracion_ms": round(duracion * 1000, 1),
+            "filas": resultados,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='stock-bajo', permission_classes=[IsAdminRole])
+    def stock_bajo(self, request):
+        """
+        Lista de reposición: productos (no descontinuados) con
+        stock_actual <= stock_minimo, los más críticos primero.
+        Lee solo el índice parcial 'producto_stock_bajo'.
+        """
+        productos = Producto.objects.filter(stock_actual__lte=F('stock_minimo')) \
+            .exclude(estado=Producto.EstadoProducto.DESCONTINUADO) \
+            .select_related('categoria') \
+            .order_by('stock_actual', 'id')
+        return Response(ProductoSerializer(productos, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='sync')
+    def sync(self, request):
+        """
+        Sincronización incremental para clientes offline.
+        GET ?desde=<cursor> devuelve solo productos y categorías creados,
+        modificados o desactivados después del cursor, más los ids eliminados.
+        Sin 'desde' devuelve el catálogo completo. El cliente guarda 'cursor'
+        y lo envía en la siguiente llamada.
+        """
+        desde = request.query_params.get('desde')
+        if desde:
+            desde = parse_datetime(desde)
+            if desde is None:
+                return Response(
+                    {"detail": "'desde' debe ser una fecha ISO-8601 (el 'cursor' de la sincronización anterior)."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(desde):
+                desde = timezone.make_aware(desde)
+        else:
+            desde = None
+
+        productos, categorias, eliminados, cursor = cambios_catalogo(desde)
+        return Response({
+            'completo': desde is None,
+            'cursor': cursor,
+            'productos': ProductoSerializer(productos, many=True).data,
+            'categorias': CategoriaSerializer(categorias, many=True).data,
+            'eliminados': eliminados,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminRole])
+    def cache_stats(self, request):
+        """Versión del catálogo y contadores de aciertos/fallos de la caché."""
+        return Response(estadisticas_cache(), status=status.HTTP_200_OK)
 
 # --- Inventario (CU-09) ---
 class InventarioViewSet(viewsets.ModelViewSet):
     """
     ViewSet para gestionar los 'Almacenes' (Inventarios).
+    ?vista=resumen devuelve por producto el total ingresado y el último
+    ingreso (agregado en la base de datos) en lugar del log completo.
     """
     queryset = Inventario.objects.all().order_by('id')
     serializer_class = InventarioSerializer
@@ -99,13 +282,40 @@ class InventarioViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['codigo']
 
+    def _es_resumen(self):
+        return self.action in ('list', 'retrieve') and self.request.query_params.get('vista') == 'resumen'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve') and not self._es_resumen():
+            # Todo el log de ingresos (con producto y categoría) en una sola consulta
+            queryset = queryset.prefetch_related(Prefetch(
+                'inventarioproducto_set',
+                queryset=InventarioProducto.objects.select_related('producto__categoria').order_by('-fecha_ingreso'),
+                to_attr='ingresos'
+            ))
+        return queryset
+
+    def get_serializer_class(self):
+        if self._es_resumen():
+            return InventarioResumenSerializer
+        return InventarioSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self._es_resumen():
+            many = kwargs.get('many', False)
+            inventarios = list(args[0]) if many else [args[0]]
+            adjuntar_resumen_ingresos(inventarios)
+            args = (inventarios if many else inventarios[0],) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+
 # --- InventarioProducto (CU-09) ---
 class InventarioProductoViewSet(viewsets.ModelViewSet):
     """
     ViewSet para 'Registrar Ingresos' de productos al inventario (CU-09).
     Maneja la lógica de actualizar el stock_actual del producto.
     """
-    queryset = InventarioProducto.objects.select_related('producto', 'inventario').all().order_by('-fecha_ingreso')
+    queryset = InventarioProducto.objects.select_related('producto__categoria', 'inventario').all().order_by('-fecha_ingreso')
     serializer_class = InventarioProductoSerializer
     permission_classes = [IsAdminRole]
     
@@ -130,11 +340,9 @@ class InventarioProductoViewSet(viewsets.ModelViewSet):
                 # 2. Guardamos el registro de ingreso (InventarioProducto)
                 self.perform_create(serializer)
                 
-                # 3. Actualizamos el stock_actual del Producto
-                # (Usamos 'select_for_update' para bloquear la fila y evitar 'race conditions')
-                producto_a_actualizar = Producto.objects.select_for_update().get(pk=producto.id)
-                producto_a_actualizar.stock_actual += cantidad_ingresada
-                producto_a_actualizar.save()
+                # 3. Actualizamos el stock_actual del Producto con un UPDATE atómico
+                # (bloquea la fila, repone el estado si estaba Agotado y avisa si cruza el mínimo)
+                incrementar_stock({producto.id: cantidad_ingresada})
 
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -145,6 +353,36 @@ class InventarioProductoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'], url_path='lote')
+    def registrar_lote(self, request):
+        """
+        Registra muchos ingresos de una sola vez (ej. una entrega del proveedor).
+        Acepta un array JSON (o {"ingresos": [...]}) o un archivo CSV en 'archivo'
+        con columnas: inventario, producto | codigo_producto, cantidad.
+        Valida todo primero; si alguna fila falla no se registra nada.
+        """
+        inicio = time.perf_counter()
+
+        filas = _leer_filas(request, 'ingresos')
+        if not isinstance(filas, list) or not filas:
+            return Response({"detail": "Envíe una lista de ingresos o un archivo CSV."}, status=status.HTTP_400_BAD_REQUEST)
+
+        validas, errores = validar_filas_ingreso(filas)
+        if errores:
+            return Response({"detail": "El lote tiene errores. No se registró ningún ingreso.", "errores": errores},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            creados, productos_actualizados = registrar_ingresos_lote(validas)
+
+        duracion = time.perf_counter() - inicio
+        return Response({
+            "creados": creados,
+            "productos_actualizados": productos_actualizados,
+            "duracion_ms": round(duracion * 1000, 1),
+            "filas_por_segundo": round(creados / duracion, 1) if duracion else None,
+        }, status=status.HTTP_201_CREATED)
+
     # --- Métodos deshabilitados para proteger la integridad del stock ---
 
     def update(self, request, *args, **kwargs):
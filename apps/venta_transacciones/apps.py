@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class VentaTransaccionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.venta_transacciones'
+
+    def ready(self):
+        """
+        Registra los signals (resumen mensual de ventas).
+        """
+        import apps.venta_transacciones.signals
@@ -0,0 +1,610 @@
+"""
+Almacenes de carritos (settings.CARRITO_STORE):
+
+- BaseDatosCarritoStore (por defecto): cada cambio se escribe directo en
+  Carrito/DetalleCarrito.
+- CacheCarritoStore (opcional, hay que elegirlo explícitamente): los carritos
+  activos viven en la caché de Django (Redis con REDIS_URL; LocMem sirve de
+  reemplazo local en tests) y se vuelcan a la base de datos por lotes
+  (comando 'volcar_carritos'), al leerlos por la API y antes del checkout.
+  Editar el carrito no espera a PostgreSQL, pero una línea nueva tiene 'id'
+  null hasta el siguiente volcado.
+
+Las dos devuelven las líneas con la misma forma que DetalleCarritoSerializer.
+"""
+
+import copy
+import logging
+import secrets
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from apps.catalogo.cache import version_catalogo
+from apps.catalogo.models import Producto
+from .models import Carrito, DetalleCarrito
+from .serializers import DetalleCarritoSerializer, info_producto
+from .utils import upsert_linea_carrito
+
+
+logger = logging.getLogger(__name__)
+
+_stores = {}
+
+
+def obtener_store():
+    ruta = settings.CARRITO_STORE
+    if ruta not in _stores:
+        _stores[ruta] = import_string(ruta)()
+    return _stores[ruta]
+
+
+def datos_productos(ids):
+    """
+    {producto_id: datos para armar la línea}. Cacheado por versión del
+    catálogo; los que faltan se leen con UNA consulta.
+    """
+    version = version_catalogo()
+    claves = {producto_id: f"carrito:producto:{version}:{producto_id}" for producto_id in ids}
+    encontrados = cache.get_many(list(claves.values()))
+    datos = {producto_id: encontrados[clave] for producto_id, clave in claves.items() if clave in encontrados}
+
+    faltantes = [producto_id for producto_id in ids if producto_id not in datos]
+    if faltantes:
+        nuevos = {}
+        for producto in Producto.objects.select_related('categoria').filter(id__in=faltantes):
+            datos[producto.id] = nuevos[claves[producto.id]] = {
+                'nombre': producto.nombre,
+                'imagen_url': producto.imagen_url,
+                'info': info_producto(producto),
+            }
+        cache.set_many(nuevos, getattr(settings, 'CATALOGO_CACHE_TTL', 3600))
+    return datos
+
+
+def _stock_insuficiente(en_carrito, disponible):
+    return ValidationError({
+        'detail': f'Stock insuficiente. Ya tiene {en_carrito} en el carrito. Disponible: {disponible}'
+    })
+
+
+def validar_stock(producto, cantidad, en_carrito):
+    """'producto' es el dict de datos_productos; 'cantidad' es el total pedido."""
+    if cantidad <= 0:
+        raise ValidationError({'detail': 'La cantidad debe ser mayor a 0.'})
+    disponible = producto['info']['stock_actual']
+    if cantidad > disponible:
+        raise _stock_insuficiente(en_carrito, disponible)
+
+
+def _linea(carrito_id, producto_id, linea, producto):
+    """Línea con la forma de DetalleCarritoSerializer sin leer DetalleCarrito."""
+    precio = Decimal(linea['precio_unitario'])
+    return {
+        'id': linea['id'],
+        'carrito': carrito_id,
+        'producto': producto_id,
+        'producto_nombre': producto['nombre'],
+        'producto_imagen': producto['imagen_url'],
+        'producto_info': producto['info'],
+        'cantidad': linea['cantidad'],
+        'precio_unitario': f"{precio:.2f}",
+        'subtotal': f"{precio * linea['cantidad']:.2f}",
+    }
+
+
+class OperacionInvalida(APIException):
+    """400 de un lote: {'operacion': número (int, desde 1), 'detail': motivo}."""
+    status_code = 400
+    default_code = 'invalid'
+
+    def __init__(self, numero, detalle):
+        # Se asigna directo: ValidationError convertiría el número en ErrorDetail (str)
+        self.detail = {'operacion': numero, 'detail': detalle}
+
+
+def aplicar_operaciones(lineas, operaciones, productos):
+    """
+    Aplica en orden las operaciones validadas (OperacionCarritoSerializer)
+    sobre 'lineas' ({producto_id: {'id', 'cantidad', 'precio_unitario'}}),
+    con los datos de 'productos' (datos_productos). Devuelve los producto_id
+    tocados. Si una falla lanza OperacionInvalida con su número (desde 1) y
+    el llamador descarta todo el lote.
+    """
+    tocados = set()
+    for numero, operacion in enumerate(operaciones, start=1):
+        producto_id = operacion['producto']
+        linea = lineas.get(producto_id)
+        try:
+            if operacion['tipo'] == 'quitar' or (operacion['tipo'] == 'fijar' and operacion['cantidad'] <= 0):
+                lineas.pop(producto_id, None)
+            else:
+                producto = productos.get(producto_id)
+                if producto is None:
+                    raise ValidationError({'detail': f'El producto {producto_id} no existe.'})
+                en_carrito = linea['cantidad'] if linea else 0
+                total = en_carrito + operacion['cantidad'] if operacion['tipo'] == 'agregar' else operacion['cantidad']
+                validar_stock(producto, total, en_carrito)
+                if linea is None:
+                    lineas[producto_id] = {'id': None, 'cantidad': total, 'precio_unitario': producto['info']['precio_venta']}
+                else:
+                    linea['cantidad'] = total
+        except ValidationError as e:
+            raise OperacionInvalida(numero, e.detail['detail'])
+        tocados.add(producto_id)
+    return tocados
+
+
+class CarritoStore:
+    """Interfaz común. 'cliente_id' identifica el carrito activo del cliente."""
+
+    def lineas(self, cliente_id):
+        raise NotImplementedError
+
+    def agregar(self, cliente_id, producto_id, cantidad):
+        """Suma 'cantidad' a la línea del producto (la crea si no existe). Devuelve la línea."""
+        raise NotImplementedError
+
+    def fijar_cantidad(self, cliente_id, producto_id, cantidad):
+        """Deja la línea con 'cantidad' (0 o menos la quita y devuelve None)."""
+        raise NotImplementedError
+
+    def quitar(self, cliente_id, producto_id):
+        raise NotImplementedError
+
+    def vaciar(self, cliente_id):
+        """Quita todas las líneas. Devuelve False si el cliente no tiene carrito."""
+        raise NotImplementedError
+
+    def aplicar(self, cliente_id, operaciones):
+        """
+        Aplica un lote de operaciones (todas o ninguna) leyendo los productos
+        una sola vez. Devuelve (carrito_id, líneas resultantes).
+        """
+        raise NotImplementedError
+
+    def producto_de_linea(self, cliente_id, detalle_id):
+        """producto_id de la línea 'detalle_id' del cliente (NotFound si no es suya)."""
+        raise NotImplementedError
+
+    def volcar(self, cliente_id):
+        """Escribe en la base de datos los cambios pendientes del carrito."""
+        return False
+
+    def volcar_pendientes(self, limite=None):
+        """Vuelca todos los carritos con cambios pendientes. Devuelve cuántos."""
+        return 0
+
+    def olvidar(self, cliente_id):
+        """Descarta el estado en memoria (ej. después del checkout)."""
+
+    def descartar_abandonado(self, cliente_id):
+        """
+        Tras marcar como abandonado el carrito del cliente ('barrer_carritos'):
+        descarta el estado en memoria salvo que tenga cambios sin volcar.
+        """
+
+
+class BaseDatosCarritoStore(CarritoStore):
+    """Escritura directa en Carrito/DetalleCarrito (comportamiento original)."""
+
+    def _carrito(self, cliente_id):
+        carrito, _ = Carrito.objects.get_or_create(
+            cliente_id=cliente_id,
+            estado=Carrito.EstadoCarrito.ACTIVO,
+            defaults={'origen': 'FlutterApp'}
+        )
+        return carrito
+
+    def _tocar(self, carrito_id):
+        # Actividad del cliente: 'barrer_carritos' abandona por fecha_actualizacion
+        Carrito.objects.filter(id=carrito_id).update(fecha_actualizacion=timezone.now())
+
+    def _detalles(self, cliente_id):
+        return DetalleCarrito.objects.filter(
+            carrito__cliente_id=cliente_id, carrito__estado=Carrito.EstadoCarrito.ACTIVO
+        )
+
+    def lineas(self, cliente_id):
+        detalles = self._detalles(cliente_id).select_related('producto__categoria').order_by('id')
+        return DetalleCarritoSerializer(detalles, many=True).data
+
+    def _guardar_linea(self, cliente_id, producto_id, cantidad, sumar):
+        """
+        Una sola sentencia (upsert_linea_carrito) crea o actualiza la línea y
+        valida el stock: dos pedidos simultáneos no duplican la línea ni
+        pierden cantidades. Solo si falla se consulta el motivo.
+        """
+        if cantidad <= 0:
+            raise ValidationError({'detail': 'La cantidad debe ser mayor a 0.'})
+        producto = datos_productos([producto_id]).get(producto_id)
+        if producto is None:
+            raise Producto.DoesNotExist(f"Producto {producto_id} no existe.")
+
+        carrito = self._carrito(cliente_id)
+        fila = upsert_linea_carrito(carrito.id, producto_id, cantidad, sumar=sumar)
+        if fila is None:
+            disponible = Producto.objects.filter(id=producto_id).values_list('stock_actual', flat=True).first()
+            if disponible is None:
+                raise Producto.DoesNotExist(f"Producto {producto_id} no existe.")
+            en_carrito = DetalleCarrito.objects.filter(carrito=carrito, producto_id=producto_id) \
+                .values_list('cantidad', flat=True).first() or 0
+            raise _stock_insuficiente(en_carrito, disponible)
+
+        detalle_id, total, precio, _ = fila
+        return _linea(carrito.id, producto_id, {'id': detalle_id, 'cantidad': total, 'precio_unitario': precio}, producto)
+
+    def agregar(self, cliente_id, producto_id, cantidad):
+        return self._guardar_linea(cliente_id, producto_id, cantidad, sumar=True)
+
+    def fijar_cantidad(self, cliente_id, producto_id, cantidad):
+        if cantidad <= 0:
+            self.quitar(cliente_id, producto_id)
+            return None
+        return self._guardar_linea(cliente_id, producto_id, cantidad, sumar=False)
+
+    def quitar(self, cliente_id, producto_id):
+        carrito_id = Carrito.objects.filter(cliente_id=cliente_id, estado=Carrito.EstadoCarrito.ACTIVO) \
+            .values_list('id', flat=True).first()
+        if carrito_id:
+            DetalleCarrito.objects.filter(carrito_id=carrito_id, producto_id=producto_id).delete()
+            self._tocar(carrito_id)
+
+    def vaciar(self, cliente_id):
+        carrito_id = Carrito.objects.filter(cliente_id=cliente_id, estado=Carrito.EstadoCarrito.ACTIVO) \
+            .values_list('id', flat=True).first()
+        if not carrito_id:
+            return False
+        DetalleCarrito.objects.filter(carrito_id=carrito_id).delete()
+        self._tocar(carrito_id)
+        return True
+
+    def aplicar(self, cliente_id, operaciones):
+        with transaction.atomic():
+            carrito = self._carrito(cliente_id)
+            lineas = {
+                producto_id: {'id': detalle_id, 'cantidad': cantidad, 'precio_unitario': str(precio)}
+                for detalle_id, producto_id, cantidad, precio in DetalleCarrito.objects.select_for_update()
+                .filter(carrito=carrito).values_list('id', 'producto_id', 'cantidad', 'precio_unitario')
+            }
+            antes = set(lineas)
+            productos = datos_productos(list(antes | {operacion['producto'] for operacion in operaciones}))
+            tocados = aplicar_operaciones(lineas, operaciones, productos)
+
+            # Un DELETE para las quitadas y un INSERT ... ON CONFLICT para el resto
+            quitados = antes - set(lineas)
+            if quitados:
+                DetalleCarrito.objects.filter(carrito=carrito, producto_id__in=quitados).delete()
+            escribir = [
+                DetalleCarrito(
+                    carrito=carrito, producto_id=producto_id, cantidad=linea['cantidad'],
+                    precio_unitario=Decimal(linea['precio_unitario']),
+                    subtotal=Decimal(linea['precio_unitario']) * linea['cantidad'],
+                )
+                for producto_id, linea in lineas.items() if producto_id in tocados
+            ]
+            DetalleCarrito.objects.bulk_create(
+                escribir,
+                update_conflicts=True,
+                unique_fields=['carrito', 'producto'],
+                update_fields=['cantidad', 'subtotal'],
+            )
+            for detalle in escribir:
+                lineas[detalle.producto_id]['id'] = detalle.id
+            self._tocar(carrito.id)
+
+        return carrito.id, [
+            _linea(carrito.id, producto_id, linea, productos[producto_id])
+            for producto_id, linea in lineas.items() if producto_id in productos
+        ]
+
+    def producto_de_linea(self, cliente_id, detalle_id):
+        # Un id no numérico (/detalles-carrito/abc/) es un 404, no un error al filtrar
+        if not str(detalle_id).isdigit():
+            raise NotFound('Línea de carrito no encontrada.')
+        # Solo líneas del carrito activo: las de uno ya convertido o abandonado
+        # no se pueden editar (se aplicarían sobre el carrito activo)
+        producto_id = DetalleCarrito.objects.filter(
+            id=detalle_id, carrito__cliente_id=cliente_id, carrito__estado=Carrito.EstadoCarrito.ACTIVO
+        ).values_list('producto_id', flat=True).first()
+        if producto_id is None:
+            raise NotFound('Línea de carrito no encontrada.')
+        return producto_id
+
+
+# Borra la clave solo si todavía guarda nuestro token (GET + DEL atómico en Redis)
+_SOLTAR_BLOQUEO = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _soltar_bloqueo(clave, token):
+    """
+    Suelta el bloqueo solo si sigue siendo nuestro: si expiró (el dueño tardó
+    más de 'duracion') y lo tomó otro proceso, no se lo borramos.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        clave_redis = backend.make_and_validate_key(clave)
+        # RedisCache guarda los int sin serializar: el valor es str(token)
+        backend._cache.get_client(clave_redis, write=True).eval(_SOLTAR_BLOQUEO, 1, clave_redis, str(token))
+    elif cache.get(clave) == token:
+        # LocMem y otros: comprobar y borrar (la caché es local al proceso)
+        cache.delete(clave)
+
+
+@contextmanager
+def _bloqueo(clave, duracion=10):
+    """
+    Bloqueo simple con cache.add (atómico en Redis y LocMem). Expira solo a
+    los 'duracion' segundos por si el proceso que lo tomó muere. Cada toma
+    guarda un token único, que se compara al soltarlo.
+    """
+    token = secrets.randbits(62)
+    while not cache.add(clave, token, duracion):
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        _soltar_bloqueo(clave, token)
+
+
+class CacheCarritoStore(CarritoStore):
+    """
+    Carritos activos en la caché con escritura diferida (write-behind).
+
+    Estado por cliente: {'carrito_id', 'lineas': {producto_id: {'id', 'cantidad',
+    'precio_unitario'}}, 'version', 'volcada'}. 'version' sube con cada cambio
+    y 'volcada' es la última versión escrita en la base de datos.
+
+    Los carritos con cambios se anotan en una cola (contador atómico con
+    cache.incr + una clave por entrada) que volcar_pendientes() recorre.
+    """
+    CLAVE_SECUENCIA = 'carrito:pendientes:seq'
+    CLAVE_PUNTERO = 'carrito:pendientes:volcado'
+
+    def _ttl(self):
+        return getattr(settings, 'CARRITO_STORE_TTL', 7 * 24 * 3600)
+
+    def _clave(self, cliente_id):
+        return f"carrito:estado:{cliente_id}"
+
+    def _cargar(self, cliente_id):
+        """Estado del carrito (debe llamarse con el bloqueo del cliente tomado)."""
+        estado = cache.get(self._clave(cliente_id))
+        if estado is not None:
+            return estado
+
+        # Primera vez: se lee el carrito activo de la base de datos
+        carrito_id = Carrito.objects.filter(cliente_id=cliente_id, estado=Carrito.EstadoCarrito.ACTIVO) \
+            .order_by('-fecha_actualizacion').values_list('id', flat=True).first()
+        lineas = {}
+        if carrito_id:
+            for detalle_id, producto_id, cantidad, precio in DetalleCarrito.objects.filter(carrito_id=carrito_id) \
+                    .values_list('id', 'producto_id', 'cantidad', 'precio_unitario'):
+                lineas[producto_id] = {'id': detalle_id, 'cantidad': cantidad, 'precio_unitario': str(precio)}
+        estado = {'carrito_id': carrito_id, 'lineas': lineas, 'version': 0, 'volcada': 0}
+        cache.set(self._clave(cliente_id), estado, self._ttl())
+        return estado
+
+    def _guardar(self, cliente_id, estado):
+        """Guarda un cambio y, si el carrito estaba al día, lo anota en la cola."""
+        if estado['version'] == estado['volcada']:
+            self._encolar(cliente_id)
+        estado['version'] += 1
+        cache.set(self._clave(cliente_id), estado, self._ttl())
+
+    def _encolar(self, cliente_id):
+        try:
+            numero = cache.incr(self.CLAVE_SECUENCIA)
+        except ValueError:
+            cache.add(self.CLAVE_SECUENCIA, 0, None)
+            numero = cache.incr(self.CLAVE_SECUENCIA)
+        cache.set(f"carrito:pendientes:{numero}", cliente_id, self._ttl())
+
+    def lineas(self, cliente_id):
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = self._cargar(cliente_id)
+        productos = datos_productos(list(estado['lineas']))
+        return [
+            _linea(estado['carrito_id'], producto_id, linea, productos[producto_id])
+            for producto_id, linea in estado['lineas'].items()
+            if producto_id in productos
+        ]
+
+    def _guardar_linea(self, cliente_id, producto_id, cantidad, sumar):
+        producto = datos_productos([producto_id]).get(producto_id)
+        if producto is None:
+            raise Producto.DoesNotExist(f"Producto {producto_id} no existe.")
+
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = self._cargar(cliente_id)
+            linea = estado['lineas'].get(producto_id)
+            en_carrito = linea['cantidad'] if linea else 0
+            total = en_carrito + cantidad if sumar else cantidad
+            validar_stock(producto, total, en_carrito)
+
+            if linea is None:
+                linea = estado['lineas'][producto_id] = {
+                    'id': None, 'cantidad': total, 'precio_unitario': producto['info']['precio_venta']
+                }
+            else:
+                linea['cantidad'] = total
+            self._guardar(cliente_id, estado)
+        return _linea(estado['carrito_id'], producto_id, linea, producto)
+
+    def agregar(self, cliente_id, producto_id, cantidad):
+        return self._guardar_linea(cliente_id, producto_id, cantidad, sumar=True)
+
+    def fijar_cantidad(self, cliente_id, producto_id, cantidad):
+        if cantidad <= 0:
+            self.quitar(cliente_id, producto_id)
+            return None
+        return self._guardar_linea(cliente_id, producto_id, cantidad, sumar=False)
+
+    def quitar(self, cliente_id, producto_id):
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = self._cargar(cliente_id)
+            if estado['lineas'].pop(producto_id, None) is not None:
+                self._guardar(cliente_id, estado)
+
+    def vaciar(self, cliente_id):
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = self._cargar(cliente_id)
+            if estado['carrito_id'] is None and not estado['lineas']:
+                return False
+            estado['lineas'] = {}
+            self._guardar(cliente_id, estado)
+        return True
+
+    def aplicar(self, cliente_id, operaciones):
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = self._cargar(cliente_id)
+            lineas = copy.deepcopy(estado['lineas'])
+            productos = datos_productos(list(set(lineas) | {operacion['producto'] for operacion in operaciones}))
+            # Sobre una copia: si una operación falla el carrito queda como estaba
+            aplicar_operaciones(lineas, operaciones, productos)
+            estado['lineas'] = lineas
+            self._guardar(cliente_id, estado)
+        return estado['carrito_id'], [
+            _linea(estado['carrito_id'], producto_id, linea, productos[producto_id])
+            for producto_id, linea in lineas.items() if producto_id in productos
+        ]
+
+    def producto_de_linea(self, cliente_id, detalle_id):
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = self._cargar(cliente_id)
+        for producto_id, linea in estado['lineas'].items():
+            if linea['id'] is not None and str(linea['id']) == str(detalle_id):
+                return producto_id
+        raise NotFound('Línea de carrito no encontrada.')
+
+    def volcar(self, cliente_id):
+        """
+        Escribe el carrito en la base de datos con consultas fijas (un DELETE
+        y un INSERT ... ON CONFLICT en bloque). Las ediciones siguen sin
+        esperar: solo se bloquea la caché para copiar el estado y, al final,
+        para anotar los ids creados.
+        """
+        clave_bloqueo = f"carrito:bloqueo:{cliente_id}"
+        # Un solo volcado a la vez por carrito (cola + checkout)
+        with _bloqueo(f"carrito:volcando:{cliente_id}", duracion=60):
+            with _bloqueo(clave_bloqueo):
+                estado = cache.get(self._clave(cliente_id))
+            if estado is None or estado['version'] == estado['volcada']:
+                return False
+
+            with transaction.atomic():
+                carrito_id, ids = self._escribir(cliente_id, estado)
+
+            def _confirmar():
+                with _bloqueo(clave_bloqueo):
+                    actual = cache.get(self._clave(cliente_id)) or estado
+                    actual['carrito_id'] = carrito_id
+                    for producto_id, detalle_id in ids.items():
+                        if producto_id in actual['lineas']:
+                            actual['lineas'][producto_id]['id'] = detalle_id
+                    actual['volcada'] = max(actual['volcada'], estado['version'])
+                    # Si hubo cambios durante el volcado, vuelve a la cola
+                    if actual['version'] != actual['volcada']:
+                        self._encolar(cliente_id)
+                    cache.set(self._clave(cliente_id), actual, self._ttl())
+
+            # Dentro de otra transacción (ej. checkout) se marca como volcado
+            # solo si confirma; si hace rollback el carrito sigue pendiente.
+            transaction.on_commit(_confirmar)
+        return True
+
+    def _escribir(self, cliente_id, estado):
+        """Sincroniza Carrito/DetalleCarrito con 'estado'. Devuelve (carrito_id, {producto_id: detalle_id})."""
+        carritos = Carrito.objects.select_for_update().filter(cliente_id=cliente_id, estado=Carrito.EstadoCarrito.ACTIVO)
+        carrito = None
+        if estado['carrito_id']:
+            carrito = carritos.filter(id=estado['carrito_id']).first()
+        if carrito is None:
+            carrito = carritos.order_by('-fecha_actualizacion').first()
+        lineas = estado['lineas']
+        if carrito is None:
+            if not lineas:
+                return None, {}
+            carrito = Carrito.objects.create(cliente_id=cliente_id)
+
+        # Productos borrados mientras estaban solo en memoria no se pueden insertar
+        existen = set(Producto.objects.filter(id__in=lineas.keys()).values_list('id', flat=True))
+        lineas = {producto_id: linea for producto_id, linea in lineas.items() if producto_id in existen}
+
+        DetalleCarrito.objects.filter(carrito=carrito).exclude(producto_id__in=lineas.keys()).delete()
+
+        detalles = []
+        for producto_id, linea in lineas.items():
+            precio = Decimal(linea['precio_unitario'])
+            detalles.append(DetalleCarrito(
+                carrito=carrito, producto_id=producto_id, cantidad=linea['cantidad'],
+                precio_unitario=precio, subtotal=precio * linea['cantidad'],
+            ))
+        # Sobre la restricción (carrito, producto): inserta las nuevas, pisa
+        # las existentes y devuelve todos los ids (RETURNING)
+        DetalleCarrito.objects.bulk_create(
+            detalles,
+            update_conflicts=True,
+            unique_fields=['carrito', 'producto'],
+            update_fields=['cantidad', 'precio_unitario', 'subtotal'],
+        )
+        Carrito.objects.filter(id=carrito.id).update(fecha_actualizacion=timezone.now())
+
+        return carrito.id, {detalle.producto_id: detalle.id for detalle in detalles}
+
+    def volcar_pendientes(self, limite=None):
+        """
+        Recorre la cola desde el último volcado y vuelca cada carrito una vez.
+        Un carrito que falla vuelve a la cola para el siguiente ciclo.
+        """
+        if not cache.add('carrito:volcado:cola', 1, 300):
+            return 0  # otro proceso está vaciando la cola
+        try:
+            desde = cache.get(self.CLAVE_PUNTERO, 0)
+            hasta = cache.get(self.CLAVE_SECUENCIA, 0)
+            if limite:
+                hasta = min(hasta, desde + limite)
+
+            claves = [f"carrito:pendientes:{numero}" for numero in range(desde + 1, hasta + 1)]
+            clientes = []
+            for inicio in range(0, len(claves), 500):
+                for cliente_id in cache.get_many(claves[inicio:inicio + 500]).values():
+                    if cliente_id not in clientes:
+                        clientes.append(cliente_id)
+            cache.set(self.CLAVE_PUNTERO, hasta, None)
+            cache.delete_many(claves)
+
+            volcados = 0
+            for cliente_id in clientes:
+                try:
+                    volcados += self.volcar(cliente_id)
+                except DatabaseError as e:
+                    logger.warning("Error al volcar el carrito del cliente %s: %s", cliente_id, e)
+                    self._encolar(cliente_id)
+            return volcados
+        finally:
+            cache.delete('carrito:volcado:cola')
+
+    def olvidar(self, cliente_id):
+        cache.delete(self._clave(cliente_id))
+
+    def descartar_abandonado(self, cliente_id):
+        # Con el bloqueo del cliente: una edición que llegó después del volcado
+        # no se pierde; el siguiente volcado la escribe en un carrito activo nuevo
+        with _bloqueo(f"carrito:bloqueo:{cliente_id}"):
+            estado = cache.get(self._clave(cliente_id))
+            if estado is not None and estado['version'] == estado['volcada']:
+                cache.delete(self._clave(cliente_id))
@@ -0,0 +1,261 @@
+import hashlib
+import io
+import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+
+# Subir este número cuando cambie el diseño del PDF (invalida los ya guardados)
+VERSION_PLANTILLA = 1
+CARPETA = 'comprobantes'
+
+_pool = None
+# hash -> Future de los PDFs que se están generando en el pool
+_en_curso = {}
+
+
+def _get_pool():
+    """Pool de procesos compartido para renderizar PDFs fuera del request."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'COMPROBANTES_WORKERS', 2))
+    return _pool
+
+
+def datos_comprobante(venta):
+    """
+    Extrae de la venta SOLO los datos que se imprimen (dict serializable),
+    para poder enviarlos a otro proceso y calcular su hash.
+    """
+    usuario = venta.cliente.usuario if venta.cliente else None
+    return {
+        'plantilla': VERSION_PLANTILLA,
+        'venta_id': venta.id,
+        'fecha': venta.fecha_venta.strftime('%d/%m/%Y %H:%M'),
+        'cliente_nombre': f"{usuario.nombre} {usuario.apellido}" if usuario else '',
+        'cliente_correo': usuario.correo if usuario else '',
+        'detalles': [
+            [item.producto.nombre, item.cantidad, f"{item.precio_unitario:.2f}", f"{item.subtotal:.2f}"]
+            for item in venta.detalles.all()
+        ],
+        'total': f"{venta.total:.2f}",
+    }
+
+
+def hash_comprobante(datos):
+    """Hash del contenido: identifica el archivo y sirve como ETag."""
+    return hashlib.sha256(json.dumps(datos, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def ruta_comprobante(hash_contenido):
+    return f"{CARPETA}/{hash_contenido}.pdf"
+
+
+def dibujar_comprobante(datos):
+    """
+    Genera la Nota de Venta (CU-14) en PDF y devuelve los bytes.
+    Función pura (sin ORM) para poder ejecutarse en el pool de procesos.
+    'invariant' hace que los mismos datos produzcan exactamente los mismos bytes.
+    """
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    width, height = letter # (8.5 x 11 pulgadas)
+
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(1 * inch, height - 1 * inch, "SmartSales365 - NOTA DE VENTA")
+
+    p.setFont("Helvetica", 12)
+    p.drawString(1 * inch, height - 1.5 * inch, f"Venta ID: {datos['venta_id']}")
+    p.drawString(1 * inch, height - 1.7 * inch, f"Fecha: {datos['fecha']}")
+
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(1 * inch, height - 2.2 * inch, "Cliente:")
+    p.setFont("Helvetica", 12)
+    p.drawString(1 * inch, height - 2.4 * inch, f"Nombre: {datos['cliente_nombre']}")
+    p.drawString(1 * inch, height - 2.6 * inch, f"Correo: {datos['cliente_correo']}")
+
+    # --- Encabezados de la tabla de detalles ---
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(1 * inch, height - 3.2 * inch, "Producto")
+    p.drawString(4 * inch, height - 3.2 * inch, "Cantidad")
+    p.drawString(5 * inch, height - 3.2 * inch, "P. Unitario")
+    p.drawString(6 * inch, height - 3.2 * inch, "Subtotal")
+    p.line(1 * inch, height - 3.3 * inch, width - 1 * inch, height - 3.3 * inch)
+
+    # --- Loop de Detalles ---
+    p.setFont("Helvetica", 10)
+    y = height - 3.6 * inch # Posición Y inicial
+    for nombre, cantidad, precio_unitario, subtotal in datos['detalles']:
+        p.drawString(1 * inch, y, nombre)
+        p.drawString(4.2 * inch, y, str(cantidad))
+        p.drawString(5.2 * inch, y, f"{precio_unitario} Bs")
+        p.drawString(6.2 * inch, y, f"{subtotal} Bs")
+        y -= 0.3 * inch # Moverse a la siguiente línea
+
+    # --- Total ---
+    p.line(1 * inch, y + 0.1 * inch, width - 1 * inch, y + 0.1 * inch)
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(5 * inch, y - 0.3 * inch, f"TOTAL: {datos['total']} Bs")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def guardar_comprobante(hash_contenido, pdf):
+    ruta = ruta_comprobante(hash_contenido)
+    if not default_storage.exists(ruta):
+        default_storage.save(ruta, ContentFile(pdf))
+    return ruta
+
+
+def encolar_comprobante(datos, hash_contenido=None):
+    """
+    Envía el PDF al pool sin esperarlo; al terminar se guarda por hash. Si ya
+    se está generando no lo repite. Si el pool no está disponible se
+    renderiza en línea (queda guardado al volver).
+    """
+    global _pool
+    hash_contenido = hash_contenido or hash_comprobante(datos)
+    if hash_contenido in _en_curso:
+        return
+
+    def _al_terminar(futuro):
+        try:
+            if futuro.exception() is None:
+                guardar_comprobante(hash_contenido, futuro.result())
+        finally:
+            _en_curso.pop(hash_contenido, None)
+
+    try:
+        futuro = _get_pool().submit(dibujar_comprobante, datos)
+    except BrokenProcessPool:
+        _pool = None
+        guardar_comprobante(hash_contenido, dibujar_comprobante(datos))
+        return
+    _en_curso[hash_contenido] = futuro
+    futuro.add_done_callback(_al_terminar)
+
+
+def obtener_comprobante(datos):
+    """
+    Devuelve (hash, archivo_abierto) del comprobante. Si todavía no está
+    guardado devuelve (hash, None) y deja la generación en el pool: el
+    request no espera al render.
+    """
+    hash_contenido = hash_comprobante(datos)
+    ruta = ruta_comprobante(hash_contenido)
+    if not default_storage.exists(ruta):
+        encolar_comprobante(datos, hash_contenido)
+        if not default_storage.exists(ruta):
+            return hash_contenido, None
+    return hash_contenido, default_storage.open(ruta, 'rb')
+
+
+def renderizar_lote(lista_datos):
+    """
+    Devuelve los PDFs de varias ventas (mismo orden). Los ya guardados se leen
+    del storage; el resto se renderiza EN PARALELO en el pool y se guarda.
+    """
+    global _pool
+    hashes = [hash_comprobante(datos) for datos in lista_datos]
+    pendientes = {}
+    try:
+        for datos, hash_contenido in zip(lista_datos, hashes):
+            if hash_contenido not in pendientes and not default_storage.exists(ruta_comprobante(hash_contenido)):
+                pendientes[hash_contenido] = _get_pool().submit(dibujar_comprobante, datos)
+    except BrokenProcessPool:
+        _pool = None
+
+    pdfs = []
+    for datos, hash_contenido in zip(lista_datos, hashes):
+        if hash_contenido in pendientes:
+            try:
+                pdf = pendientes[hash_contenido].result()
+            except BrokenProcessPool:
+                _pool = None
+                pdf = dibujar_comprobante(datos)
+            guardar_comprobante(hash_contenido, pdf)
+        else:
+            with default_storage.open(ruta_comprobante(hash_contenido), 'rb') as archivo:
+                pdf = archivo.read()
+        pdfs.append(pdf)
+    return pdfs
+
+
+class _SalidaZip(io.RawIOBase):
+    """
+    Destino no 'seekable' para zipfile: acumula lo escrito hasta que el
+    generador lo entrega al cliente (zipfile usa data descriptors).
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        contenido = b''.join(self._partes)
+        self._partes.clear()
+        return contenido
+
+
+def generar_zip(ventas, tamano_lote=32):
+    """
+    Generador que produce un ZIP con la nota de venta de cada venta, lote por
+    lote: la memoria usada depende del tamaño del lote, no del total de ventas.
+    'ventas' debe ser un iterador (ej. queryset.iterator()) con cliente__usuario
+    y detalles__producto precargados.
+    """
+    salida = _SalidaZip()
+    # Los PDFs ya vienen comprimidos: ZIP_STORED evita gastar CPU otra vez
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip:
+        lote = []
+        for venta in ventas:
+            lote.append(datos_comprobante(venta))
+            if len(lote) < tamano_lote:
+                continue
+            for datos, pdf in zip(lote, renderizar_lote(lote)):
+                archivo_zip.writestr(f"nota_venta_{datos['venta_id']}.pdf", pdf)
+                yield salida.vaciar()
+            lote = []
+
+        for datos, pdf in zip(lote, renderizar_lote(lote)):
+            archivo_zip.writestr(f"nota_venta_{datos['venta_id']}.pdf", pdf)
+            yield salida.vaciar()
+
+    # Directorio central del ZIP
+    yield salida.vaciar()
+
+
+def _precalcular(venta_id):
+    from .models import Venta
+
+    venta = Venta.objects.select_related('cliente__usuario').prefetch_related('detalles__producto').get(id=venta_id)
+    datos = datos_comprobante(venta)
+    hash_contenido = hash_comprobante(datos)
+    if not default_storage.exists(ruta_comprobante(hash_contenido)):
+        encolar_comprobante(datos, hash_contenido)
+
+
+def programar_comprobante(venta):
+    """
+    Hook post-venta: cuando la transacción confirma, envía el PDF al pool
+    para que la primera descarga ya lo encuentre generado.
+    """
+    if not getattr(settings, 'COMPROBANTES_PRECALCULAR', True):
+        return
+    transaction.on_commit(lambda: _precalcular(venta.id), robust=True)
@@ -0,0 +1,69 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# (nombre de columna en el archivo, campo para values_list)
+COLUMNAS_VENTA = [
+    ('id', 'id'),
+    ('fecha_venta', 'fecha_venta'),
+    ('cliente_id', 'cliente_id'),
+    ('cliente_correo', 'cliente__usuario__correo'),
+    ('metodo_entrada', 'metodo_entrada'),
+    ('tipo_venta', 'tipo_venta'),
+    ('total', 'total'),
+]
+
+COLUMNAS_DETALLE = [
+    ('id', 'id'),
+    ('venta_id', 'venta_id'),
+    ('fecha_venta', 'venta__fecha_venta'),
+    ('producto_id', 'producto_id'),
+    ('codigo_producto', 'producto__codigo_producto'),
+    ('producto', 'producto__nombre'),
+    ('cantidad', 'cantidad'),
+    ('precio_unitario', 'precio_unitario'),
+    ('subtotal', 'subtotal'),
+]
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Filas por FETCH del cursor del servidor
+TAMANO_LOTE = 2000
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, valor):
+        return valor
+
+
+def _filas_csv(nombres, filas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(nombres)
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def _filas_ndjson(nombres, filas):
+    for fila in filas:
+        yield json.dumps(dict(zip(nombres, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def respuesta_exportacion(queryset, columnas, formato, nombre_archivo):
+    """
+    Exporta el queryset fila por fila. Usa values_list + iterator(), que en
+    PostgreSQL lee con un cursor del servidor: la memoria no depende del total
+    de filas, solo de TAMANO_LOTE.
+    """
+    nombres = [nombre for nombre, _ in columnas]
+    filas = queryset.values_list(*[campo for _, campo in columnas]).iterator(chunk_size=TAMANO_LOTE)
+
+    generador = _filas_csv(nombres, filas) if formato == 'csv' else _filas_ndjson(nombres, filas)
+    response = StreamingHttpResponse(generador, content_type=FORMATOS[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}.{formato}"'
+    return response
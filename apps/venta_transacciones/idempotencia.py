@@ -0,0 +1,92 @@
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import ClaveIdempotencia
+
+HEADER = 'Idempotency-Key'
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _reproducir(registro, endpoint):
+    """Devuelve la respuesta almacenada (sin tocar Producto ni Venta)."""
+    if registro.endpoint != endpoint:
+        return Response(
+            {'detail': f'La {HEADER} ya fue usada en otro endpoint.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(registro.respuesta, status=registro.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotente(vista):
+    """
+    Decorador para acciones de creación (ventas, checkout del carrito).
+
+    Si el cliente envía el header 'Idempotency-Key':
+    - Una clave ya confirmada y vigente devuelve la respuesta guardada.
+    - La primera petición inserta la clave en la MISMA transacción que la venta;
+      un duplicado concurrente se bloquea en el índice único hasta que la
+      primera confirma y luego reproduce su respuesta. Si la primera falla
+      (rollback), el duplicado la ejecuta normalmente.
+    - Solo se guardan respuestas 2xx; los errores se pueden reintentar.
+    Las claves expiran después de settings.IDEMPOTENCY_KEY_TTL segundos.
+    """
+    @wraps(vista)
+    def envoltura(self, request, *args, **kwargs):
+        clave = request.headers.get(HEADER)
+        if not clave:
+            return vista(self, request, *args, **kwargs)
+
+        if len(clave) > 255:
+            return Response(
+                {'detail': f'La {HEADER} no puede superar 255 caracteres.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        endpoint = f"{request.method} {request.path}"
+        ahora = timezone.now()
+        claves = ClaveIdempotencia.objects.filter(usuario=request.user, clave=clave)
+
+        registro = claves.filter(expira__gt=ahora, status_code__isnull=False).first()
+        if registro:
+            return _reproducir(registro, endpoint)
+
+        # Una clave vencida se puede volver a usar
+        claves.filter(expira__lte=ahora).delete()
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    registro = ClaveIdempotencia.objects.create(
+                        usuario=request.user,
+                        clave=clave,
+                        endpoint=endpoint,
+                        expira=ahora + _ttl()
+                    )
+            except IntegrityError:
+                # Otra petición con la misma clave ya confirmó mientras esperábamos
+                return _reproducir(claves.get(), endpoint)
+
+            response = vista(self, request, *args, **kwargs)
+
+            if status.is_success(response.status_code):
+                registro.status_code = response.status_code
+                registro.respuesta = response.data
+                registro.save(update_fields=['status_code', 'respuesta'])
+            else:
+                # Descartamos la clave junto con cualquier cambio parcial
+                transaction.set_rollback(True)
+
+            return response
+
+    return envoltura
@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.venta_transacciones.carritos import obtener_store
+from apps.venta_transacciones.models import Carrito
+
+
+class Command(BaseCommand):
+    help = (
+        'Marca como abandonados los carritos activos sin cambios (CARRITO_ABANDONO_HORAS) y elimina '
+        'los abandonados/convertidos antiguos (CARRITO_RETENCION_DIAS), por lotes cortos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=settings.CARRITO_ABANDONO_HORAS,
+                            help='Horas sin cambios para considerar abandonado un carrito activo')
+        parser.add_argument('--dias', type=int, default=settings.CARRITO_RETENCION_DIAS,
+                            help='Días que se conservan los carritos abandonados o convertidos')
+        parser.add_argument('--lote', type=int, default=1000, help='Carritos por lote (una transacción corta cada uno)')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes')
+
+    def handle(self, *args, **options):
+        store = obtener_store()
+        # Con escritura diferida, los cambios pendientes se escriben primero
+        # para que fecha_actualizacion refleje la última edición del cliente
+        store.volcar_pendientes()
+
+        ahora = timezone.now()
+        filas, duracion = self._marcar_abandonados(store, ahora - timedelta(hours=options['horas']), options)
+        self._reportar(f'{filas} carritos marcados como abandonados', filas, duracion)
+
+        filas, duracion = self._purgar(ahora - timedelta(days=options['dias']), options)
+        self._reportar(f'{filas} filas de carritos antiguos eliminadas', filas, duracion)
+
+    def _marcar_abandonados(self, store, corte, options):
+        inicio = time.perf_counter()
+        total = 0
+        inactivos = Carrito.objects.filter(estado=Carrito.EstadoCarrito.ACTIVO, fecha_actualizacion__lt=corte)
+        while True:
+            lote = list(inactivos.order_by('fecha_actualizacion').values_list('id', 'cliente_id')[:options['lote']])
+            if not lote:
+                break
+            # El UPDATE repite el filtro: un carrito editado desde la lectura sigue activo.
+            # update() no toca fecha_actualizacion: la retención cuenta desde la última edición.
+            total += inactivos.filter(id__in=[carrito_id for carrito_id, _ in lote]) \
+                .update(estado=Carrito.EstadoCarrito.ABANDONADO)
+            for _, cliente_id in lote:
+                store.descartar_abandonado(cliente_id)
+            self._esperar(options)
+        return total, time.perf_counter() - inicio
+
+    def _purgar(self, corte, options):
+        inicio = time.perf_counter()
+        total = 0
+        cerrados = Carrito.objects.filter(
+            estado__in=[Carrito.EstadoCarrito.ABANDONADO, Carrito.EstadoCarrito.CONVERTIDO],
+            fecha_actualizacion__lt=corte,
+        )
+        while True:
+            ids = list(cerrados.order_by('fecha_actualizacion').values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+            # Un DELETE de las líneas y uno de los carritos (las ventas ya guardan su detalle)
+            total += Carrito.objects.filter(id__in=ids).delete()[0]
+            self._esperar(options)
+        return total, time.perf_counter() - inicio
+
+    def _esperar(self, options):
+        if options['pausa']:
+            time.sleep(options['pausa'])
+
+    def _reportar(self, mensaje, filas, duracion):
+        por_segundo = filas / duracion if duracion else 0
+        self.stdout.write(self.style.SUCCESS(f'{mensaje} en {duracion:.2f}s ({por_segundo:.0f} filas/s).'))
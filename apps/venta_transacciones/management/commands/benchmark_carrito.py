@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.acceso_seguridad.models import Usuario
+from apps.catalogo.models import Categoria, Producto
+from apps.venta_transacciones.carritos import obtener_store
+from apps.venta_transacciones.views import CarritoViewSet, DetalleCarritoViewSet
+
+
+class Command(BaseCommand):
+    help = ('Mide cuánto cuesta re-sincronizar un carrito: N llamadas a detalles-carrito '
+            '(una por producto) vs una sola llamada a carritos/operaciones/')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=50, help='Productos en el carrito')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Veces que se arma el carrito por escenario')
+
+    def handle(self, *args, **options):
+        marca = int(time.time())
+        categoria = Categoria.objects.create(nombre=f'__benchmark_{marca}__')
+        productos = Producto.objects.bulk_create([
+            Producto(
+                codigo_producto=f'BENCH-{marca}-{i}',
+                nombre=f'Producto benchmark {i}',
+                precio_venta=10,
+                stock_actual=10_000_000,
+                categoria=categoria,
+            )
+            for i in range(options['lineas'])
+        ])
+        usuario = Usuario.objects.create_user(correo=f'benchmark-{marca}@smartsales365.local', rol='CLIENTE')
+        ids = [p.id for p in productos]
+
+        try:
+            self._medir('secuencial', self._secuencial, usuario, ids, options)
+            self._medir('operaciones', self._operaciones, usuario, ids, options)
+        finally:
+            # Borrar el usuario elimina su cliente, carritos y líneas
+            usuario.delete()
+            Producto.objects.filter(id__in=ids).delete()
+            categoria.delete()
+
+    def _llamar(self, vista, usuario, datos):
+        request = APIRequestFactory().post('/', datos, format='json')
+        force_authenticate(request, user=usuario)
+        response = vista(request)
+        if response.status_code >= 400:
+            raise RuntimeError(f'La API respondió {response.status_code}: {response.data}')
+
+    def _secuencial(self, usuario, ids):
+        """Flujo anterior: un POST a detalles-carrito por producto."""
+        vista = DetalleCarritoViewSet.as_view({'post': 'create'})
+        for producto_id in ids:
+            self._llamar(vista, usuario, {'producto': producto_id, 'cantidad': 1})
+
+    def _operaciones(self, usuario, ids):
+        """Flujo por lote: un solo POST a carritos/operaciones/."""
+        vista = CarritoViewSet.as_view({'post': 'operaciones'})
+        self._llamar(vista, usuario, {
+            'operaciones': [{'tipo': 'agregar', 'producto': producto_id, 'cantidad': 1} for producto_id in ids]
+        })
+
+    def _medir(self, nombre, funcion, usuario, ids, options):
+        store = obtener_store()
+        duracion, consultas = 0.0, 0
+        for _ in range(options['repeticiones']):
+            store.vaciar(usuario.cliente.id)
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                funcion(usuario, ids)
+                duracion += time.perf_counter() - inicio
+            consultas += len(capturadas.captured_queries)
+
+        repeticiones = options['repeticiones']
+        self.stdout.write(self.style.SUCCESS(
+            f"[{nombre}] {len(ids)} líneas: {duracion / repeticiones * 1000:.1f} ms y "
+            f"{consultas / repeticiones:.0f} consultas por carrito ({repeticiones} repeticiones)"
+        ))
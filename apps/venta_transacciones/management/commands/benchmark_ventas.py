@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, DatabaseError
+from rest_framework.exceptions import ValidationError
+
+from apps.catalogo.models import Categoria, Producto
+from apps.catalogo.utils import reservar_stock
+from apps.venta_transacciones.models import Venta, DetalleVenta
+
+
+def venta_legacy(pedidos):
+    """Flujo anterior: un SELECT ... FOR UPDATE por línea + bulk_update."""
+    productos = []
+    for producto_id, cantidad in pedidos:
+        producto = Producto.objects.select_for_update().get(id=producto_id)
+        if producto.stock_actual < cantidad:
+            raise ValidationError("Stock insuficiente")
+        producto.stock_actual -= cantidad
+        productos.append(producto)
+    Producto.objects.bulk_update(productos, ['stock_actual'])
+    return {p.id: p for p in productos}
+
+
+def venta_reserva(pedidos):
+    """Flujo nuevo: un bloqueo ordenado + un UPDATE condicional."""
+    return reservar_stock(pedidos)
+
+
+ESCENARIOS = {
+    'legacy': venta_legacy,
+    'reserva': venta_reserva,
+}
+
+
+class Command(BaseCommand):
+    help = 'Mide ventas/segundo concurrentes sobre productos "calientes" (flujo anterior vs reserva en bloque)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Ventas concurrentes')
+        parser.add_argument('--ventas', type=int, default=25, help='Ventas por hilo')
+        parser.add_argument('--productos', type=int, default=10, help='Cantidad de productos calientes')
+        parser.add_argument('--lineas', type=int, default=40, help='Líneas por venta')
+        parser.add_argument('--escenario', choices=list(ESCENARIOS), action='append',
+                            help='Escenario(s) a medir (por defecto todos)')
+
+    def handle(self, *args, **options):
+        escenarios = options['escenario'] or list(ESCENARIOS)
+        categoria = Categoria.objects.create(nombre=f'__benchmark_{int(time.time())}__')
+        productos = Producto.objects.bulk_create([
+            Producto(
+                codigo_producto=f'BENCH-{categoria.id}-{i}',
+                nombre=f'Producto benchmark {i}',
+                precio_venta=10,
+                stock_actual=10_000_000,
+                categoria=categoria,
+            )
+            for i in range(options['productos'])
+        ])
+        ids = [p.id for p in productos]
+
+        try:
+            for nombre in escenarios:
+                self._medir(nombre, ESCENARIOS[nombre], ids, options)
+        finally:
+            Producto.objects.filter(id__in=ids).delete()
+            categoria.delete()
+
+    def _medir(self, nombre, funcion, ids, options):
+        resultados = {'ok': 0, 'errores': 0}
+        lock = threading.Lock()
+        ventas_creadas = []
+
+        def trabajador():
+            rnd = random.Random()
+            try:
+                for _ in range(options['ventas']):
+                    # Orden aleatorio de líneas, como llega del POS
+                    pedidos = [(rnd.choice(ids), 1) for _ in range(options['lineas'])]
+                    try:
+                        with transaction.atomic():
+                            productos = funcion(pedidos)
+                            venta = Venta.objects.create(total=0)
+                            DetalleVenta.objects.bulk_create([
+                                DetalleVenta(
+                                    venta=venta,
+                                    producto=productos[producto_id],
+                                    cantidad=cantidad,
+                                    precio_unitario=productos[producto_id].precio_venta,
+                                    subtotal=productos[producto_id].precio_venta * cantidad,
+                                )
+                                for producto_id, cantidad in pedidos
+                            ])
+                        with lock:
+                            resultados['ok'] += 1
+                            ventas_creadas.append(venta.id)
+                    except (DatabaseError, ValidationError):
+                        # Deadlocks / timeouts cuentan como venta fallida
+                        with lock:
+                            resultados['errores'] += 1
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=trabajador) for _ in range(options['hilos'])]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        DetalleVenta.objects.filter(venta_id__in=ventas_creadas).delete()
+        Venta.objects.filter(id__in=ventas_creadas).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"[{nombre}] {resultados['ok']} ventas en {duracion:.2f}s -> "
+            f"{resultados['ok'] / duracion:.1f} ventas/s ({resultados['errores']} fallidas)"
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.venta_transacciones.models import ClaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = 'Elimina las claves de idempotencia vencidas (IDEMPOTENCY_KEY_TTL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por DELETE')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            ids = list(
+                ClaveIdempotencia.objects.filter(expira__lte=timezone.now())
+                .values_list('id', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+            total += ClaveIdempotencia.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'{total} claves de idempotencia vencidas eliminadas.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+from apps.venta_transacciones.models import Venta, ResumenVentasMensual
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye ResumenVentasMensual a partir de todas las ventas (backfill)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Recalculando resumen mensual de ventas...'))
+
+        with transaction.atomic():
+            # Bloquea nuevas ventas mientras se reconstruye, para no perder ni duplicar ninguna
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(Venta._meta.db_table)} IN SHARE MODE")
+
+            filas = Venta.objects.annotate(mes=TruncMonth('fecha_venta')) \
+                                 .values('mes', 'metodo_entrada', 'tipo_venta') \
+                                 .annotate(cantidad_ventas=Count('id'), monto_total=Sum('total')) \
+                                 .order_by()
+
+            ResumenVentasMensual.objects.all().delete()
+            creados = ResumenVentasMensual.objects.bulk_create([
+                ResumenVentasMensual(
+                    mes=fila['mes'].date(),
+                    metodo_entrada=fila['metodo_entrada'],
+                    tipo_venta=fila['tipo_venta'],
+                    cantidad_ventas=fila['cantidad_ventas'],
+                    monto_total=fila['monto_total'] or 0,
+                )
+                for fila in filas
+            ], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(creados)} filas de resumen generadas.'))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.venta_transacciones.carritos import obtener_store
+
+
+class Command(BaseCommand):
+    help = 'Vuelca a la base de datos los carritos con cambios pendientes (CARRITO_STORE con escritura diferida)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=None, help='Máximo de entradas de la cola a procesar')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        volcados = obtener_store().volcar_pendientes(limite=options['limite'])
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f'{volcados} carritos volcados en {duracion:.2f}s.'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venta_transacciones', '0002_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentasMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('metodo_entrada', models.CharField(max_length=50)),
+                ('tipo_venta', models.CharField(max_length=50)),
+                ('cantidad_ventas', models.IntegerField(default=0)),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Resumen Mensual de Ventas',
+                'verbose_name_plural': 'Resúmenes Mensuales de Ventas',
+                'ordering': ['mes', 'metodo_entrada', 'tipo_venta'],
+                'constraints': [models.UniqueConstraint(fields=('mes', 'metodo_entrada', 'tipo_venta'), name='unique_resumen_mes_canal')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venta_transacciones', '0003_resumenventasmensual'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detalleventa',
+            name='fecha_creacion',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionar_lineas_repetidas(apps, schema_editor):
+    """Une las líneas repetidas (mismo carrito y producto) sumando cantidades."""
+    DetalleCarrito = apps.get_model('venta_transacciones', 'DetalleCarrito')
+    repetidas = DetalleCarrito.objects.values('carrito_id', 'producto_id') \
+        .annotate(n=Count('id'), primera=Min('id'), total=Sum('cantidad')).filter(n__gt=1)
+    for grupo in repetidas:
+        primera = DetalleCarrito.objects.get(id=grupo['primera'])
+        primera.cantidad = grupo['total']
+        primera.subtotal = primera.precio_unitario * grupo['total']
+        primera.save(update_fields=['cantidad', 'subtotal'])
+        DetalleCarrito.objects.filter(
+            carrito_id=grupo['carrito_id'], producto_id=grupo['producto_id']
+        ).exclude(id=primera.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venta_transacciones', '0004_alter_detalleventa_fecha_creacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_lineas_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='detallecarrito',
+            constraint=models.UniqueConstraint(fields=('carrito', 'producto'), name='unique_detalle_carrito_producto'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venta_transacciones', '0005_detallecarrito_unico'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(fields=['estado', 'fecha_actualizacion'], name='carrito_estado_fecha'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from apps.catalogo.models import Producto, Cliente
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -51,7 +53,7 @@ class DetalleVenta(models.Model):
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
 
     subtotal = models.DecimalField(max_digits=12, decimal_places=2) 
-    fecha_creacion = models.DateTimeField(default=timezone.now)
+    fecha_creacion = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['id']
@@ -78,6 +80,10 @@ class Carrito(models.Model):
         ordering = ['-fecha_actualizacion']
         verbose_name = 'Carrito'
         verbose_name_plural = 'Carritos'
+        indexes = [
+            # Barrido por lotes de carritos inactivos/antiguos (barrer_carritos)
+            models.Index(fields=['estado', 'fecha_actualizacion'], name='carrito_estado_fecha'),
+        ]
 
     def __str__(self):
         return f"Carrito {self.id} de {self.cliente.usuario.correo} ({self.estado})"
@@ -100,6 +106,10 @@ class DetalleCarrito(models.Model):
         ordering = ['-fecha_agregada']
         verbose_name = 'Detalle de Carrito'
         verbose_name_plural = 'Detalles de Carritos'
+        constraints = [
+            # Una línea por producto: permite el upsert atómico (utils.upsert_linea_carrito)
+            models.UniqueConstraint(fields=['carrito', 'producto'], name='unique_detalle_carrito_producto'),
+        ]
 
     def __str__(self):
         return f"Carrito {self.carrito.id} - Producto {self.producto.nombre}"
@@ -143,3 +153,56 @@ class Pago(models.Model):
     
     def __str__(self):
         return f'Pago #{self.id} (Venta #{self.venta.id}) - Bs{self.monto} ({self.estado})'
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta almacenada para un header 'Idempotency-Key' (reintentos de la app móvil).
+    La fila se inserta en la misma transacción que la venta: un reintento
+    concurrente con la misma clave queda esperando en el índice único hasta
+    que la primera petición confirma (y entonces reproduce su respuesta).
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='claves_idempotencia')
+    clave = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)
+
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    fecha_creacion = models.DateTimeField(default=timezone.now)
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Clave de Idempotencia'
+        verbose_name_plural = 'Claves de Idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='unique_clave_idempotencia_usuario'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} ({self.endpoint})"
+
+
+class ResumenVentasMensual(models.Model):
+    """
+    Acumulado mensual de ventas por canal (metodo_entrada) y tipo de venta.
+    Se actualiza en la misma transacción que cada Venta (ver signals.py) y
+    se reconstruye con 'python manage.py recalcular_resumen_ventas'.
+    """
+    mes = models.DateField()  # Primer día del mes (zona horaria local)
+    metodo_entrada = models.CharField(max_length=50)
+    tipo_venta = models.CharField(max_length=50)
+
+    cantidad_ventas = models.IntegerField(default=0)
+    monto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['mes', 'metodo_entrada', 'tipo_venta']
+        verbose_name = 'Resumen Mensual de Ventas'
+        verbose_name_plural = 'Resúmenes Mensuales de Ventas'
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'metodo_entrada', 'tipo_venta'], name='unique_resumen_mes_canal'),
+        ]
+
+    def __str__(self):
+        return f"{self.mes:%Y-%m} {self.metodo_entrada}/{self.tipo_venta}: {self.cantidad_ventas} ventas"
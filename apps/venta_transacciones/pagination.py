@@ -0,0 +1,10 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class HistorialComprasPagination(PageNumberPagination):
+    """
+    Paginación del historial de compras (ej. ?page=2&page_size=20).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -13,17 +13,67 @@ class DetalleVentaSerializer(serializers.ModelSerializer):
             'cantidad', 'precio_unitario', 'subtotal'
         ]
 
-class VentaReadSerializer(serializers.ModelSerializer):
+def campos_pedidos(request):
+    """
+    Lee ?fields=id,fecha_venta,... y ?expand=detalles del request.
+    Devuelve el conjunto de campos pedidos, o None si no se envió 'fields'
+    (representación completa, como siempre).
+    """
+    if request is None or not request.query_params.get('fields'):
+        return None
+    campos = set()
+    for parametro in ('fields', 'expand'):
+        campos.update(c.strip() for c in request.query_params.get(parametro, '').split(',') if c.strip())
+    return campos
+
+
+class CamposDinamicosMixin:
+    """
+    Quita del serializador los campos que no se pidieron con ?fields= / ?expand=.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_pedidos(self.context.get('request'))
+        if campos is not None:
+            for nombre in set(self.fields) - campos:
+                self.fields.pop(nombre)
+
+
+class ConstanteField(serializers.Field):
+    """Campo de solo lectura con un valor fijo (no toca la instancia)."""
+    def __init__(self, valor, **kwargs):
+        self.valor = valor
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return self.valor
+
+
+class VentaReadSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializador para LECTURA de ventas con todos los detalles"""
     detalles = DetalleVentaSerializer(many=True, read_only=True)
     total_venta = serializers.DecimalField(source='total', max_digits=10, decimal_places=2, read_only=True)
     metodo_pago = serializers.CharField(source='metodo_entrada', read_only=True)
     
     # Campos adicionales que el frontend espera pero que no están en el modelo
-    estado = serializers.SerializerMethodField()
-    descuento = serializers.SerializerMethodField()
-    notas = serializers.SerializerMethodField()
+    estado = ConstanteField('Completada')  # 'Completada' por defecto para ventas existentes
+    descuento = ConstanteField(0.0)  # 0 como descuento por defecto
+    notas = ConstanteField(None)
     
+    # Columnas de Venta que necesita cada campo (para .only() en el ViewSet)
+    COLUMNAS_MODELO = {
+        'id': 'id',
+        'cliente': 'cliente',
+        'fecha_venta': 'fecha_venta',
+        'total': 'total',
+        'total_venta': 'total',
+        'metodo_entrada': 'metodo_entrada',
+        'metodo_pago': 'metodo_entrada',
+        'tipo_venta': 'tipo_venta',
+    }
+
     class Meta:
         model = Venta
         fields = [
@@ -31,18 +81,6 @@ class VentaReadSerializer(serializers.ModelSerializer):
             'metodo_pago', 'tipo_venta', 'estado', 'descuento', 'notas', 'detalles'
         ]
         read_only_fields = ['fecha_venta']
-    
-    def get_estado(self, obj):
-        """Devuelve 'Completada' por defecto para ventas existentes"""
-        return 'Completada'
-    
-    def get_descuento(self, obj):
-        """Devuelve 0 como descuento por defecto"""
-        return 0.0
-    
-    def get_notas(self, obj):
-        """Devuelve None o string vacío para notas"""
-        return None
 
 # --- Serializador de Venta (Escritura) ---
 class VentaSerializer(serializers.ModelSerializer):
@@ -61,6 +99,21 @@ class VentaSerializer(serializers.ModelSerializer):
 
 
 # --- Serializadores de Carrito ---
+def info_producto(producto):
+    """
+    Datos del producto que una línea de carrito necesita y que no están ya en
+    producto_nombre / producto_imagen (producto con su categoría precargada).
+    """
+    return {
+        'codigo_producto': producto.codigo_producto,
+        'precio_venta': str(producto.precio_venta),
+        'stock_actual': producto.stock_actual,
+        'estado': producto.estado,
+        'categoria': producto.categoria_id,
+        'categoria_nombre': producto.categoria.nombre,
+    }
+
+
 class DetalleCarritoSerializer(serializers.ModelSerializer):
     producto_nombre = serializers.CharField(source='producto.nombre', read_only=True)
     producto_imagen = serializers.CharField(source='producto.imagen_url', read_only=True)
@@ -74,10 +127,9 @@ class DetalleCarritoSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['carrito', 'precio_unitario', 'subtotal']  # Se calculan automáticamente
     
-    def get_producto_info(self, obj):
-        """Devuelve información completa del producto"""
-        from apps.catalogo.serializers import ProductoSerializer
-        return ProductoSerializer(obj.producto).data
+    def get_producto_info(self, obj) -> dict:
+        # Con producto y categoría precargados: sin serializer ni consultas por línea
+        return info_producto(obj.producto)
 
 class CarritoSerializer(serializers.ModelSerializer):
     detalles = DetalleCarritoSerializer(many=True, read_only=True)  # CORREGIDO: sin source, usa el related_name 'detalles'
@@ -91,6 +143,23 @@ class CarritoSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['cliente', 'fecha_creacion', 'estado', 'origen']  # El cliente se asigna automáticamente
 
+class OperacionCarritoSerializer(serializers.Serializer):
+    """Una operación del lote: agregar (suma), fijar (0 quita) o quitar."""
+    tipo = serializers.ChoiceField(choices=['agregar', 'fijar', 'quitar'])
+    producto = serializers.IntegerField(min_value=1)
+    cantidad = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data['tipo'] != 'quitar' and data.get('cantidad') is None:
+            raise serializers.ValidationError({'cantidad': 'La cantidad es requerida'})
+        if data['tipo'] == 'agregar' and data['cantidad'] <= 0:
+            raise serializers.ValidationError({'cantidad': 'La cantidad debe ser mayor a 0.'})
+        return data
+
+
+class OperacionesCarritoSerializer(serializers.Serializer):
+    operaciones = OperacionCarritoSerializer(many=True, allow_empty=False, max_length=200)
+
 class PagoSerializer(serializers.ModelSerializer):
     venta = VentaSerializer(read_only=True)
     venta_id = serializers.PrimaryKeyRelatedField(queryset=Venta.objects.all(), source='venta', write_only=True)
@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Venta
+from apps.acceso_seguridad.condicional import invalidar_tabla_al_confirmar
+from .utils import acumular_resumen, mes_de, invalidar_historial
+
+
+@receiver(pre_save, sender=Venta)
+def guardar_valores_anteriores(sender, instance, **kwargs):
+    """
+    Antes de modificar una venta existente guarda los valores que afectan al
+    resumen mensual, para poder descontarlos en post_save.
+    """
+    instance._resumen_anterior = None
+    if instance.pk:
+        instance._resumen_anterior = Venta.objects.filter(pk=instance.pk).values(
+            'fecha_venta', 'metodo_entrada', 'tipo_venta', 'total'
+        ).first()
+
+
+@receiver(post_save, sender=Venta)
+def actualizar_resumen_mensual(sender, instance, created, **kwargs):
+    """
+    Mantiene ResumenVentasMensual en la misma transacción que la venta.
+    """
+    anterior = getattr(instance, '_resumen_anterior', None)
+
+    if not created and anterior:
+        sin_cambios = (
+            mes_de(anterior['fecha_venta']) == mes_de(instance.fecha_venta)
+            and anterior['metodo_entrada'] == instance.metodo_entrada
+            and anterior['tipo_venta'] == instance.tipo_venta
+            and anterior['total'] == instance.total
+        )
+        if sin_cambios:
+            return
+        acumular_resumen(anterior['fecha_venta'], anterior['metodo_entrada'], anterior['tipo_venta'], -1, -anterior['total'])
+
+    acumular_resumen(instance.fecha_venta, instance.metodo_entrada, instance.tipo_venta, 1, instance.total)
+
+
+@receiver(post_delete, sender=Venta)
+def descontar_resumen_mensual(sender, instance, **kwargs):
+    acumular_resumen(instance.fecha_venta, instance.metodo_entrada, instance.tipo_venta, -1, -instance.total)
+
+
+@receiver(post_save, sender=Venta)
+@receiver(post_delete, sender=Venta)
+def invalidar_historial_cliente(sender, instance, **kwargs):
+    """
+    Invalida la caché de 'mis_compras' del cliente cuando la venta confirma.
+    """
+    if instance.cliente_id:
+        cliente_id = instance.cliente_id
+        transaction.on_commit(lambda: invalidar_historial(cliente_id))
+
+
+@receiver(post_save, sender=Venta)
+@receiver(post_delete, sender=Venta)
+def invalidar_tabla_ventas(sender, instance, **kwargs):
+    """
+    Sello 'ventas' para el GET condicional del listado. Los detalles se crean
+    con bulk_create en la misma transacción que la venta, así que basta con Venta.
+    """
+    invalidar_tabla_al_confirmar('ventas')
@@ -1,3 +1,876 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.acceso_seguridad.models import Usuario
+from apps.catalogo.models import Categoria, Producto
+from .models import Venta, DetalleVenta, Carrito, DetalleCarrito, ClaveIdempotencia, ResumenVentasMensual
+from .carritos import obtener_store, _bloqueo
+from . import comprobantes
+
+
+class CrearVentaDesdeCarritoTests(TestCase):
+    """
+    La conversión carrito -> venta debe costar el mismo número de consultas
+    sin importar el tamaño del carrito.
+    """
+    url = '/api/carritos/crear_venta_desde_carrito/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Electrodomésticos')
+        cls.productos = Producto.objects.bulk_create([
+            Producto(
+                codigo_producto=f'P-{i}',
+                nombre=f'Producto {i}',
+                precio_venta=10,
+                stock_actual=100,
+                categoria=cls.categoria,
+            )
+            for i in range(200)
+        ])
+
+    def _cliente_con_carrito(self, lineas):
+        usuario = Usuario.objects.create_user(correo=f'cliente{lineas}@test.com', password='x', rol='CLIENTE')
+        carrito = Carrito.objects.create(cliente=usuario.cliente)
+        DetalleCarrito.objects.bulk_create([
+            DetalleCarrito(carrito=carrito, producto=producto, cantidad=2, precio_unitario=10, subtotal=20)
+            for producto in self.productos[:lineas]
+        ])
+        api = APIClient()
+        api.force_authenticate(usuario)
+        return api, carrito
+
+    def _checkout(self, lineas):
+        api, carrito = self._cliente_con_carrito(lineas)
+        with CaptureQueriesContext(connection) as queries:
+            response = api.post(self.url)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['detalles']), lineas)
+        self.assertFalse(DetalleCarrito.objects.filter(carrito=carrito).exists())
+        return len(queries)
+
+    def test_consultas_constantes(self):
+        consultas = {lineas: self._checkout(lineas) for lineas in (1, 10, 200)}
+        self.assertEqual(consultas[1], consultas[10], consultas)
+        self.assertEqual(consultas[1], consultas[200], consultas)
+
+    def test_descuenta_stock(self):
+        self._checkout(10)
+        stocks = Producto.objects.filter(id__in=[p.id for p in self.productos[:10]]).values_list('stock_actual', flat=True)
+        self.assertEqual(set(stocks), {98})
+        self.assertEqual(Venta.objects.get().total, 200)
+
+    def test_stock_insuficiente_no_crea_venta(self):
+        api, carrito = self._cliente_con_carrito(3)
+        DetalleCarrito.objects.filter(carrito=carrito).update(cantidad=500)
+        response = api.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data), 3)
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(DetalleCarrito.objects.filter(carrito=carrito).count(), 3)
+
+
+class CrearVentaTests(TestCase):
+    """Cada línea de la venta se valida ANTES de agrupar por producto."""
+    url = '/api/ventas/'
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Ventas')
+        cls.producto = Producto.objects.create(
+            codigo_producto='V-1', nombre='Mesa', precio_venta=10, stock_actual=10, categoria=categoria
+        )
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='vendedor@test.com', password='x', rol='CLIENTE'))
+
+    def _vender(self, detalles):
+        return self.api.post(self.url, {'detalles': detalles}, format='json')
+
+    def _sin_cambios(self):
+        self.assertFalse(DetalleVenta.objects.exists())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 10)
+
+    def test_cantidad_negativa_no_se_compensa_con_otra_linea(self):
+        response = self._vender([
+            {'producto_id': self.producto.id, 'cantidad': -1},
+            {'producto_id': self.producto.id, 'cantidad': 3},
+        ])
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertIn('Línea 1', str(response.data[0]))
+        self._sin_cambios()
+
+    def test_lineas_mal_formadas_son_400(self):
+        for detalles in (
+            [{'cantidad': 1}],
+            [{'producto_id': 'abc', 'cantidad': 1}],
+            [{'producto_id': self.producto.id}],
+            [{'producto_id': self.producto.id, 'cantidad': 1.5}],
+            ['no es un objeto'],
+        ):
+            with self.subTest(detalles=detalles):
+                self.assertEqual(self._vender(detalles).status_code, 400)
+        self._sin_cambios()
+
+    def test_lineas_repetidas_se_agrupan(self):
+        response = self._vender([
+            {'producto_id': self.producto.id, 'cantidad': 2},
+            {'producto_id': self.producto.id, 'cantidad': 3},
+        ])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(DetalleVenta.objects.count(), 2)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 5)
+
+
+class LecturaCarritoTests(TestCase):
+    """
+    Leer un carrito debe costar el mismo número de consultas con 1 o 50
+    líneas (producto y categoría vienen en un solo prefetch).
+    """
+    url = '/api/carritos/'
+
+    @classmethod
+    def setUpTestData(cls):
+        categorias = Categoria.objects.bulk_create([Categoria(nombre=f'Categoría {i}') for i in range(5)])
+        cls.productos = Producto.objects.bulk_create([
+            Producto(
+                codigo_producto=f'L-{i}',
+                nombre=f'Producto {i}',
+                precio_venta=10,
+                stock_actual=100,
+                categoria=categorias[i % 5],
+            )
+            for i in range(50)
+        ])
+
+    def _leer_carrito(self, lineas):
+        usuario = Usuario.objects.create_user(correo=f'lector{lineas}@test.com', password='x', rol='CLIENTE')
+        carrito = Carrito.objects.create(cliente=usuario.cliente)
+        DetalleCarrito.objects.bulk_create([
+            DetalleCarrito(carrito=carrito, producto=producto, cantidad=1, precio_unitario=10, subtotal=10)
+            for producto in self.productos[:lineas]
+        ])
+        api = APIClient()
+        api.force_authenticate(usuario)
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get(self.url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, len(queries)
+
+    def test_consultas_constantes(self):
+        _, consultas_1 = self._leer_carrito(1)
+        response, consultas_50 = self._leer_carrito(50)
+        self.assertEqual(consultas_1, consultas_50)
+        self.assertEqual(len(response.data[0]['detalles']), 50)
+
+    def test_linea_compacta(self):
+        response, _ = self._leer_carrito(1)
+        linea = response.data[0]['detalles'][0]
+        self.assertEqual(linea['producto_nombre'], 'Producto 0')
+        self.assertEqual(linea['producto_info']['categoria_nombre'], 'Categoría 0')
+        self.assertNotIn('nombre', linea['producto_info'])
+
+
+class AgregarAlCarritoTests(TestCase):
+    """Agregar al carrito es un upsert atómico sobre (carrito, producto) con el stock validado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Oficina')
+        cls.producto = Producto.objects.create(
+            codigo_producto='U-1', nombre='Silla', precio_venta=25, stock_actual=5, categoria=categoria
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(correo='upsert@test.com', password='x', rol='CLIENTE')
+        self.api = APIClient()
+        self.api.force_authenticate(self.usuario)
+
+    def _agregar(self, cantidad):
+        return self.api.post('/api/detalles-carrito/', {'producto': self.producto.id, 'cantidad': cantidad}, format='json')
+
+    def test_agregar_dos_veces_suma_en_una_linea(self):
+        self.assertEqual(self._agregar(2).status_code, 201)
+        response = self._agregar(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['cantidad'], 5)
+        self.assertEqual(response.data['subtotal'], '125.00')
+        detalle = DetalleCarrito.objects.get()
+        self.assertEqual((detalle.cantidad, detalle.subtotal), (5, 125))
+
+    def test_stock_insuficiente_no_escribe(self):
+        self._agregar(4)
+        response = self._agregar(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Ya tiene 4', response.data['detail'])
+        self.assertEqual(DetalleCarrito.objects.get().cantidad, 4)
+
+    def test_editar_linea_de_un_carrito_no_activo_es_404(self):
+        self._agregar(1)
+        viejo = DetalleCarrito.objects.get()
+        Carrito.objects.filter(id=viejo.carrito_id).update(estado=Carrito.EstadoCarrito.CONVERTIDO)
+        self._agregar(2)  # nuevo carrito activo con el mismo producto
+
+        response = self.api.patch(f'/api/detalles-carrito/{viejo.id}/', {'cantidad': 5}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.api.delete(f'/api/detalles-carrito/{viejo.id}/').status_code, 404)
+        activo = DetalleCarrito.objects.get(carrito__estado=Carrito.EstadoCarrito.ACTIVO)
+        self.assertEqual(activo.cantidad, 2)
+
+    def test_id_de_linea_no_numerico_es_404(self):
+        response = self.api.patch('/api/detalles-carrito/abc/', {'cantidad': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_linea_repetida_viola_la_restriccion(self):
+        self._agregar(1)
+        detalle = DetalleCarrito.objects.get()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DetalleCarrito.objects.create(
+                carrito=detalle.carrito, producto=self.producto, cantidad=1, precio_unitario=25, subtotal=25
+            )
+
+
+@override_settings(CARRITO_STORE='apps.venta_transacciones.carritos.CacheCarritoStore', COMPROBANTES_PRECALCULAR=False)
+class CacheCarritoStoreTests(TestCase):
+    """
+    Con escritura diferida (LocMem como reemplazo local de Redis) editar el
+    carrito no escribe en la base de datos hasta el volcado.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Hogar')
+        cls.productos = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'C-{i}', nombre=f'Producto {i}', precio_venta=10, stock_actual=5, categoria=categoria)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(correo='memoria@test.com', password='x', rol='CLIENTE')
+        self.api = APIClient()
+        self.api.force_authenticate(self.usuario)
+
+    def _agregar(self, producto, cantidad):
+        return self.api.post('/api/detalles-carrito/', {'producto': producto.id, 'cantidad': cantidad}, format='json')
+
+    def test_editar_no_escribe_en_bd(self):
+        self.assertEqual(self._agregar(self.productos[0], 2).status_code, 201)
+        response = self._agregar(self.productos[0], 1)
+        self.assertEqual(response.data['cantidad'], 3)
+        self.assertEqual(response.data['subtotal'], '30.00')
+        self.assertFalse(DetalleCarrito.objects.exists())
+
+    def test_stock_insuficiente(self):
+        response = self._agregar(self.productos[0], 6)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bloqueo_vencido_no_borra_el_de_otro(self):
+        clave = 'carrito:bloqueo:prueba'
+        with _bloqueo(clave):
+            # El bloqueo expiró y otro proceso lo tomó con su propio token
+            cache.set(clave, 42, 10)
+        self.assertEqual(cache.get(clave), 42)
+
+        cache.delete(clave)
+        with _bloqueo(clave):
+            self.assertIsNotNone(cache.get(clave))
+        self.assertIsNone(cache.get(clave))
+
+    def test_leer_vuelca_el_carrito(self):
+        self._agregar(self.productos[0], 2)
+        self._agregar(self.productos[1], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.get('/api/carritos/')
+        detalles = response.data[0]['detalles']
+        self.assertEqual(sorted(d['cantidad'] for d in detalles), [1, 2])
+        self.assertEqual(DetalleCarrito.objects.count(), 2)
+
+        # Los ids ya volcados sirven para editar por línea
+        detalle_id = DetalleCarrito.objects.get(producto=self.productos[0]).id
+        response = self.api.patch(f'/api/detalles-carrito/{detalle_id}/', {'cantidad': 4}, format='json')
+        self.assertEqual(response.data['cantidad'], 4)
+        self.assertEqual(DetalleCarrito.objects.get(id=detalle_id).cantidad, 2)
+
+    def test_volcado_por_lotes(self):
+        self._agregar(self.productos[0], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(obtener_store().volcar_pendientes(), 1)
+        self.assertEqual(DetalleCarrito.objects.get().cantidad, 2)
+        self.assertEqual(obtener_store().volcar_pendientes(), 0)
+
+    def test_checkout_vuelca_antes_de_vender(self):
+        self._agregar(self.productos[0], 2)
+        self._agregar(self.productos[2], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post('/api/carritos/crear_venta_desde_carrito/')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['detalles']), 2)
+        self.assertEqual(Venta.objects.get().total, 30)
+
+
+class OperacionesCarritoTests(TestCase):
+    """Un lote de cambios al carrito: todos o ninguno, con consultas fijas."""
+    url = '/api/carritos/operaciones/'
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Lote')
+        cls.productos = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'O-{i}', nombre=f'Producto {i}', precio_venta=10, stock_actual=5, categoria=categoria)
+            for i in range(20)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def _api(self, correo='lote@test.com'):
+        usuario = Usuario.objects.create_user(correo=correo, password='x', rol='CLIENTE')
+        api = APIClient()
+        api.force_authenticate(usuario)
+        return api
+
+    def test_aplica_en_orden(self):
+        p0, p1 = self.productos[:2]
+        response = self._api().post(self.url, {'operaciones': [
+            {'tipo': 'agregar', 'producto': p0.id, 'cantidad': 2},
+            {'tipo': 'agregar', 'producto': p1.id, 'cantidad': 1},
+            {'tipo': 'agregar', 'producto': p0.id, 'cantidad': 1},
+            {'tipo': 'fijar', 'producto': p1.id, 'cantidad': 0},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([(d['producto'], d['cantidad']) for d in response.data['detalles']], [(p0.id, 3)])
+        self.assertEqual(list(DetalleCarrito.objects.values_list('producto_id', 'cantidad')), [(p0.id, 3)])
+
+    def test_todo_o_nada(self):
+        api = self._api()
+        p0, p1, p2 = self.productos[:3]
+        api.post(self.url, {'operaciones': [{'tipo': 'agregar', 'producto': p0.id, 'cantidad': 1}]}, format='json')
+        response = api.post(self.url, {'operaciones': [
+            {'tipo': 'quitar', 'producto': p0.id},
+            {'tipo': 'agregar', 'producto': p1.id, 'cantidad': 1},
+            {'tipo': 'agregar', 'producto': p2.id, 'cantidad': 6},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['operacion'], 3)
+        self.assertEqual(list(DetalleCarrito.objects.values_list('producto_id', 'cantidad')), [(p0.id, 1)])
+
+    def test_consultas_constantes(self):
+        def medir(correo, productos):
+            api = self._api(correo)
+            operaciones = [{'tipo': 'agregar', 'producto': p.id, 'cantidad': 1} for p in productos]
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = api.post(self.url, {'operaciones': operaciones}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            return len(queries)
+
+        self.assertEqual(medir('uno@test.com', self.productos[:1]), medir('veinte@test.com', self.productos))
+
+
+class BarrerCarritosTests(TestCase):
+    """'barrer_carritos' abandona por inactividad real, no por antigüedad."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Barrido')
+        cls.productos = Producto.objects.bulk_create([
+            Producto(codigo_producto=f'B-{i}', nombre=f'Producto {i}', precio_venta=10, stock_actual=5, categoria=categoria)
+            for i in range(2)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def _cliente(self, correo):
+        usuario = Usuario.objects.create_user(correo=correo, password='x', rol='CLIENTE')
+        api = APIClient()
+        api.force_authenticate(usuario)
+        return api, usuario.cliente
+
+    def _envejecer(self, carrito, horas=100):
+        Carrito.objects.filter(id=carrito.id).update(fecha_actualizacion=timezone.now() - timedelta(hours=horas))
+
+    def _barrer(self):
+        call_command('barrer_carritos', stdout=StringIO())
+
+    def test_carrito_editado_recientemente_no_se_abandona(self):
+        api, cliente = self._cliente('activo@test.com')
+        api.post('/api/detalles-carrito/', {'producto': self.productos[0].id, 'cantidad': 1}, format='json')
+        carrito = Carrito.objects.get(cliente=cliente)
+        self._envejecer(carrito)
+
+        # Cada edición (agregar, cambiar cantidad, quitar, vaciar) cuenta como actividad
+        detalle = DetalleCarrito.objects.get(carrito=carrito)
+        for editar in (
+            lambda: api.post('/api/detalles-carrito/', {'producto': self.productos[1].id, 'cantidad': 1}, format='json'),
+            lambda: api.patch(f'/api/detalles-carrito/{detalle.id}/', {'cantidad': 2}, format='json'),
+            lambda: api.delete(f'/api/detalles-carrito/{detalle.id}/'),
+            lambda: api.post('/api/carritos/vaciar_carrito/'),
+        ):
+            self._envejecer(carrito)
+            editar()
+            self._barrer()
+            carrito.refresh_from_db()
+            self.assertEqual(carrito.estado, Carrito.EstadoCarrito.ACTIVO)
+
+    def test_agregar_rechazado_no_cuenta_como_actividad(self):
+        api, cliente = self._cliente('rechazado@test.com')
+        api.post('/api/detalles-carrito/', {'producto': self.productos[0].id, 'cantidad': 1}, format='json')
+        carrito = Carrito.objects.get(cliente=cliente)
+        self._envejecer(carrito)
+        antes = Carrito.objects.get(id=carrito.id).fecha_actualizacion
+
+        # Sin stock suficiente no se escribe la línea ni se marca el carrito
+        response = api.post('/api/detalles-carrito/', {'producto': self.productos[0].id, 'cantidad': 9}, format='json')
+        self.assertEqual(response.status_code, 400)
+        carrito.refresh_from_db()
+        self.assertEqual(carrito.fecha_actualizacion, antes)
+        self._barrer()
+        carrito.refresh_from_db()
+        self.assertEqual(carrito.estado, Carrito.EstadoCarrito.ABANDONADO)
+
+    def test_carrito_inactivo_se_abandona_y_luego_se_purga(self):
+        _, cliente = self._cliente('inactivo@test.com')
+        carrito = Carrito.objects.create(cliente=cliente)
+        self._envejecer(carrito)
+        self._barrer()
+        carrito.refresh_from_db()
+        self.assertEqual(carrito.estado, Carrito.EstadoCarrito.ABANDONADO)
+
+        self._envejecer(carrito, horas=24 * 100)
+        self._barrer()
+        self.assertFalse(Carrito.objects.filter(id=carrito.id).exists())
+
+    @override_settings(CARRITO_STORE='apps.venta_transacciones.carritos.CacheCarritoStore', COMPROBANTES_PRECALCULAR=False)
+    def test_cambios_en_memoria_no_se_pierden_al_abandonar(self):
+        api, cliente = self._cliente('memoria-barrido@test.com')
+        store = obtener_store()
+        api.post('/api/detalles-carrito/', {'producto': self.productos[0].id, 'cantidad': 1}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            store.volcar(cliente.id)
+        carrito = Carrito.objects.get(cliente=cliente)
+
+        # Una edición llega a la caché entre el volcado y el barrido
+        api.post('/api/detalles-carrito/', {'producto': self.productos[1].id, 'cantidad': 1}, format='json')
+        Carrito.objects.filter(id=carrito.id).update(estado=Carrito.EstadoCarrito.ABANDONADO)
+        store.descartar_abandonado(cliente.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            store.volcar(cliente.id)
+        activo = Carrito.objects.get(cliente=cliente, estado=Carrito.EstadoCarrito.ACTIVO)
+        self.assertEqual(activo.detalles.count(), 2)
+
+
+@override_settings(COMPROBANTES_PRECALCULAR=False)
+class IdempotenciaTests(TestCase):
+    """Un reintento con la misma 'Idempotency-Key' no vuelve a vender."""
+    url = '/api/ventas/'
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Idempotencia')
+        self.producto = Producto.objects.create(
+            codigo_producto='I-1', nombre='Cafetera', precio_venta=30, stock_actual=5, categoria=categoria
+        )
+        self.usuario = Usuario.objects.create_user(correo='reintento@test.com', password='x', rol='CLIENTE')
+        self.api = APIClient()
+        self.api.force_authenticate(self.usuario)
+
+    def _vender(self, clave, cantidad=2, url=None):
+        return self.api.post(url or self.url, {'detalles': [{'producto_id': self.producto.id, 'cantidad': cantidad}]},
+                             format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def _stock(self):
+        self.producto.refresh_from_db()
+        return self.producto.stock_actual
+
+    def test_reintento_reproduce_la_respuesta(self):
+        primera = self._vender('clave-1')
+        self.assertEqual(primera.status_code, 201, primera.data)
+        segunda = self._vender('clave-1')
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual((Venta.objects.count(), self._stock()), (1, 3))
+
+    def test_clave_usada_en_otro_endpoint_es_422(self):
+        self._vender('clave-2')
+        response = self.api.post('/api/carritos/crear_venta_desde_carrito/', HTTP_IDEMPOTENCY_KEY='clave-2')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual((Venta.objects.count(), self._stock()), (1, 3))
+
+    def test_un_error_se_puede_reintentar(self):
+        fallida = self._vender('clave-3', cantidad=9)
+        self.assertEqual(fallida.status_code, 400)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+        Producto.objects.filter(id=self.producto.id).update(stock_actual=10)
+        reintento = self._vender('clave-3', cantidad=9)
+        self.assertEqual(reintento.status_code, 201, reintento.data)
+        self.assertNotIn('Idempotent-Replayed', reintento)
+        self.assertEqual((Venta.objects.count(), self._stock()), (1, 1))
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_clave_vencida_se_acepta_otra_vez(self):
+        self._vender('clave-4')
+        ClaveIdempotencia.objects.update(expira=timezone.now() - timedelta(seconds=1))
+        response = self._vender('clave-4')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual((Venta.objects.count(), self._stock()), (2, 1))
+        self.assertGreater(ClaveIdempotencia.objects.get().expira, timezone.now())
+
+
+@override_settings(COMPROBANTES_PRECALCULAR=False)
+class IdempotenciaConcurrenteTests(TransactionTestCase):
+    """
+    Dos peticiones simultáneas con la misma clave: la segunda espera en el
+    índice único y, cuando la primera confirma, reproduce su respuesta.
+    """
+
+    def test_duplicado_concurrente_reproduce_la_primera(self):
+        categoria = Categoria.objects.create(nombre='Carrera')
+        producto = Producto.objects.create(
+            codigo_producto='R-1', nombre='Tostadora', precio_venta=20, stock_actual=5, categoria=categoria
+        )
+        usuario = Usuario.objects.create_user(correo='carrera@test.com', password='x', rol='CLIENTE')
+        insertada = threading.Event()
+
+        def primera_peticion():
+            # Simula la primera petición: la clave queda insertada sin confirmar
+            try:
+                with transaction.atomic():
+                    registro = ClaveIdempotencia.objects.create(
+                        usuario=usuario, clave='carrera', endpoint='POST /api/ventas/',
+                        expira=timezone.now() + timedelta(hours=1)
+                    )
+                    insertada.set()
+                    time.sleep(0.5)  # la segunda petición queda bloqueada en el índice
+                    registro.status_code = 201
+                    registro.respuesta = {'id': 999, 'total': '20.00'}
+                    registro.save(update_fields=['status_code', 'respuesta'])
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=primera_peticion)
+        hilo.start()
+        insertada.wait(5)
+
+        api = APIClient()
+        api.force_authenticate(usuario)
+        response = api.post('/api/ventas/', {'detalles': [{'producto_id': producto.id, 'cantidad': 1}]},
+                            format='json', HTTP_IDEMPOTENCY_KEY='carrera')
+        hilo.join()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json(), {'id': 999, 'total': '20.00'})
+        self.assertFalse(Venta.objects.exists())
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock_actual, 5)
+
+
+class ComprobanteTests(TestCase):
+    """El PDF se genera una vez por contenido, fuera del request, y se sirve con ETag."""
+
+    def setUp(self):
+        # Los PDFs de las pruebas no deben quedar en el MEDIA_ROOT del proyecto
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+        categoria = Categoria.objects.create(nombre='Comprobantes')
+        self.producto = Producto.objects.create(
+            codigo_producto='P-1', nombre='Impresora', precio_venta=90, stock_actual=10, categoria=categoria
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='pdf@test.com', password='x', rol='ADMIN'))
+
+    def _vender(self):
+        response = self.api.post('/api/ventas/', {'detalles': [{'producto_id': self.producto.id, 'cantidad': 1}]},
+                                 format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Venta.objects.get(id=response.data['id'])
+
+    def _esperar_pdf(self, hash_contenido):
+        ruta = comprobantes.ruta_comprobante(hash_contenido)
+        limite = time.monotonic() + 10
+        while not default_storage.exists(ruta):
+            self.assertLess(time.monotonic(), limite, 'el pool no guardó el comprobante')
+            time.sleep(0.05)
+        return ruta
+
+    def _hash(self, venta):
+        return comprobantes.hash_comprobante(comprobantes.datos_comprobante(venta))
+
+    def test_la_venta_precalcula_el_pdf_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            venta = self._vender()
+        ruta = comprobantes.ruta_comprobante(self._hash(venta))
+        self.assertFalse(default_storage.exists(ruta))
+
+        for callback in callbacks:
+            callback()
+        self._esperar_pdf(self._hash(venta))
+
+        response = self.api.get(f'/api/ventas/{venta.id}/comprobante/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    @override_settings(COMPROBANTES_PRECALCULAR=False)
+    def test_sin_pdf_responde_202_sin_esperar_al_render(self):
+        venta = self._vender()
+        response = self.api.get(f'/api/ventas/{venta.id}/comprobante/')
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('Retry-After', response)
+
+        self._esperar_pdf(self._hash(venta))
+        self.assertEqual(self.api.get(f'/api/ventas/{venta.id}/comprobante/').status_code, 200)
+
+    @override_settings(COMPROBANTES_PRECALCULAR=False)
+    def test_mismo_contenido_reutiliza_el_archivo(self):
+        venta = self._vender()
+        datos = comprobantes.datos_comprobante(venta)
+        hash_contenido = comprobantes.hash_comprobante(datos)
+        comprobantes.guardar_comprobante(hash_contenido, comprobantes.dibujar_comprobante(datos))
+
+        # Guardar otra vez el mismo hash no crea un segundo archivo
+        comprobantes.guardar_comprobante(hash_contenido, b'otro contenido')
+        _, archivos = default_storage.listdir(comprobantes.CARPETA)
+        self.assertEqual(archivos, [f'{hash_contenido}.pdf'])
+
+        response = self.api.get(f'/api/ventas/{venta.id}/comprobante/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertNotIn(hash_contenido, comprobantes._en_curso)
+
+    @override_settings(COMPROBANTES_PRECALCULAR=False)
+    def test_etag_304(self):
+        venta = self._vender()
+        etag = f'"{self._hash(venta)}"'
+        response = self.api.get(f'/api/ventas/{venta.id}/comprobante/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # El 304 no necesita el PDF: no se encola ningún render
+        self.assertNotIn(self._hash(venta), comprobantes._en_curso)
+
+
+class ResumenVentasMensualTests(TestCase):
+    """El resumen acumulado coincide con agregar Venta después de cada cambio."""
+
+    def _agregado(self):
+        filas = Venta.objects.annotate(mes=TruncMonth('fecha_venta')) \
+                             .values('mes', 'metodo_entrada', 'tipo_venta') \
+                             .annotate(cantidad=Count('id'), monto=Sum('total')).order_by()
+        return {(f['mes'].date(), f['metodo_entrada'], f['tipo_venta']): (f['cantidad'], f['monto']) for f in filas}
+
+    def _resumen(self):
+        # Las filas que quedan en cero (tras descontar) equivalen a no tener ventas
+        return {
+            (r.mes, r.metodo_entrada, r.tipo_venta): (r.cantidad_ventas, r.monto_total)
+            for r in ResumenVentasMensual.objects.exclude(cantidad_ventas=0)
+        }
+
+    def assertResumenCoincide(self):
+        self.assertEqual(self._resumen(), self._agregado())
+
+    def test_crear_modificar_y_borrar(self):
+        enero = timezone.make_aware(datetime(2025, 1, 15, 12))
+        web = Venta.objects.create(fecha_venta=enero, metodo_entrada=Venta.MetodoEntrada.WEB, total=100)
+        movil = Venta.objects.create(fecha_venta=enero, total=40)
+        Venta.objects.create(fecha_venta=enero, metodo_entrada=Venta.MetodoEntrada.WEB, total=10)
+        self.assertResumenCoincide()
+
+        # Cambia el total sin cambiar de mes
+        web.total = 150
+        web.save()
+        self.assertResumenCoincide()
+
+        # Cambia de mes y de canal: sale de un grupo y entra en otro
+        movil.fecha_venta = timezone.make_aware(datetime(2025, 2, 3, 9))
+        movil.metodo_entrada = Venta.MetodoEntrada.MOSTRADOR
+        movil.save()
+        self.assertResumenCoincide()
+        self.assertEqual(len(self._agregado()), 2)
+
+        web.delete()
+        self.assertResumenCoincide()
+        movil.delete()
+        self.assertResumenCoincide()
+
+    def test_guardar_sin_cambios_no_acumula(self):
+        venta = Venta.objects.create(total=25)
+        venta.save()
+        venta.save()
+        self.assertResumenCoincide()
+
+    def test_recalcular_reproduce_el_acumulado(self):
+        for total in (5, 7):
+            Venta.objects.create(total=total)
+        esperado = self._resumen()
+        call_command('recalcular_resumen_ventas', stdout=StringIO())
+        self.assertEqual(self._resumen(), esperado)
+
+
+@override_settings(COMPROBANTES_PRECALCULAR=False)
+class ListadoVentasTests(TestCase):
+    """Listado de ventas: forma pedida (?fields / ?expand), búsqueda y exportación."""
+    url = '/api/ventas/'
+
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='Listado')
+        self.producto = Producto.objects.create(
+            codigo_producto='L-1', nombre='Monitor', precio_venta=100, stock_actual=50, categoria=categoria
+        )
+        self.cliente = Usuario.objects.create_user(
+            correo='ana.perez@test.com', password='x', rol='CLIENTE', nombre='Ana', apellido='Pérez'
+        ).cliente
+        self.api = APIClient()
+        self.api.force_authenticate(Usuario.objects.create_user(correo='jefe@test.com', password='x', rol='ADMIN'))
+
+    def _crear_ventas(self, cantidad, cliente=None):
+        for _ in range(cantidad):
+            venta = Venta.objects.create(cliente=cliente or self.cliente, total=200)
+            DetalleVenta.objects.create(venta=venta, producto=self.producto, cantidad=2, precio_unitario=100, subtotal=200)
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in consultas.captured_queries]
+
+    def test_fields_solo_lee_las_columnas_pedidas(self):
+        self._crear_ventas(2)
+        response, consultas = self._consultas(f'{self.url}?fields=id,total')
+        self.assertEqual([set(fila) for fila in response.data], [{'id', 'total'}] * 2)
+
+        tabla_detalles = DetalleVenta._meta.db_table
+        self.assertFalse([sql for sql in consultas if tabla_detalles in sql])
+        select_ventas = next(sql for sql in consultas if f'FROM "{Venta._meta.db_table}"' in sql)
+        self.assertNotIn('"metodo_entrada"', select_ventas)
+
+    def test_expand_detalles_usa_un_solo_prefetch(self):
+        self._crear_ventas(1)
+        _, pocas = self._consultas(f'{self.url}?fields=id&expand=detalles')
+        self._crear_ventas(4)
+        response, muchas = self._consultas(f'{self.url}?fields=id&expand=detalles')
+
+        self.assertEqual(set(response.data[0]), {'id', 'detalles'})
+        self.assertEqual(response.data[0]['detalles'][0]['cantidad'], 2)
+        # Mismo número de consultas con 1 o 5 ventas: sin N+1 por detalle ni producto
+        self.assertEqual(len(muchas), len(pocas))
+
+    def test_exportar_csv_en_streaming(self):
+        self._crear_ventas(2)
+        otro = Usuario.objects.create_user(correo='otro@test.com', password='x', rol='CLIENTE').cliente
+        self._crear_ventas(1, cliente=otro)
+
+        response = self.api.get(f'{self.url}exportar/?search=ana.perez')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="ventas.csv"')
+
+        lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lineas[0], 'id,fecha_venta,cliente_id,cliente_correo,metodo_entrada,tipo_venta,total')
+        filas = [linea.split(',') for linea in lineas[1:]]
+        ids = list(Venta.objects.filter(cliente=self.cliente).order_by('id').values_list('id', flat=True))
+        self.assertEqual([int(fila[0]) for fila in filas], ids)
+        self.assertEqual({(fila[3], fila[6]) for fila in filas}, {('ana.perez@test.com', '200.00')})
+
+    def test_busqueda_por_cliente_sin_distinguir_mayusculas(self):
+        self._crear_ventas(1)
+        otro = Usuario.objects.create_user(
+            correo='luis@test.com', password='x', rol='CLIENTE', nombre='Luis', apellido='Gómez'
+        ).cliente
+        self._crear_ventas(1, cliente=otro)
+
+        for termino in ('pÉrez', 'ANA', 'perez@TEST'):
+            response, consultas = self._consultas(f'{self.url}?fields=id,cliente&search={termino}')
+            self.assertEqual([fila['cliente'] for fila in response.data], [self.cliente.id], termino)
+
+        # El filtro se expresa como UPPER(columna) LIKE UPPER(...), la forma de los índices trigram
+        select_ventas = next(sql for sql in consultas if f'FROM "{Venta._meta.db_table}"' in sql)
+        self.assertIn(f'UPPER("{Usuario._meta.db_table}"."correo"::text) LIKE UPPER(', select_ventas)
+
+
+@override_settings(COMPROBANTES_PRECALCULAR=False)
+class MisComprasTests(TestCase):
+    """Historial del cliente: cacheado y con ETag, invalidado por ventas y productos."""
+    url = '/api/ventas/mis_compras/'
+
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='Historial')
+        self.producto = Producto.objects.create(
+            codigo_producto='H-1', nombre='Teclado', precio_venta=20, stock_actual=10, categoria=categoria
+        )
+        self.usuario = Usuario.objects.create_user(correo='historial@test.com', password='x', rol='CLIENTE')
+        self.api = APIClient()
+        self.api.force_authenticate(self.usuario)
+        self._vender()
+
+    def _vender(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post('/api/ventas/', {
+                'cliente': self.usuario.cliente.id,
+                'detalles': [{'producto_id': self.producto.id, 'cantidad': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def _listar(self, **encabezados):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.api.get(self.url, **encabezados)
+        tabla = Venta._meta.db_table
+        return response, [q for q in consultas.captured_queries if f'FROM "{tabla}"' in q['sql']]
+
+    def test_etag_304_sin_consultar_ventas(self):
+        primera, _ = self._listar()
+        self.assertEqual(primera.status_code, 200)
+        response, consultas = self._listar(HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(consultas, [])
+
+    def test_segunda_lectura_sale_de_la_cache(self):
+        primera, consultas = self._listar()
+        self.assertTrue(consultas)
+        segunda, consultas = self._listar()
+        self.assertEqual(consultas, [])
+        self.assertEqual(segunda.data, primera.data)
+
+    def test_venta_nueva_invalida(self):
+        primera, _ = self._listar()
+        self._vender()
+        response, _ = self._listar(HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    def test_cambio_de_producto_invalida(self):
+        primera, _ = self._listar()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.nombre = 'Teclado mecánico'
+            self.producto.save()
+        response, _ = self._listar(HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['detalles'][0]['producto_nombre'], 'Teclado mecánico')
@@ -0,0 +1,152 @@
+from decimal import Decimal
+
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from apps.catalogo.models import Producto
+from apps.catalogo.utils import reservar_stock
+from .comprobantes import programar_comprobante
+from .models import Venta, DetalleVenta, Carrito, DetalleCarrito, ResumenVentasMensual
+
+
+def convertir_carrito_en_venta(carrito, cliente):
+    """
+    Convierte un carrito en una Venta con un número FIJO de consultas,
+    sin importar cuántas líneas tenga (debe llamarse dentro de una transacción):
+
+    1. Lee las líneas del carrito (una consulta, solo las columnas necesarias).
+    2. Calcula el total en la base de datos.
+    3. Bloquea y descuenta el stock de todos los productos (reservar_stock).
+    4. Inserta la venta y todos sus detalles con un bulk_create.
+    5. Vacía el carrito con un solo DELETE y lo marca como convertido.
+
+    Devuelve la venta creada o None si el carrito está vacío.
+    """
+    detalles_carrito = DetalleCarrito.objects.filter(carrito=carrito)
+    lineas = list(detalles_carrito.values_list('producto_id', 'cantidad', 'precio_unitario', 'subtotal'))
+    if not lineas:
+        return None
+
+    total_calculado = detalles_carrito.aggregate(total=Sum('subtotal'))['total']
+
+    reservar_stock([(producto_id, cantidad) for producto_id, cantidad, _, _ in lineas])
+
+    venta = Venta.objects.create(
+        cliente=cliente,
+        total=total_calculado,
+        metodo_entrada='carrito',
+        tipo_venta='online'
+    )
+
+    DetalleVenta.objects.bulk_create([
+        DetalleVenta(
+            venta=venta,
+            producto_id=producto_id,
+            cantidad=cantidad,
+            precio_unitario=precio_unitario,
+            subtotal=subtotal
+        )
+        for producto_id, cantidad, precio_unitario, subtotal in lineas
+    ])
+
+    detalles_carrito.delete()
+    Carrito.objects.filter(id=carrito.id).update(
+        estado=Carrito.EstadoCarrito.CONVERTIDO,
+        fecha_actualizacion=timezone.now()
+    )
+
+    programar_comprobante(venta)
+
+    return venta
+
+
+def mes_de(fecha):
+    """Primer día del mes de 'fecha' en la zona horaria local (igual que TruncMonth)."""
+    return timezone.localtime(fecha).date().replace(day=1)
+
+
+def acumular_resumen(fecha_venta, metodo_entrada, tipo_venta, cantidad, monto):
+    """
+    Suma (o resta, con valores negativos) una venta al resumen mensual con un
+    único INSERT ... ON CONFLICT DO UPDATE atómico.
+    """
+    tabla = connection.ops.quote_name(ResumenVentasMensual._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {tabla} (mes, metodo_entrada, tipo_venta, cantidad_ventas, monto_total)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (mes, metodo_entrada, tipo_venta) DO UPDATE SET
+                cantidad_ventas = {tabla}.cantidad_ventas + EXCLUDED.cantidad_ventas,
+                monto_total = {tabla}.monto_total + EXCLUDED.monto_total
+            """,
+            [mes_de(fecha_venta), metodo_entrada, tipo_venta, cantidad, Decimal(str(monto))]
+        )
+
+
+def upsert_linea_carrito(carrito_id, producto_id, cantidad, sumar=True):
+    """
+    Agrega (sumar=True) o fija la cantidad de un producto en el carrito con
+    un único INSERT ... ON CONFLICT (carrito, producto) DO UPDATE. El stock
+    se valida en la misma sentencia: si la cantidad final supera
+    stock_actual (o el producto no existe) no se escribe la línea. La misma
+    sentencia marca la actividad del carrito (fecha_actualizacion, que usa
+    'barrer_carritos'), solo si la línea se escribió.
+
+    Una línea nueva toma el precio_venta actual; una existente conserva su
+    precio_unitario. Devuelve (detalle_id, cantidad, precio_unitario,
+    subtotal) o None si no se pudo escribir.
+    """
+    tabla = connection.ops.quote_name(DetalleCarrito._meta.db_table)
+    carritos = connection.ops.quote_name(Carrito._meta.db_table)
+    productos = connection.ops.quote_name(Producto._meta.db_table)
+    nueva = f"{tabla}.cantidad + EXCLUDED.cantidad" if sumar else "EXCLUDED.cantidad"
+    ahora = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH upsert AS (
+                INSERT INTO {tabla} (carrito_id, producto_id, cantidad, precio_unitario, subtotal, fecha_agregada)
+                SELECT %s, p.id, %s, p.precio_venta, p.precio_venta * %s, %s
+                FROM {productos} p
+                WHERE p.id = %s AND p.stock_actual >= %s
+                ON CONFLICT (carrito_id, producto_id) DO UPDATE SET
+                    cantidad = {nueva},
+                    subtotal = {tabla}.precio_unitario * ({nueva})
+                WHERE {nueva} <= (SELECT stock_actual FROM {productos} WHERE id = EXCLUDED.producto_id)
+                RETURNING id, cantidad, precio_unitario, subtotal
+            ), actividad AS (
+                UPDATE {carritos} SET fecha_actualizacion = %s
+                WHERE id = %s AND EXISTS (SELECT 1 FROM upsert)
+            )
+            SELECT id, cantidad, precio_unitario, subtotal FROM upsert
+            """,
+            [carrito_id, cantidad, cantidad, ahora, producto_id, cantidad, ahora, carrito_id]
+        )
+        return cursor.fetchone()
+
+
+def _clave_version_historial(cliente_id):
+    return f"mis_compras:version:{cliente_id}"
+
+
+def version_historial(cliente_id):
+    """
+    Token de versión del historial de compras de un cliente. Cambia cada vez
+    que el cliente tiene una venta nueva; forma parte de la clave de caché y
+    del ETag de 'mis_compras'.
+    """
+    clave = _clave_version_historial(cliente_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, str(time.time_ns()), None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_historial(cliente_id):
+    cache.set(_clave_version_historial(cliente_id), str(time.time_ns()), None)
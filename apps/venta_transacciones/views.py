@@ -3,11 +3,11 @@ from django.shortcuts import render, get_object_or_404
 from django.conf import settings
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import VentaFilter
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 import stripe
+import hashlib
+from django.core.cache import cache
 
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
@@ -17,14 +17,24 @@ from rest_framework import viewsets, permissions, status, filters
 
 from .models import *
 from .serializers import *
+from .utils import convertir_carrito_en_venta, version_historial
+from .pagination import HistorialComprasPagination
+from .exportaciones import respuesta_exportacion, FORMATOS, COLUMNAS_VENTA, COLUMNAS_DETALLE
+from .idempotencia import idempotente
+from .carritos import obtener_store
+from .comprobantes import datos_comprobante, hash_comprobante, obtener_comprobante, programar_comprobante, generar_zip
 from apps.catalogo.models import Producto
-from django.db.models.functions import TruncMonth
-from django.db.models import Count, Sum
+from apps.catalogo.utils import reservar_stock, validar_pedidos
+from apps.acceso_seguridad.permissions import IsAdminRole
+from apps.acceso_seguridad.condicional import RespuestaCondicionalMixin, version_tabla
+from django.db.models import Count, Sum, Prefetch
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime
 
 # ViewSet para Venta
-class VentaViewSet(viewsets.ModelViewSet):
+class VentaViewSet(RespuestaCondicionalMixin, viewsets.ModelViewSet):
+    # list/retrieve responden 304 mientras no cambien ventas ni productos
+    tablas_condicionales = ('ventas', 'productos')
     queryset = Venta.objects.select_related('cliente__usuario').prefetch_related('detalles__producto').all().order_by('-fecha_venta')
     permission_classes = [permissions.IsAuthenticated] 
 
@@ -38,130 +48,202 @@ class VentaViewSet(viewsets.ModelViewSet):
             return VentaReadSerializer
         return VentaSerializer
 
+    def get_queryset(self):
+        """
+        En list/retrieve/mis_compras la consulta se adapta a la forma pedida:
+        ?fields=id,fecha_venta,cliente,total -> solo esas columnas y sin detalles.
+        ?expand=detalles (o 'detalles' en fields) -> un solo prefetch de detalles+producto.
+        """
+        if self.action not in ('list', 'retrieve', 'mis_compras'):
+            return super().get_queryset()
+
+        queryset = Venta.objects.all().order_by('-fecha_venta')
+        campos = campos_pedidos(self.request)
+
+        if campos is not None:
+            columnas = {'id'} | {
+                columna for campo, columna in VentaReadSerializer.COLUMNAS_MODELO.items() if campo in campos
+            }
+            queryset = queryset.only(*columnas)
+
+        if campos is None or 'detalles' in campos:
+            queryset = queryset.prefetch_related(
+                Prefetch('detalles', queryset=DetalleVenta.objects.select_related('producto').only(
+                    'id', 'venta', 'producto', 'cantidad', 'precio_unitario', 'subtotal',
+                    'producto__nombre', 'producto__imagen_url'
+                ))
+            )
+        return queryset
+
     @action(detail=True, methods=['get'], url_path='comprobante')
     def generar_comprobante(self, request, pk=None):
         """
-        Genera una Nota de Venta (Comprobante) en PDF para una venta específica (CU-14).
+        Devuelve la Nota de Venta (Comprobante) en PDF de una venta (CU-14).
+        Las ventas no cambian: el PDF se genera una sola vez (en el pool de
+        procesos), se guarda por hash de contenido y se sirve con ETag.
+        Si aún no está generado responde 202 con Retry-After en vez de
+        bloquear el request esperando al render.
         """
         try:
             # 1. Obtener los datos de la Venta
             venta = self.get_object() # Obtiene la venta por su PK (ej. /api/ventas/23/...)
-            cliente = venta.cliente.usuario
-            detalles = venta.detalles.all()
-
-            # 2. Configurar la respuesta HTTP como un PDF
-            response = HttpResponse(content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="nota_venta_{venta.id}.pdf"'
-
-            # 3. Crear el PDF con ReportLab
-            p = canvas.Canvas(response, pagesize=letter)
-            width, height = letter # (8.5 x 11 pulgadas)
-            
-            p.setFont("Helvetica-Bold", 16)
-            p.drawString(1 * inch, height - 1 * inch, "SmartSales365 - NOTA DE VENTA")
-
-            p.setFont("Helvetica", 12)
-            p.drawString(1 * inch, height - 1.5 * inch, f"Venta ID: {venta.id}")
-            p.drawString(1 * inch, height - 1.7 * inch, f"Fecha: {venta.fecha_venta.strftime('%d/%m/%Y %H:%M')}")
-            
-            p.setFont("Helvetica-Bold", 12)
-            p.drawString(1 * inch, height - 2.2 * inch, "Cliente:")
-            p.setFont("Helvetica", 12)
-            p.drawString(1 * inch, height - 2.4 * inch, f"Nombre: {cliente.nombre} {cliente.apellido}")
-            p.drawString(1 * inch, height - 2.6 * inch, f"Correo: {cliente.correo}")
-
-            # --- Encabezados de la tabla de detalles ---
-            p.setFont("Helvetica-Bold", 11)
-            p.drawString(1 * inch, height - 3.2 * inch, "Producto")
-            p.drawString(4 * inch, height - 3.2 * inch, "Cantidad")
-            p.drawString(5 * inch, height - 3.2 * inch, "P. Unitario")
-            p.drawString(6 * inch, height - 3.2 * inch, "Subtotal")
-            p.line(1 * inch, height - 3.3 * inch, width - 1 * inch, height - 3.3 * inch)
-
-            # --- Loop de Detalles ---
-            p.setFont("Helvetica", 10)
-            y = height - 3.6 * inch # Posición Y inicial
-            for item in detalles:
-                p.drawString(1 * inch, y, item.producto.nombre)
-                p.drawString(4.2 * inch, y, str(item.cantidad))
-                p.drawString(5.2 * inch, y, f"{item.precio_unitario:.2f} Bs")
-                p.drawString(6.2 * inch, y, f"{item.subtotal:.2f} Bs")
-                y -= 0.3 * inch # Moverse a la siguiente línea
-
-            # --- Total ---
-            p.line(1 * inch, y + 0.1 * inch, width - 1 * inch, y + 0.1 * inch)
-            p.setFont("Helvetica-Bold", 14)
-            p.drawString(5 * inch, y - 0.3 * inch, f"TOTAL: {venta.total:.2f} Bs")
-
-            # 4. Finalizar y enviar el PDF
-            p.showPage()
-            p.save()
+            datos = datos_comprobante(venta)
+
+            # 2. Si el cliente ya tiene esta versión, no enviamos nada
+            etag = quote_etag(hash_comprobante(datos))
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            # 3. Leer el PDF guardado (o generarlo una vez) y enviarlo en streaming
+            _, archivo = obtener_comprobante(datos)
+            if archivo is None:
+                response = Response(
+                    {'detail': 'El comprobante se está generando, reintente en unos segundos.'},
+                    status=status.HTTP_202_ACCEPTED
+                )
+                response['Retry-After'] = '2'
+                return response
+
+            response = FileResponse(
+                archivo,
+                as_attachment=True,
+                filename=f"nota_venta_{venta.id}.pdf",
+                content_type='application/pdf'
+            )
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
             return response
 
         except Exception as e:
             return Response({'error': f'Error al generar PDF: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'], url_path='comprobantes-zip', permission_classes=[IsAdminRole])
+    def exportar_comprobantes(self, request):
+        """
+        Descarga en un solo ZIP las Notas de Venta de todas las ventas que
+        cumplen los filtros de VentaFilter (ej. ?fecha_min=2025-10-01&fecha_max=2025-10-31).
+        Los PDFs se generan en paralelo y el ZIP se envía en streaming.
+        """
+        ventas = self.filter_queryset(self.get_queryset()).iterator(chunk_size=500)
+
+        response = StreamingHttpResponse(generar_zip(ventas), content_type='application/zip')
+        desde = request.query_params.get('fecha_min', 'inicio')
+        hasta = request.query_params.get('fecha_max', timezone.now().strftime('%Y-%m-%d'))
+        response['Content-Disposition'] = f'attachment; filename="notas_venta_{desde}_{hasta}.zip"'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='exportar', permission_classes=[IsAdminRole])
+    def exportar_ventas(self, request):
+        """
+        Exporta las ventas filtradas (VentaFilter, search, ordering) en streaming.
+        ?formato=csv (por defecto) o ?formato=ndjson
+        """
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return Response({'error': f"Formato no soportado. Use: {', '.join(FORMATOS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ventas = self.filter_queryset(Venta.objects.order_by('id'))
+        return respuesta_exportacion(ventas, COLUMNAS_VENTA, formato, 'ventas')
+
+    @action(detail=False, methods=['get'], url_path='exportar-detalles', permission_classes=[IsAdminRole])
+    def exportar_detalles(self, request):
+        """
+        Exporta las líneas (DetalleVenta) de las ventas filtradas en streaming.
+        ?formato=csv (por defecto) o ?formato=ndjson
+        """
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return Response({'error': f"Formato no soportado. Use: {', '.join(FORMATOS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ventas = self.filter_queryset(Venta.objects.all())
+        detalles = DetalleVenta.objects.filter(venta__in=ventas.order_by().values('id')).order_by('id')
+        return respuesta_exportacion(detalles, COLUMNAS_DETALLE, formato, 'detalles_venta')
+
     @action(detail=False, methods=['get'], url_path='analisis-tendencias')
     def analisis_tendencias(self, request):
         """
-        Devuelve el historial de ventas (Monto y Cantidad)
-        agrupado por mes durante los últimos 12 meses.
+        Devuelve el historial de ventas (Monto y Cantidad) agrupado por mes.
+        Lee ResumenVentasMensual (una fila por mes y canal), así que el costo no
+        depende de cuántas ventas haya.
+
+        Parámetros opcionales:
+        - desde / hasta (YYYY-MM): rango de meses (por defecto los últimos 12 meses).
+        - por_canal=true: separa cada mes por metodo_entrada y tipo_venta.
         """
         try:
-            # 1. Definir el rango de fechas (últimos 12 meses)
-            hace_un_ano = timezone.now() - timedelta(days=365)
-
-            # 2. Consultar usando el ORM de Django
-            tendencias = Venta.objects.filter(fecha_venta__gte=hace_un_ano) \
-                                    .annotate(mes=TruncMonth('fecha_venta')) \
-                                    .values('mes') \
+            # 1. Definir el rango de meses (por defecto últimos 12 meses)
+            hoy = timezone.localdate()
+            hasta = datetime.strptime(request.query_params['hasta'], '%Y-%m').date() \
+                if request.query_params.get('hasta') else hoy.replace(day=1)
+            if request.query_params.get('desde'):
+                desde = datetime.strptime(request.query_params['desde'], '%Y-%m').date()
+            else:
+                mes_inicio = hasta.year * 12 + hasta.month - 1 - 11
+                desde = hasta.replace(year=mes_inicio // 12, month=mes_inicio % 12 + 1)
+
+            por_canal = request.query_params.get('por_canal', '').lower() in ('1', 'true', 'si')
+            agrupar = ['mes', 'metodo_entrada', 'tipo_venta'] if por_canal else ['mes']
+
+            # 2. Consultar el resumen mensual
+            tendencias = ResumenVentasMensual.objects.filter(mes__gte=desde, mes__lte=hasta) \
+                                    .values(*agrupar) \
                                     .annotate(
-                                        cantidad_ventas=Count('id'), 
-                                        monto_total=Sum('total')
+                                        cantidad=Sum('cantidad_ventas'),
+                                        monto=Sum('monto_total')
                                     ) \
-                                    .order_by('mes')
+                                    .filter(cantidad__gt=0) \
+                                    .order_by(*agrupar)
 
             # 3. Formatear la salida
-            # Convertimos 'mes' (datetime) a un string "YYYY-MM"
-            data_formateada = [
-                {
+            # Convertimos 'mes' (date) a un string "YYYY-MM"
+            data_formateada = []
+            for item in tendencias:
+                fila = {
                     "mes": item['mes'].strftime('%Y-%m'),
-                    "cantidad_ventas": item['cantidad_ventas'],
-                    "monto_total": item['monto_total']
+                    "cantidad_ventas": item['cantidad'],
+                    "monto_total": item['monto']
                 }
-                for item in tendencias
-            ]
+                if por_canal:
+                    fila["metodo_entrada"] = item['metodo_entrada']
+                    fila["tipo_venta"] = item['tipo_venta']
+                data_formateada.append(fila)
 
             return Response(data_formateada, status=status.HTTP_200_OK)
 
+        except ValueError:
+            return Response({'error': "Formato de mes inválido. Use YYYY-MM."}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': f'Error al generar tendencias: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @idempotente
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         
         detalles_data = request.data.pop('detalles', [])
         if not detalles_data:
             return Response({"error": "La venta debe tener al menos un producto."}, status=status.HTTP_400_BAD_REQUEST)
-
-        total_calculado = 0
-        productos_a_actualizar = []
-        detalles_a_crear = []
+        if not isinstance(detalles_data, list):
+            return Response({"error": "'detalles' debe ser una lista."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            for item in detalles_data:
-                producto = Producto.objects.select_for_update().get(id=item['producto_id'])
-                cantidad_pedida = int(item['cantidad'])
+            # Validamos la cabecera y cada línea antes de bloquear filas de Producto
+            venta_serializer = VentaSerializer(data=request.data)
+            venta_serializer.is_valid(raise_exception=True)
 
-                if cantidad_pedida <= 0:
-                    raise ValidationError(f"La cantidad para {producto.nombre} debe ser mayor a 0.")
-                
-                if producto.stock_actual < cantidad_pedida:
-                    raise ValidationError(f"Stock insuficiente para '{producto.nombre}'. Disponible: {producto.stock_actual}, Pedido: {cantidad_pedida}")
+            pedidos = validar_pedidos([
+                (item.get('producto_id'), item.get('cantidad')) if isinstance(item, dict) else (None, None)
+                for item in detalles_data
+            ])
 
-                producto.stock_actual -= cantidad_pedida
-                productos_a_actualizar.append(producto)
+            # Un solo SELECT ... FOR UPDATE (ordenado por id) y un solo UPDATE
+            productos = reservar_stock(pedidos)
 
+            total_calculado = 0
+            detalles_a_crear = []
+            for producto_id, cantidad_pedida in pedidos:
+                producto = productos[producto_id]
                 subtotal = producto.precio_venta * cantidad_pedida
                 total_calculado += subtotal
                 
@@ -174,8 +256,6 @@ class VentaViewSet(viewsets.ModelViewSet):
                     )
                 )
 
-            venta_serializer = VentaSerializer(data=request.data)
-            venta_serializer.is_valid(raise_exception=True)
             # Guardamos la venta con el total calculado
             venta = venta_serializer.save(total=total_calculado)
 
@@ -183,22 +263,34 @@ class VentaViewSet(viewsets.ModelViewSet):
                 detalle.venta = venta
             
             DetalleVenta.objects.bulk_create(detalles_a_crear)
-            
-            Producto.objects.bulk_update(productos_a_actualizar, ['stock_actual'])
+
+            # El PDF se genera en segundo plano cuando la venta confirma
+            programar_comprobante(venta)
 
             read_serializer = VentaReadSerializer(venta)
             return Response(read_serializer.data, status=status.HTTP_201_CREATED)
 
         except Producto.DoesNotExist:
+            transaction.set_rollback(True)
             return Response({"error": "Uno de los productos no existe."}, status=status.HTTP_404_NOT_FOUND)
         except ValidationError as e:
+            transaction.set_rollback(True)
             return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
+            transaction.set_rollback(True)
             return Response({"error": f"Error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['get'])
     def mis_compras(self, request):
-        """Obtiene el historial de compras del cliente autenticado"""
+        """
+        Obtiene el historial de compras del cliente autenticado.
+        - Paginado con ?page= / ?page_size= (sin 'page' devuelve la lista completa).
+        - Acepta ?fields= / ?expand=detalles igual que el listado de ventas.
+        - Cacheado por cliente (se invalida con cada venta nueva o cuando cambia
+          un producto, porque los detalles muestran su nombre e imagen) y
+          servido con ETag: si el cliente envía If-None-Match y nada cambió,
+          responde 304.
+        """
         user = request.user
         
         if not hasattr(user, 'cliente'):
@@ -207,23 +299,36 @@ class VentaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Obtener ventas del cliente con sus detalles
-        ventas = Venta.objects.filter(
-            cliente=user.cliente
-        ).select_related(
-            'cliente__usuario'
-        ).prefetch_related(
-            'detalles__producto'
-        ).order_by('-fecha_venta')
-        
-        print(f"🔍 Ventas encontradas: {ventas.count()}")
-        for venta in ventas:
-            print(f"📦 Venta {venta.id}: {venta.detalles.count()} detalles")
-        
-        # Serializar las ventas
-        serializer = self.get_serializer(ventas, many=True)
-        print(f"📋 Datos serializados: {serializer.data}")
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        cliente_id = user.cliente.id
+        version = f"{version_historial(cliente_id)}:{version_tabla('productos')}"
+        huella = hashlib.md5(f"{cliente_id}:{version}:{request.get_full_path()}".encode('utf-8')).hexdigest()
+        etag = quote_etag(huella)
+
+        # 1. El cliente ya tiene esta versión: 304 sin consultar ventas
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        # 2. Buscar en caché o serializar una sola vez
+        clave_cache = f"mis_compras:{huella}"
+        data = cache.get(clave_cache)
+        if data is None:
+            ventas = self.get_queryset().filter(cliente_id=cliente_id)
+
+            if 'page' in request.query_params:
+                paginador = HistorialComprasPagination()
+                pagina = paginador.paginate_queryset(ventas, request, view=self)
+                data = paginador.get_paginated_response(self.get_serializer(pagina, many=True).data).data
+            else:
+                data = self.get_serializer(ventas, many=True).data
+
+            cache.set(clave_cache, data, settings.MIS_COMPRAS_CACHE_TTL)
+
+        response = Response(data, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 
 # --- ViewSet para DetalleVenta (Solo Lectura) ---
@@ -243,15 +348,48 @@ class CarritoViewSet(viewsets.ModelViewSet):
         # Solo mostrar carritos del usuario autenticado (si es cliente)
         user = self.request.user
         if hasattr(user, 'cliente'):
-            # Optimizar con select_related y prefetch_related
-            # CORREGIDO: 'detalles' es el related_name correcto
+            # Cliente en el JOIN y TODAS las líneas (con producto y categoría)
+            # en un solo prefetch: consultas fijas sin importar cuántas líneas haya
             return Carrito.objects.filter(cliente=user.cliente).select_related(
                 'cliente', 'cliente__usuario'
             ).prefetch_related(
-                'detalles__producto'
+                Prefetch('detalles', queryset=DetalleCarrito.objects.select_related('producto__categoria').order_by('id'))
             ).order_by('id')
         return Carrito.objects.none()
+
+    def _volcar_carrito(self, request):
+        # Con escritura diferida, los cambios pendientes se escriben antes de leer
+        if hasattr(request.user, 'cliente'):
+            obtener_store().volcar(request.user.cliente.id)
+
+    def list(self, request, *args, **kwargs):
+        self._volcar_carrito(request)
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        self._volcar_carrito(request)
+        return super().retrieve(request, *args, **kwargs)
     
+    @action(detail=False, methods=['post'])
+    def operaciones(self, request):
+        """
+        Aplica un lote de cambios al carrito activo en una sola petición
+        (ej. re-sincronizar tras usar la app sin conexión):
+        {"operaciones": [{"tipo": "agregar"|"fijar"|"quitar", "producto": id, "cantidad": n}, ...]}
+        Todas o ninguna; los productos se leen una sola vez. Devuelve el carrito resultante.
+        """
+        user = request.user
+        if not hasattr(user, 'cliente'):
+            return Response(
+                {'detail': 'Usuario no es un cliente'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = OperacionesCarritoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        carrito_id, detalles = obtener_store().aplicar(user.cliente.id, serializer.validated_data['operaciones'])
+        return Response({'carrito': carrito_id, 'detalles': detalles}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'])
     def vaciar_carrito(self, request):
         """Elimina todos los productos del carrito del usuario"""
@@ -263,26 +401,20 @@ class CarritoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Obtener el carrito del cliente
-        carrito = Carrito.objects.filter(cliente=user.cliente).first()
-        
-        if not carrito:
+        # Eliminar todos los detalles del carrito activo (a través del almacén de carritos)
+        if not obtener_store().vaciar(user.cliente.id):
             return Response(
                 {'detail': 'No hay carrito para vaciar'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Eliminar todos los detalles del carrito
-        DetalleCarrito.objects.filter(carrito=carrito).delete()
-        
-        # CORREGIDO: Eliminada la lógica de 'carrito.total'
-        
         return Response(
             {'detail': 'Carrito vaciado exitosamente'}, 
             status=status.HTTP_200_OK
         )
     
     @action(detail=False, methods=['post'])
+    @idempotente # Reintentos con 'Idempotency-Key' no duplican la venta
     @transaction.atomic # Añadido para seguridad
     def crear_venta_desde_carrito(self, request):
         """Crea una venta a partir del carrito actual del usuario"""
@@ -294,8 +426,14 @@ class CarritoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Obtener el carrito del cliente
-        carrito = Carrito.objects.filter(cliente=user.cliente).first()
+        # Escribir los cambios pendientes del carrito en memoria (si los hay)
+        store = obtener_store()
+        store.volcar(user.cliente.id)
+
+        # Obtener (y bloquear) el carrito del cliente
+        carrito = Carrito.objects.select_for_update().filter(
+            cliente=user.cliente, estado=Carrito.EstadoCarrito.ACTIVO
+        ).first()
         
         if not carrito:
             return Response(
@@ -303,44 +441,21 @@ class CarritoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Verificar que el carrito tenga productos
-        detalles_carrito = DetalleCarrito.objects.filter(carrito=carrito)
+        # Crea la venta, descuenta stock y vacía el carrito en consultas fijas
+        venta = convertir_carrito_en_venta(carrito, user.cliente)
+        if venta is not None:
+            cliente_id = user.cliente.id
+            transaction.on_commit(lambda: store.olvidar(cliente_id))
         
-        if not detalles_carrito.exists():
+        if venta is None:
             return Response(
                 {'detail': 'El carrito está vacío'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Calcular el total desde los detalles del carrito
-        total_calculado = sum(detalle.subtotal for detalle in detalles_carrito)
-        
-        # Crear la venta
-        venta = Venta.objects.create(
-            cliente=user.cliente,
-            total=total_calculado,
-            metodo_entrada='carrito',
-            tipo_venta='online'
-        )
-        
-        # Crear los detalles de la venta desde el carrito
-        for detalle_carrito in detalles_carrito:
-            DetalleVenta.objects.create(
-                venta=venta,
-                producto=detalle_carrito.producto,
-                cantidad=detalle_carrito.cantidad,
-                precio_unitario=detalle_carrito.precio_unitario,
-                subtotal=detalle_carrito.subtotal
-            )
-        
         # Recargar la venta con sus detalles y productos relacionados
         venta = Venta.objects.prefetch_related('detalles__producto').get(id=venta.id)
         
-        # Vaciar el carrito después de crear la venta
-        detalles_carrito.delete()
-        carrito.estado = 'Convertido'
-        carrito.save()
-        
         # Serializar la venta con VentaReadSerializer para incluir todos los detalles
         serializer = VentaReadSerializer(venta)
         
@@ -352,8 +467,9 @@ class CarritoViewSet(viewsets.ModelViewSet):
         if not hasattr(user, 'cliente'):
             raise ValidationError({'detail': 'El usuario no tiene un perfil de cliente asociado.'})
 
-        # Verificar si ya existe un carrito
-        carrito_existente = Carrito.objects.filter(cliente=user.cliente).first()
+        # Verificar si ya existe un carrito (con sus líneas precargadas)
+        self._volcar_carrito(request)
+        carrito_existente = self.get_queryset().first()
         if carrito_existente:
             # Si ya existe, devolvemos ese carrito como JSON (no error)
             serializer = self.get_serializer(carrito_existente)
@@ -368,7 +484,12 @@ class CarritoViewSet(viewsets.ModelViewSet):
 
 # ViewSet para DetalleCarrito
 class DetalleCarritoViewSet(viewsets.ModelViewSet):
-    # --- FUSIONADO: Tomado de 'HEAD' (compañero) pero MODIFICADO ---
+    """
+    Líneas del carrito del usuario. Las escrituras pasan por el almacén de
+    carritos (settings.CARRITO_STORE); con escritura diferida una línea
+    recién agregada tiene 'id' null hasta el siguiente volcado (leer el
+    carrito lo fuerza).
+    """
     serializer_class = DetalleCarritoSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -377,95 +498,70 @@ class DetalleCarritoViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if hasattr(user, 'cliente'):
             # CORREGIDO: 'carrito__cliente'
-            return DetalleCarrito.objects.filter(carrito__cliente=user.cliente).order_by('id')
+            return DetalleCarrito.objects.filter(carrito__cliente=user.cliente) \
+                .select_related('producto__categoria').order_by('id')
         return DetalleCarrito.objects.none()
-    
-    def perform_create(self, serializer):
-        # Obtener o crear carrito del cliente autenticado
-        user = self.request.user
-        
+
+    def _cliente_id(self):
         # Verificar que el usuario tenga un cliente asociado
-        if not hasattr(user, 'cliente'):
-            from rest_framework.exceptions import ValidationError
+        if not hasattr(self.request.user, 'cliente'):
             raise ValidationError({'detail': 'El usuario no tiene un perfil de cliente asociado.'})
-        
-        # Obtener o crear el carrito activo
-        carrito, created = Carrito.objects.get_or_create(
-            cliente=user.cliente,
-            estado='Activo',
-            defaults={'origen': 'FlutterApp'}
-        )
-        
-        # Obtener el producto y calcular precios
-        from apps.catalogo.models import Producto
-        producto_id = self.request.data.get('producto')
-        cantidad = int(self.request.data.get('cantidad', 1))
-        
-        producto = Producto.objects.get(id=producto_id)
-        
-        # Verificar si el producto ya existe en el carrito
-        detalle_existente = DetalleCarrito.objects.filter(
-            carrito=carrito,
-            producto=producto
-        ).first()
-        
-        if detalle_existente:
-            # Si ya existe, incrementar la cantidad
-            detalle_existente.cantidad += cantidad
-            
-            # Validar stock total en carrito
-            if producto.stock_actual < detalle_existente.cantidad:
-                raise ValidationError({'detail': f'Stock insuficiente. Ya tiene {detalle_existente.cantidad - cantidad} en el carrito. Disponible: {producto.stock_actual}'})
+        return self.request.user.cliente.id
 
-            detalle_existente.subtotal = detalle_existente.precio_unitario * detalle_existente.cantidad
-            detalle_existente.save()
-            
-            # CORREGIDO: Eliminada la lógica de 'carrito.total'
-            
-            # Retornar - no continuar con el save del serializer
-            return
-        
-        # Si no existe, crear uno nuevo
-        precio_unitario = producto.precio_venta
-        subtotal = precio_unitario * cantidad
-        
-        # Guardar el detalle del carrito
-        serializer.save(
-            carrito=carrito,
-            precio_unitario=precio_unitario,
-            subtotal=subtotal
-        )
-        
-        # CORREGIDO: Eliminada la lógica de 'carrito.total'
+    def _cantidad(self, defecto=None):
+        cantidad = self.request.data.get('cantidad', defecto)
+        if cantidad is None:
+            raise ValidationError({'detail': 'La cantidad es requerida'})
+        try:
+            return int(cantidad)
+        except (TypeError, ValueError):
+            raise ValidationError({'detail': 'La cantidad debe ser un número entero.'})
+
+    def list(self, request, *args, **kwargs):
+        obtener_store().volcar(self._cliente_id())
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        obtener_store().volcar(self._cliente_id())
+        return super().retrieve(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        """Agrega un producto al carrito activo (si ya está, suma la cantidad)."""
+        cliente_id = self._cliente_id()
+        producto_id = request.data.get('producto')
+        if not str(producto_id or '').isdigit():
+            raise ValidationError({'detail': 'El producto es requerido.'})
+        cantidad = self._cantidad(defecto=1)
+        if cantidad <= 0:
+            raise ValidationError({'detail': 'La cantidad debe ser mayor a 0.'})
+
+        try:
+            linea = obtener_store().agregar(cliente_id, int(producto_id), cantidad)
+        except Producto.DoesNotExist:
+            return Response({'detail': 'El producto no existe.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(linea, status=status.HTTP_201_CREATED)
+
+    def update(self, request, *args, **kwargs):
+        return self.partial_update(request, *args, **kwargs)
     
     def partial_update(self, request, *args, **kwargs):
         """Actualizar la cantidad de un detalle del carrito"""
-        detalle = self.get_object()
-        nueva_cantidad = request.data.get('cantidad')
-        
-        if nueva_cantidad is None:
-            from rest_framework.exceptions import ValidationError
-            raise ValidationError({'detail': 'La cantidad es requerida'})
-        
-        nueva_cantidad = int(nueva_cantidad)
-        
-        if nueva_cantidad <= 0:
-            # Si la cantidad es 0 o negativa, eliminar el detalle
-            detalle.delete()
-            
-            # CORREGIDO: Eliminada la lógica de 'carrito.total'
-            
+        cliente_id = self._cliente_id()
+        store = obtener_store()
+        producto_id = store.producto_de_linea(cliente_id, kwargs['pk'])
+        nueva_cantidad = self._cantidad()
+
+        linea = store.fijar_cantidad(cliente_id, producto_id, nueva_cantidad)
+        if linea is None:
+            # Si la cantidad es 0 o negativa, se elimina el detalle
             return Response({'detail': 'Producto eliminado del carrito'}, status=status.HTTP_204_NO_CONTENT)
-        
-        # Actualizar cantidad y subtotal
-        detalle.cantidad = nueva_cantidad
-        detalle.subtotal = detalle.precio_unitario * nueva_cantidad
-        detalle.save()
-        
-        # CORREGIDO: Eliminada la lógica de 'carrito.total'
-        
-        serializer = self.get_serializer(detalle)
-        return Response(serializer.data)
+        return Response(linea)
+
+    def destroy(self, request, *args, **kwargs):
+        cliente_id = self._cliente_id()
+        store = obtener_store()
+        store.quitar(cliente_id, store.producto_de_linea(cliente_id, kwargs['pk']))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 
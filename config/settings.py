@@ -15,6 +15,7 @@ from datetime import timedelta
 from decouple import config
 import os
 import cloudinary
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
 
     # DRF + CORS
@@ -87,6 +89,14 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'idempotency-key',
+    'if-none-match',
+    'if-modified-since',
+)
+# Validadores de los GET condicionales, legibles desde el frontend
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
@@ -147,6 +157,38 @@ DATABASES = {
 
 
 
+# Caché: Redis si se define REDIS_URL, si no memoria local del proceso
+REDIS_URL = config('REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smartsales365',
+    }
+}
+
+# Segundos que se guarda en caché cada página de 'mis_compras'
+MIS_COMPRAS_CACHE_TTL = config('MIS_COMPRAS_CACHE_TTL', default=3600, cast=int)
+
+# Segundos que se guarda cada página/búsqueda del catálogo (se invalida por versión)
+CATALOGO_CACHE_TTL = config('CATALOGO_CACHE_TTL', default=3600, cast=int)
+
+# Almacén de carritos (ver apps/venta_transacciones/carritos.py). Por defecto,
+# escritura directa en la BD. La escritura diferida es opcional y explícita:
+# CARRITO_STORE=apps.venta_transacciones.carritos.CacheCarritoStore (requiere
+# REDIS_URL y correr 'volcar_carritos' periódicamente). Con ella una línea
+# nueva devuelve 'id' null hasta el siguiente volcado.
+CARRITO_STORE = config('CARRITO_STORE', default='apps.venta_transacciones.carritos.BaseDatosCarritoStore')
+# Segundos que un carrito (y su entrada en la cola de volcado) se guarda en la caché
+CARRITO_STORE_TTL = config('CARRITO_STORE_TTL', default=7 * 24 * 3600, cast=int)
+# 'barrer_carritos': horas sin cambios para marcar un carrito activo como
+# abandonado y días que se conservan los carritos abandonados/convertidos
+CARRITO_ABANDONO_HORAS = config('CARRITO_ABANDONO_HORAS', default=72, cast=int)
+CARRITO_RETENCION_DIAS = config('CARRITO_RETENCION_DIAS', default=90, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -224,6 +266,13 @@ SPECTACULAR_SETTINGS = {
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 
+# Tiempo (segundos) que se guarda la respuesta de un 'Idempotency-Key'
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+
+# Comprobantes PDF: procesos del pool y generación automática tras cada venta
+COMPROBANTES_WORKERS = config('COMPROBANTES_WORKERS', default=2, cast=int)
+COMPROBANTES_PRECALCULAR = config('COMPROBANTES_PRECALCULAR', default=True, cast=bool)
+
 
 # ============================================================
 # CONFIGURACIÓN FIREBASE ADMIN SDK